@@ -2,28 +2,46 @@
 """
 Professional Audio Analysis using librosa
 Industry-standard BPM and Key detection
+
+Usage:
+  analyze_audio.py <audio_file> [--structure] [--key-segments] [--profile]
+  analyze_audio.py --batch   (JSON job per stdin line:
+      {"file": ..., "structure": false, "key_segments": false};
+      one result line per job, tagged with "job" - librosa is imported once)
 """
 
 import sys
 import json
 import os
+import time
 
 # Suppress all warnings
 import warnings
 warnings.filterwarnings('ignore')
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
-import librosa
 import numpy as np
 
-def detect_bpm_and_key(audio_file):
+# Shared analysis modules live alongside the Electron-bundled Python scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python'))
+
+from audio_decode import load_audio
+from startup import load_librosa, pop_profile_flag, profile_report
+from tempo_octave import tempo_histogram, histogram_peak, correct_octave
+
+def detect_bpm_and_key(audio_file, structure=False, key_segments=False):
     """
     Analyze audio file for BPM and key using librosa
     Returns JSON with results
+    structure=True adds phrase boundaries and cue-in/cue-out points
+    key_segments=True adds windowed key tracking for modulating songs
     """
     try:
-        # Load audio file with basic resampling to avoid scipy issues
-        y, sr = librosa.load(audio_file, sr=22050, mono=True)
+        # Imported on first use, with numba's JIT cache in app data (see startup.py)
+        librosa = load_librosa()
+        
+        # Stream-decode straight to 22050 Hz mono (soxr, block by block)
+        y, sr = load_audio(audio_file, sr=22050, mono=True)
         
         # BPM Detection with multi-octave analysis
         onset_env = librosa.onset.onset_strength(y=y, sr=sr, aggregate=np.median)
@@ -42,55 +60,12 @@ def detect_bpm_and_key(audio_file):
         # Get the most common tempo across frames
         if len(tempos.shape) > 0 and tempos.shape[0] > 1:
             # Multiple frames - use histogram to find most common
-            hist, bin_edges = np.histogram(tempos, bins=50, range=(40, 240))
-            most_common_bin = np.argmax(hist)
-            primary_tempo = (bin_edges[most_common_bin] + bin_edges[most_common_bin + 1]) / 2
+            primary_tempo = histogram_peak(tempo_histogram(tempos))
         else:
             primary_tempo = float(tempos[0]) if len(tempos) > 0 else float(tempos)
         
         # Multi-octave candidate selection with smart genre-aware scoring
-        candidates = []
-        for multiplier in [0.25, 0.5, 1.0, 2.0, 4.0]:
-            tempo = primary_tempo * multiplier
-            if 40 <= tempo <= 240:
-                candidates.append(tempo)
-        
-        # Score each candidate based on musical likelihood
-        best_tempo = primary_tempo
-        best_score = -1
-        
-        for candidate in candidates:
-            # Base score: prefer the primary detected tempo
-            score = 10.0 if abs(candidate - primary_tempo) < 5 else 1.0
-            
-            # Apply genre-expected tempo range multipliers
-            # These ranges are based on actual music analysis, not arbitrary
-            if 80 <= candidate <= 140:
-                score *= 2.0  # Pop/rock/hip-hop sweet spot (60% of music)
-            elif 140 < candidate <= 180:
-                score *= 1.8  # Fast rock/electronic/dance
-            elif 180 < candidate <= 240:
-                score *= 1.5  # Metal/punk/drum & bass - still plausible
-            elif 60 <= candidate < 80:
-                score *= 1.6  # Reggae/ballads/slow country
-            elif 40 <= candidate < 60:
-                score *= 0.8  # Very slow (rare but valid)
-            
-            # For very fast detections, boost the half-time candidate
-            # This helps with metal where librosa often detects 2x
-            if primary_tempo > 200 and candidate == primary_tempo / 2:
-                score *= 1.4  # Boost half-time for extreme tempos
-            
-            # For very slow detections, boost the double-time candidate
-            # This helps with waltz/ballads where librosa undershoots
-            if primary_tempo < 70 and candidate == primary_tempo * 2:
-                score *= 1.3
-                
-            if score > best_score:
-                best_score = score
-                best_tempo = candidate
-        
-        bpm = float(best_tempo)
+        bpm = float(correct_octave(primary_tempo))
         
         # Key Detection using Constant-Q chromagram (better frequency resolution)
         # CQT (Constant-Q Transform) is better than STFT for music key detection
@@ -161,7 +136,7 @@ def detect_bpm_and_key(audio_file):
         onset_std = np.std(onset_env)
         bpm_confidence = min(1.0, onset_std / 10.0) if onset_std > 0 else 0.5
         
-        return {
+        result = {
             'bpm': int(round(bpm)),
             'bpmConfidence': float(min(1.0, max(0.0, bpm_confidence))),
             'key': str(key),
@@ -172,6 +147,25 @@ def detect_bpm_and_key(audio_file):
             }
         }
         
+        if structure:
+            # Phrase/cue detection reuses the onset envelope and chromagram above
+            from structure_analysis import analyze_structure
+            result.update(analyze_structure(
+                chromagram,
+                onset_env,
+                sr,
+                bpm=bpm,
+                onset_hop_length=512,
+                chroma_hop_length=2048
+            ))
+        
+        if key_segments:
+            # Windowed key path over the same CQT chromagram
+            from key_tracking import track_keys
+            result.update(track_keys(chromagram, sr, hop_length=2048))
+        
+        return result
+        
     except Exception as e:
         return {
             'error': str(e),
@@ -180,11 +174,45 @@ def detect_bpm_and_key(audio_file):
             'mode': None
         }
 
+def run_batch():
+    """Analyze one JSON job per stdin line in this process"""
+    job = 0
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job += 1
+        try:
+            config = json.loads(line)
+            result = detect_bpm_and_key(
+                config['file'],
+                structure=config.get('structure', False),
+                key_segments=config.get('key_segments', False)
+            )
+        except Exception as e:
+            result = {'error': str(e)}
+        result['job'] = job
+        print(json.dumps(result))
+        sys.stdout.flush()
+
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
+    argv = sys.argv[1:]
+    if argv[:1] == ['--batch']:
+        run_batch()
+        sys.exit(0)
+    profile = pop_profile_flag(argv)
+    if len(argv) < 1:
         print(json.dumps({'error': 'No audio file specified'}))
         sys.exit(1)
     
-    audio_file = sys.argv[1]
-    result = detect_bpm_and_key(audio_file)
+    audio_file = argv[0]
+    options = argv[1:]
+    started = time.perf_counter()
+    result = detect_bpm_and_key(
+        audio_file,
+        structure='--structure' in options,
+        key_segments='--key-segments' in options
+    )
+    if profile:
+        # analysisSeconds includes the lazy librosa import listed under imports
+        result['profile'] = profile_report(analysisSeconds=round(time.perf_counter() - started, 3))
     print(json.dumps(result))
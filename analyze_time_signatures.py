@@ -10,110 +10,163 @@ import os
 import warnings
 warnings.filterwarnings('ignore')
 
-import librosa
 import numpy as np
 
+# Shared analysis modules live alongside the Electron-bundled Python scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python'))
+
+from audio_decode import load_audio
+from startup import load_librosa
+from batch_analysis import BatchRunner, FileBatcher, runner_options
+from batch_features import extract_features
+from beat_grid import grid_fields, downbeat_strengths
+from media_probe import find_audio_files, plan_work, format_eta
+
+# Seconds of each file analyzed
+ANALYSIS_SECONDS = 60
+
+# Files per worker task; features are extracted batch-wide
+DEFAULT_BATCH_SIZE = 4
+
 def detect_time_signature(audio_file):
     """
     Detect time signature (4/4, 3/4, 6/8, etc.)
     """
     try:
+        librosa = load_librosa()
+        
         # Load audio
-        y, sr = librosa.load(audio_file, sr=22050, mono=True, duration=60)  # First 60 seconds
+        y, sr = load_audio(audio_file, sr=22050, mono=True, duration=ANALYSIS_SECONDS)
         
         # Get onset strength
         onset_env = librosa.onset.onset_strength(y=y, sr=sr, aggregate=np.median)
+        return score_time_signature(audio_file, y, sr, onset_env)
         
-        # Get tempogram for meter analysis
-        tempogram = librosa.feature.tempogram(onset_envelope=onset_env, sr=sr)
+    except Exception as e:
+        return {
+            'file': os.path.basename(audio_file),
+            'error': str(e)
+        }
+
+def detect_time_signatures(audio_files):
+    """
+    Batched detect_time_signature: one STFT/onset pass over the stacked
+    excerpts of all files (see python/batch_features.py), then per-file scoring
+    """
+    results = []
+    features = extract_features(audio_files, ANALYSIS_SECONDS, aggregates=('median',))
+    for audio_file, track in zip(audio_files, features):
+        try:
+            if 'error' in track:
+                raise RuntimeError(track['error'])
+            results.append(score_time_signature(audio_file, track['y'], track['sr'], track['onset']['median']))
+        except Exception as e:
+            results.append({'file': os.path.basename(audio_file), 'error': str(e)})
+    return results
+
+def score_time_signature(audio_file, y, sr, onset_env):
+    """Meter scoring from the excerpt and its (median) onset envelope"""
+    librosa = load_librosa()
+    
+    # Detect tempo
+    tempo = librosa.feature.tempo(onset_envelope=onset_env, sr=sr)[0]
+    
+    # Beat tracking (beat_track's own onset envelope is this median one)
+    tempo_full, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, units='time')
+    
+    # Analyze beat intervals
+    if len(beats) > 4:
+        beat_intervals = np.diff(beats)
         
-        # Detect tempo
-        tempo = librosa.feature.tempo(onset_envelope=onset_env, sr=sr)[0]
+        # Check for regular patterns
+        interval_var = np.std(beat_intervals) / (np.mean(beat_intervals) + 1e-6)
         
-        # Beat tracking
-        tempo_full, beats = librosa.beat.beat_track(y=y, sr=sr, units='time')
+        # Estimate meter by analyzing strong/weak beat patterns
+        # Look at energy at beat positions
+        beat_strengths = []
+        for beat_time in beats[:min(len(beats), 32)]:
+            beat_sample = int(beat_time * sr)
+            if beat_sample < len(y) - 2048:
+                strength = np.mean(np.abs(y[beat_sample:beat_sample + 2048]))
+                beat_strengths.append(strength)
         
-        # Analyze beat intervals
-        if len(beats) > 4:
-            beat_intervals = np.diff(beats)
+        # Check for 4-beat pattern (strong-weak-medium-weak)
+        if len(beat_strengths) >= 8:
+            # Group into measures and check if every 4th beat is strongest
+            four_pattern = 0
+            three_pattern = 0
             
-            # Check for regular patterns
-            interval_var = np.std(beat_intervals) / (np.mean(beat_intervals) + 1e-6)
+            for i in range(0, len(beat_strengths) - 4, 4):
+                group = beat_strengths[i:i+4]
+                if group[0] == max(group):
+                    four_pattern += 1
             
-            # Estimate meter by analyzing strong/weak beat patterns
-            # Look at energy at beat positions
-            beat_strengths = []
-            for beat_time in beats[:min(len(beats), 32)]:
-                beat_sample = int(beat_time * sr)
-                if beat_sample < len(y) - 2048:
-                    strength = np.mean(np.abs(y[beat_sample:beat_sample + 2048]))
-                    beat_strengths.append(strength)
+            for i in range(0, len(beat_strengths) - 3, 3):
+                group = beat_strengths[i:i+3]
+                if group[0] == max(group):
+                    three_pattern += 1
             
-            # Check for 4-beat pattern (strong-weak-medium-weak)
-            if len(beat_strengths) >= 8:
-                # Group into measures and check if every 4th beat is strongest
-                four_pattern = 0
-                three_pattern = 0
-                
-                for i in range(0, len(beat_strengths) - 4, 4):
-                    group = beat_strengths[i:i+4]
-                    if group[0] == max(group):
-                        four_pattern += 1
-                
-                for i in range(0, len(beat_strengths) - 3, 3):
-                    group = beat_strengths[i:i+3]
-                    if group[0] == max(group):
-                        three_pattern += 1
-                
-                # Determine most likely time signature
-                if four_pattern > three_pattern * 1.2:
-                    time_sig = "4/4"
-                    confidence = min(1.0, four_pattern / 8)
-                elif three_pattern > four_pattern * 1.2:
-                    time_sig = "3/4"
-                    confidence = min(1.0, three_pattern / 8)
-                else:
-                    # Ambiguous - default to 4/4 (most common)
-                    time_sig = "4/4"
-                    confidence = 0.5
+            # Determine most likely time signature
+            if four_pattern > three_pattern * 1.2:
+                time_sig = "4/4"
+                confidence = min(1.0, four_pattern / 8)
+            elif three_pattern > four_pattern * 1.2:
+                time_sig = "3/4"
+                confidence = min(1.0, three_pattern / 8)
             else:
-                time_sig = "4/4"  # Default
+                # Ambiguous - default to 4/4 (most common)
+                time_sig = "4/4"
                 confidence = 0.5
         else:
-            time_sig = "4/4"
-            confidence = 0.3
-        
-        return {
-            'file': os.path.basename(audio_file),
-            'timeSignature': time_sig,
-            'confidence': float(confidence),
-            'bpm': float(tempo),
-            'beatCount': len(beats)
-        }
-        
-    except Exception as e:
-        return {
-            'file': os.path.basename(audio_file),
-            'error': str(e)
-        }
+            time_sig = "4/4"  # Default
+            confidence = 0.5
+    else:
+        time_sig = "4/4"
+        confidence = 0.3
+    
+    result = {
+        'file': os.path.basename(audio_file),
+        'timeSignature': time_sig,
+        'confidence': float(confidence),
+        'bpm': float(tempo),
+        'beatCount': len(beats)
+    }
+    if len(beats) > 4:
+        # Beat grid over the analyzed window; the downbeat is the strongest beat phase
+        result.update(grid_fields(beats, time_sig, downbeat_strengths(y, sr, beats)))
+    return result
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
+    argv = sys.argv[1:]
+    options = runner_options(argv)
+    batch_size = DEFAULT_BATCH_SIZE
+    if '--batch-size' in argv:
+        position = argv.index('--batch-size')
+        batch_size = int(argv[position + 1])
+        del argv[position:position + 2]
+    if not argv:
         print(json.dumps({'error': 'No folder specified'}))
         sys.exit(1)
     
-    folder = sys.argv[1]
+    folder = argv[0]
     results = []
     
-    # Scan for audio files
-    audio_extensions = ('.mp3', '.wav', '.flac', '.m4a', '.ogg', '.wma')
+    # Files are analyzed in pooled workers; a hung or oversized file fails on its own.
+    # Tasks are batches (--batch-size); --timeout is per file, scaled by the batch size
+    runner = BatchRunner('analyze_time_signatures:detect_time_signatures',
+                         sys_paths=[os.path.dirname(os.path.abspath(__file__))], **options)
+    batcher = FileBatcher(runner, batch_size)
+    
+    # Scan for audio files; header probe rejects unreadable ones, the rest run longest-first
+    plan = plan_work(find_audio_files(folder), workers=runner.workers, window=ANALYSIS_SECONDS)
+    results.extend(plan.rejections())
+    for info in plan.files:
+        batcher.add(info['filePath'])
     
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            if file.lower().endswith(audio_extensions):
-                file_path = os.path.join(root, file)
-                print(f"Analyzing: {file}", file=sys.stderr)
-                result = detect_time_signature(file_path)
-                results.append(result)
+    plan.start()
+    for file_path, result in batcher.results():
+        plan.completed(file_path)
+        print(f"Analyzed: {os.path.basename(file_path)} (ETA {format_eta(plan.eta())})", file=sys.stderr)
+        results.append(result)
     
     print(json.dumps(results, indent=2))
@@ -4,134 +4,246 @@ import json
 import warnings
 warnings.filterwarnings('ignore')
 
-import librosa
 import numpy as np
 
+# Shared analysis modules live alongside the Electron-bundled Python scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python'))
+
+from audio_decode import load_audio
+from startup import load_librosa
+from batch_analysis import BatchRunner, FileBatcher, runner_options
+from batch_features import extract_features
+from beat_grid import grid_fields, downbeat_strengths
+from media_probe import find_audio_files, plan_work, format_eta
+from results_store import ResultsStore
+
+# Columnar results (see python/results_store.py; summarize_time_sigs.py reads it)
+RESULTS_STORE = 'time_sig_results'
+
+# Only the start of each file is analyzed, to avoid hanging on long files
+ANALYSIS_SECONDS = 30
+
+HOP_LENGTH = 512
+
+# Files per worker task when scanning; features are extracted batch-wide
+DEFAULT_BATCH_SIZE = 8
+
 def detect_time_signature(audio_file):
     """Detect time signature with high accuracy"""
     try:
-        # Load only first 30 seconds to avoid hanging on long files
-        y, sr = librosa.load(audio_file, sr=22050, mono=True, duration=30)
-        
-        # Use tempogram instead of beat_track to avoid scipy issues
-        hop_length = 512
-        oenv = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
-        tempogram = librosa.feature.tempogram(onset_envelope=oenv, sr=sr, hop_length=hop_length)
-        tempo = librosa.beat.tempo(onset_envelope=oenv, sr=sr, hop_length=hop_length)[0]
-        
-        # Simple onset detection for beats
-        onset_frames = librosa.onset.onset_detect(onset_envelope=oenv, sr=sr, hop_length=hop_length)
-        beats = librosa.frames_to_time(onset_frames, sr=sr, hop_length=hop_length)
-        
-        if len(beats) < 8:
-            return {'file': os.path.basename(audio_file), 'timeSignature': '4/4', 'confidence': 0.3, 'reason': 'insufficient_beats'}
-        
-        # Calculate beat intervals
-        beat_intervals = np.diff(beats)
-        interval_consistency = 1.0 - (np.std(beat_intervals) / (np.mean(beat_intervals) + 1e-6))
-        
-        # Analyze energy at each beat
-        beat_energies = []
-        for beat_time in beats[:min(len(beats), 48)]:
-            sample_idx = int(beat_time * sr)
-            if sample_idx < len(y) - 4096:
-                energy = np.sum(y[sample_idx:sample_idx + 4096] ** 2)
-                beat_energies.append(energy)
+        librosa = load_librosa()
         
-        if len(beat_energies) < 8:
-            return {'file': os.path.basename(audio_file), 'timeSignature': '4/4', 'confidence': 0.3, 'reason': 'insufficient_data'}
-        
-        # Normalize energies
-        beat_energies = np.array(beat_energies)
-        beat_energies = (beat_energies - np.min(beat_energies)) / (np.max(beat_energies) - np.min(beat_energies) + 1e-6)
-        
-        # Test for 4/4: every 4th beat should be strongest
-        score_4 = 0
-        for i in range(0, len(beat_energies) - 4, 4):
-            if beat_energies[i] == np.max(beat_energies[i:i+4]):
-                score_4 += 1
-        
-        # Test for 3/4: every 3rd beat should be strongest
-        score_3 = 0
-        for i in range(0, len(beat_energies) - 3, 3):
-            if beat_energies[i] == np.max(beat_energies[i:i+3]):
-                score_3 += 1
-        
-        # Test for 6/8: groups of 6 with strong on 1 and 4
-        score_6 = 0
-        for i in range(0, len(beat_energies) - 6, 6):
-            if beat_energies[i] > np.mean(beat_energies[i:i+6]) and beat_energies[i+3] > np.mean(beat_energies[i:i+6]):
-                score_6 += 1
-        
-        # Normalize scores
-        max_measures_4 = max(1, (len(beat_energies) - 4) // 4)
-        max_measures_3 = max(1, (len(beat_energies) - 3) // 3)
-        max_measures_6 = max(1, (len(beat_energies) - 6) // 6)
-        
-        score_4_norm = score_4 / max_measures_4
-        score_3_norm = score_3 / max_measures_3
-        score_6_norm = score_6 / max_measures_6
+        # Load only first 30 seconds to avoid hanging on long files
+        y, sr = load_audio(audio_file, sr=22050, mono=True, duration=ANALYSIS_SECONDS)
         
-        # Determine time signature
-        if score_4_norm > score_3_norm * 1.3 and score_4_norm > score_6_norm * 1.2:
-            return {
-                'file': os.path.basename(audio_file),
-                'timeSignature': '4/4',
-                'confidence': float(min(1.0, score_4_norm * interval_consistency)),
-                'bpm': float(tempo),
-                'scores': {'4/4': float(score_4_norm), '3/4': float(score_3_norm), '6/8': float(score_6_norm)}
-            }
-        elif score_3_norm > score_4_norm * 1.3 and score_3_norm > score_6_norm * 1.2:
-            return {
-                'file': os.path.basename(audio_file),
-                'timeSignature': '3/4',
-                'confidence': float(min(1.0, score_3_norm * interval_consistency)),
-                'bpm': float(tempo),
-                'scores': {'4/4': float(score_4_norm), '3/4': float(score_3_norm), '6/8': float(score_6_norm)}
-            }
-        elif score_6_norm > score_4_norm * 1.2 and score_6_norm > score_3_norm * 1.2:
-            return {
-                'file': os.path.basename(audio_file),
-                'timeSignature': '6/8',
-                'confidence': float(min(1.0, score_6_norm * interval_consistency)),
-                'bpm': float(tempo),
-                'scores': {'4/4': float(score_4_norm), '3/4': float(score_3_norm), '6/8': float(score_6_norm)}
-            }
-        else:
-            # Ambiguous - default to 4/4
-            return {
-                'file': os.path.basename(audio_file),
-                'timeSignature': '4/4',
-                'confidence': 0.5,
-                'bpm': float(tempo),
-                'scores': {'4/4': float(score_4_norm), '3/4': float(score_3_norm), '6/8': float(score_6_norm)},
-                'reason': 'ambiguous'
-            }
+        oenv = librosa.onset.onset_strength(y=y, sr=sr, hop_length=HOP_LENGTH)
+        return score_time_signature(audio_file, y, sr, oenv)
             
     except Exception as e:
         return {'file': os.path.basename(audio_file), 'error': str(e)}
 
+def detect_time_signatures(audio_files):
+    """
+    Batched detect_time_signature: one STFT/onset pass over the stacked
+    excerpts of all files (see python/batch_features.py), then per-file scoring
+    """
+    results = []
+    for audio_file, features in zip(audio_files, extract_features(audio_files, ANALYSIS_SECONDS)):
+        try:
+            if 'error' in features:
+                raise RuntimeError(features['error'])
+            results.append(score_time_signature(audio_file, features['y'], features['sr'], features['onset']['mean']))
+        except Exception as e:
+            results.append({'file': os.path.basename(audio_file), 'error': str(e)})
+    return results
+
+def score_time_signature(audio_file, y, sr, oenv):
+    """Meter scoring from the excerpt and its onset envelope"""
+    librosa = load_librosa()
+    hop_length = HOP_LENGTH
+    # Use tempogram instead of beat_track to avoid scipy issues
+    tempo = librosa.beat.tempo(onset_envelope=oenv, sr=sr, hop_length=hop_length)[0]
+    
+    # Simple onset detection for beats
+    onset_frames = librosa.onset.onset_detect(onset_envelope=oenv, sr=sr, hop_length=hop_length)
+    beats = librosa.frames_to_time(onset_frames, sr=sr, hop_length=hop_length)
+    
+    if len(beats) < 8:
+        return {'file': os.path.basename(audio_file), 'timeSignature': '4/4', 'confidence': 0.3, 'reason': 'insufficient_beats'}
+    
+    # Calculate beat intervals
+    beat_intervals = np.diff(beats)
+    interval_consistency = 1.0 - (np.std(beat_intervals) / (np.mean(beat_intervals) + 1e-6))
+    
+    # Analyze energy at each beat
+    beat_energies = []
+    for beat_time in beats[:min(len(beats), 48)]:
+        sample_idx = int(beat_time * sr)
+        if sample_idx < len(y) - 4096:
+            energy = np.sum(y[sample_idx:sample_idx + 4096] ** 2)
+            beat_energies.append(energy)
+    
+    if len(beat_energies) < 8:
+        return {'file': os.path.basename(audio_file), 'timeSignature': '4/4', 'confidence': 0.3, 'reason': 'insufficient_data'}
+    
+    # Normalize energies
+    beat_energies = np.array(beat_energies)
+    beat_energies = (beat_energies - np.min(beat_energies)) / (np.max(beat_energies) - np.min(beat_energies) + 1e-6)
+    
+    # Test for 4/4: every 4th beat should be strongest
+    score_4 = 0
+    for i in range(0, len(beat_energies) - 4, 4):
+        if beat_energies[i] == np.max(beat_energies[i:i+4]):
+            score_4 += 1
+    
+    # Test for 3/4: every 3rd beat should be strongest
+    score_3 = 0
+    for i in range(0, len(beat_energies) - 3, 3):
+        if beat_energies[i] == np.max(beat_energies[i:i+3]):
+            score_3 += 1
+    
+    # Test for 6/8: groups of 6 with strong on 1 and 4
+    score_6 = 0
+    for i in range(0, len(beat_energies) - 6, 6):
+        if beat_energies[i] > np.mean(beat_energies[i:i+6]) and beat_energies[i+3] > np.mean(beat_energies[i:i+6]):
+            score_6 += 1
+    
+    # Normalize scores
+    max_measures_4 = max(1, (len(beat_energies) - 4) // 4)
+    max_measures_3 = max(1, (len(beat_energies) - 3) // 3)
+    max_measures_6 = max(1, (len(beat_energies) - 6) // 6)
+    
+    score_4_norm = score_4 / max_measures_4
+    score_3_norm = score_3 / max_measures_3
+    score_6_norm = score_6 / max_measures_6
+    
+    # Determine time signature
+    if score_4_norm > score_3_norm * 1.3 and score_4_norm > score_6_norm * 1.2:
+        result = {
+            'file': os.path.basename(audio_file),
+            'timeSignature': '4/4',
+            'confidence': float(min(1.0, score_4_norm * interval_consistency)),
+            'bpm': float(tempo),
+            'scores': {'4/4': float(score_4_norm), '3/4': float(score_3_norm), '6/8': float(score_6_norm)}
+        }
+    elif score_3_norm > score_4_norm * 1.3 and score_3_norm > score_6_norm * 1.2:
+        result = {
+            'file': os.path.basename(audio_file),
+            'timeSignature': '3/4',
+            'confidence': float(min(1.0, score_3_norm * interval_consistency)),
+            'bpm': float(tempo),
+            'scores': {'4/4': float(score_4_norm), '3/4': float(score_3_norm), '6/8': float(score_6_norm)}
+        }
+    elif score_6_norm > score_4_norm * 1.2 and score_6_norm > score_3_norm * 1.2:
+        result = {
+            'file': os.path.basename(audio_file),
+            'timeSignature': '6/8',
+            'confidence': float(min(1.0, score_6_norm * interval_consistency)),
+            'bpm': float(tempo),
+            'scores': {'4/4': float(score_4_norm), '3/4': float(score_3_norm), '6/8': float(score_6_norm)}
+        }
+    else:
+        # Ambiguous - default to 4/4
+        result = {
+            'file': os.path.basename(audio_file),
+            'timeSignature': '4/4',
+            'confidence': 0.5,
+            'bpm': float(tempo),
+            'scores': {'4/4': float(score_4_norm), '3/4': float(score_3_norm), '6/8': float(score_6_norm)},
+            'reason': 'ambiguous'
+        }
+    
+    # Beat grid over the excerpt; the downbeat is the strongest beat phase
+    result.update(grid_fields(beats, result['timeSignature'], downbeat_strengths(y, sr, beats)))
+    return result
+
 if __name__ == '__main__':
-    folder = sys.argv[1] if len(sys.argv) > 1 else '.'
+    argv = sys.argv[1:]
+    options = runner_options(argv)
+    batch_size = DEFAULT_BATCH_SIZE
+    if '--batch-size' in argv:
+        position = argv.index('--batch-size')
+        batch_size = int(argv[position + 1])
+        del argv[position:position + 2]
+    args = [a for a in argv if not a.startswith('--')]
+    folder = args[0] if args else '.'
     results = []
     count = 0
     
-    extensions = ('.mp3', '.wav', '.flac', '.m4a', '.ogg', '.wma')
+    # --dedupe: fingerprint each file and reuse results for confirmed duplicates
+    index = None
+    if '--dedupe' in argv:
+        from fingerprint_index import FingerprintIndex, fingerprint_file
+        index = FingerprintIndex()
+    
+    # Analysis runs in pooled workers with time/memory limits; each task is a
+    # batch of files whose features are extracted together (--batch-size).
+    # --timeout is per file; a batch gets it times its file count
+    runner = BatchRunner('analyze_time_sigs:detect_time_signatures',
+                         sys_paths=[os.path.dirname(os.path.abspath(__file__))], **options)
+    batcher = FileBatcher(runner, batch_size)
+    waiting = {}  # analyzed path -> duplicates found in this scan waiting for its result
+    fingerprinted = set()
+    
+    # Header probe: unreadable files are rejected up front, the rest run longest-first
+    plan = plan_work(find_audio_files(folder), workers=runner.workers, window=ANALYSIS_SECONDS)
+    results.extend(plan.rejections())
+    store = ResultsStore.create(RESULTS_STORE, planned=len(plan.files) + len(plan.rejected),
+                                folder=os.path.abspath(folder))
+    store.append(plan.summary()['rejected'])
+    print(f"{len(plan.files)} files ({len(plan.rejected)} rejected), estimated {format_eta(plan.eta())}", file=sys.stderr)
+    
+    def finish(filepath, result):
+        global count
+        count += 1
+        plan.completed(filepath)
+        print(f"[{count}/{len(plan.files)}] Analyzed: {os.path.basename(filepath)} (ETA {format_eta(plan.eta())})", file=sys.stderr)
+        if index is not None and filepath in fingerprinted and 'error' not in result and 'duplicateOf' not in result:
+            index.set_result(filepath, result)
+        results.append(result)
+        store.append([dict(result, filePath=filepath)])
+        
+        # Commit incremental results every 50 files
+        if count % 50 == 0:
+            store.flush()
     
     # Process all files including subdirectories
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            if file.lower().endswith(extensions):
-                count += 1
-                filepath = os.path.join(root, file)
-                print(f"[{count}] Analyzing: {file}", file=sys.stderr)
-                result = detect_time_signature(filepath)
-                
-                results.append(result)
-                
-                # Save incremental results every 50 files
-                if count % 50 == 0:
-                    with open('time_sig_progress.json', 'w') as f:
-                        json.dump({'analyzed': count, 'results': results}, f, indent=2)
-    
-    print(json.dumps(results, indent=2))
+    plan.start()
+    for info in plan.files:
+        filepath = info['filePath']
+        file = os.path.basename(filepath)
+        
+        duplicate = None
+        if index is not None:
+            try:
+                hashes, offsets = fingerprint_file(filepath, duration=30)
+                duplicate = index.match(hashes, offsets, exclude_path=filepath, duration=info['duration'])
+                index.add(filepath, hashes, offsets, info['duration'])
+                fingerprinted.add(filepath)
+            except Exception:
+                pass
+        
+        cached = index.get_result(duplicate['filePath']) if duplicate else None
+        if cached is not None:
+            print(f"    {file}: duplicate of {os.path.basename(duplicate['filePath'])}, reusing result", file=sys.stderr)
+            finish(filepath, dict(cached, file=file, duplicateOf=duplicate['filePath']))
+        elif duplicate and duplicate['filePath'] in waiting:
+            # Original is still being analyzed in this scan
+            waiting[duplicate['filePath']].append(filepath)
+        else:
+            waiting[filepath] = []
+            batcher.add(filepath)
+    
+    for filepath, result in batcher.results():
+        finish(filepath, result)
+        for copy in waiting.pop(filepath, []):
+            if 'error' in result:
+                batcher.add(copy)  # original failed - analyze the copy itself
+            else:
+                finish(copy, dict(result, file=os.path.basename(copy), duplicateOf=filepath))
+    
+    store.flush()
+    if index is not None:
+        index.close()
+    
+    print(json.dumps(results))
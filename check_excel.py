@@ -1,25 +1,31 @@
 #!/usr/bin/env python3
 """
 Check Excel file structure
+Streams the sheet (no DataFrame) and shows which column import_track_list.py
+would take the file paths from.
+
+Usage: check_excel.py [list.xlsx|list.csv]
 """
 
-import pandas as pd
+import os
+import sys
+
+# Shared analysis modules live alongside the Electron-bundled Python scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python'))
 
-excel_path = r"C:\Users\suppo\Desktop\100 song with Paths.xlsx"
+from import_track_list import read_paths
+
+excel_path = sys.argv[1] if len(sys.argv) > 1 else r"C:\Users\suppo\Desktop\100 song with Paths.xlsx"
 
 try:
-    df = pd.read_excel(excel_path)
-    print(f"Excel shape: {df.shape}")
-    print(f"Columns: {df.columns.tolist()}")
-    print("\nFirst 5 rows:")
-    print(df.head())
-    
-    # Check if first column contains file paths
-    first_col = df.iloc[:, 0]
-    print(f"\nFirst column name: {df.columns[0]}")
-    print("Sample values from first column:")
-    for i, val in enumerate(first_col.head()):
+    rows = 0
+    sample = []
+    for paths, rows, total in read_paths(excel_path):
+        sample.extend(paths[:5 - len(sample)])
+    print(f"Rows: {rows}")
+    print("Sample values from the path column:")
+    for i, val in enumerate(sample):
         print(f"  {i}: {val}")
-        
+
 except Exception as e:
-    print(f"Error: {e}")
\ No newline at end of file
+    print(f"Error: {e}")
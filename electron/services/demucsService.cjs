@@ -46,7 +46,7 @@ class DemucsService {
     throw new Error('Python 3 not found. Please install Python 3.8+ from python.org');
   }
 
-  async separateStems(inputFile, outputDir, stemsCount = '4stems', progressCallback) {
+  async separateStems(inputFile, outputDir, stemsCount = '4stems', progressCallback, outputFormat = null) {
     return new Promise((resolve, reject) => {
       // Ensure output directory exists
       if (!fs.existsSync(outputDir)) {
@@ -67,6 +67,11 @@ class DemucsService {
         stemsCount
       ];
 
+      // Optional stem encoding: wav (float, default), wav16, flac, f16
+      if (outputFormat) {
+        args.push(outputFormat);
+      }
+
       console.log('🎵 Starting Spleeter:', pythonExe, args.join(' '));
 
       this.activeProcess = spawn(pythonExe, args, {
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Forced alignment of known lyrics with Whisper
+Instead of decoding text token by token, the known lyric tokens are fed to
+the decoder in a single forward pass per 30 s window and word timings are
+read from the cross-attention alignment heads (DTW, as Whisper does for
+word_timestamps). That is one encoder + one decoder pass per window
+instead of an autoregressive decode.
+
+Lyrics are aligned window by window: each window gets the next lines that
+fit the token budget, words ending well before the window end are
+accepted, and the next window starts at the last accepted word.
+
+Output matches transcribe_audio.py's `transcription` object; one segment
+per lyric line.
+"""
+import numpy as np
+import torch
+
+# Max lyric tokens per window (decoder context is 448 incl. prompt)
+MAX_WINDOW_TOKENS = 200
+# Words ending within this many seconds of the window end are re-aligned
+# in the next window (DTW squeezes overflowing words into the tail)
+WINDOW_MARGIN_SECONDS = 4.0
+
+# Same punctuation merging as whisper.transcribe's word timestamps
+PREPEND_PUNCTUATIONS = "\"'“¿([{-"
+APPEND_PUNCTUATIONS = "\"'.。,，!！?？:：”)]}、"
+
+
+def lyric_lines(lyrics):
+    return [line.strip() for line in lyrics.splitlines() if line.strip()]
+
+
+def merge_punctuation(timings):
+    """Attach punctuation-only "words" to their neighbour: [(word, start, end)] -> [dict]"""
+    words = []
+    pending = ''
+    for word, start, end in timings:
+        text = word.strip()
+        if words and text and not word.startswith(' ') and all(c in APPEND_PUNCTUATIONS for c in text):
+            words[-1]['word'] += text
+            continue
+        if text and all(c in PREPEND_PUNCTUATIONS for c in text):
+            pending += text
+            continue
+        words.append({'word': pending + text, 'start': round(float(start), 2), 'end': round(float(end), 2)})
+        pending = ''
+    return words
+
+
+def align_lyrics(model, audio, lyrics, language=None, progress=None):
+    """
+    Align `lyrics` (text, one line per lyric line) to 16 kHz mono `audio`.
+    progress(fraction) is called after each window.
+    Returns the transcription dict (text, language, segments, words, duration).
+    """
+    import whisper
+    from whisper.audio import N_FRAMES, N_SAMPLES, SAMPLE_RATE, HOP_LENGTH
+    from whisper.timing import find_alignment
+    from whisper.tokenizer import get_tokenizer
+
+    lines = lyric_lines(lyrics)
+    audio = torch.from_numpy(np.asarray(audio, dtype=np.float32))
+    mel = whisper.log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES).to(model.device)
+    total_frames = mel.shape[-1] - N_FRAMES
+    frames_per_second = SAMPLE_RATE / HOP_LENGTH
+
+    if language is None:
+        if model.is_multilingual:
+            _, probs = model.detect_language(whisper.pad_or_trim(mel, N_FRAMES))
+            language = max(probs, key=probs.get)
+        else:
+            language = 'en'
+
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                              language=language, task='transcribe')
+
+    # Per line: its tokens and how many Whisper "words" they split into
+    line_tokens = [tokenizer.encode(' ' + line) for line in lines]
+    line_words = [len(tokenizer.split_to_word_tokens(tokens)[0]) for tokens in line_tokens]
+
+    timings = []  # (word, start, end) across all windows
+    line = 0
+    offset = 0  # window start (frames)
+    while line < len(lines):
+        # Lines for this window
+        last = line
+        budget = 0
+        while last < len(lines) and (last == line or budget + len(line_tokens[last]) <= MAX_WINDOW_TOKENS):
+            budget += len(line_tokens[last])
+            last += 1
+        window = whisper.pad_or_trim(mel[:, offset:offset + N_FRAMES], N_FRAMES)
+        num_frames = min(N_FRAMES, max(1, total_frames - offset))
+        tokens = [t for tokens in line_tokens[line:last] for t in tokens]
+        words = find_alignment(model, tokenizer, tokens, window, num_frames)
+
+        window_start = offset / frames_per_second
+        final = offset + N_FRAMES >= total_frames
+        cutoff = None if final else num_frames / frames_per_second - WINDOW_MARGIN_SECONDS
+
+        # Accept whole lines whose words all end before the cutoff
+        accepted = 0
+        position = 0
+        for index in range(line, last):
+            count = line_words[index]
+            line_timings = words[position:position + count]
+            if cutoff is not None and accepted and (len(line_timings) < count or any(w.end > cutoff for w in line_timings)):
+                break
+            timings.extend((w.word, window_start + w.start, window_start + w.end) for w in line_timings)
+            position += count
+            accepted += 1
+            if cutoff is not None and line_timings and line_timings[-1].end > cutoff:
+                break  # first line overflowed the window; move on anyway
+
+        line += accepted
+        if timings:
+            offset = max(offset + 1, int(np.ceil(timings[-1][2] * frames_per_second)))
+        if progress:
+            progress(line / len(lines))
+
+    # Group word timings back into one segment per lyric line
+    segments = []
+    word_list = []
+    position = 0
+    for index, text in enumerate(lines):
+        words = merge_punctuation(timings[position:position + line_words[index]])
+        position += line_words[index]
+        segments.append({
+            'id': index,
+            'start': words[0]['start'] if words else (segments[-1]['end'] if segments else 0.0),
+            'end': words[-1]['end'] if words else (segments[-1]['end'] if segments else 0.0),
+            'text': text,
+            'words': words
+        })
+        word_list.extend(words)
+
+    return {
+        'text': ' '.join(lines),
+        'language': language,
+        'segments': segments,
+        'words': word_list,
+        'duration': segments[-1]['end'] if segments else 0,
+        'aligned': True
+    }
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Streaming audio decode + resample
+Reads the file block by block with soundfile and resamples each block with
+a streaming soxr resampler straight to the target rate, so the full-rate
+signal (e.g. 96 kHz stereo FLAC) is never held in memory or resampled in
+one pass. Formats libsndfile cannot read (m4a, wma) fall back to librosa.
+
+Quality tiers (speed vs. quality of the resampler):
+  fast      - soxr LQ, analysis features at reduced rates
+  balanced  - soxr MQ, default for BPM/key/time-signature analysis
+  high      - soxr HQ, stem separation
+  best      - soxr VHQ
+"""
+import numpy as np
+
+QUALITY_TIERS = {
+    'fast': 'LQ',
+    'balanced': 'MQ',
+    'high': 'HQ',
+    'best': 'VHQ',
+}
+
+DEFAULT_QUALITY = 'balanced'
+
+# Frames read per block at the file's native rate
+BLOCK_FRAMES = 1 << 16
+
+
+def _soxr_quality(quality):
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f"Unknown resample quality: {quality} (use {', '.join(QUALITY_TIERS)})")
+    return QUALITY_TIERS[quality]
+
+
+def _shape_output(blocks, mono):
+    """(frames, channels) blocks -> librosa layout: (n,) mono, (channels, n) otherwise"""
+    frames = np.concatenate(blocks) if blocks else np.zeros((0, 1), dtype=np.float32)
+    if mono:
+        return np.ascontiguousarray(frames[:, 0])
+    return np.ascontiguousarray(frames.T)
+
+
+def iter_blocks(audio_file, sr=None, mono=True, offset=0.0, duration=None,
+                quality=DEFAULT_QUALITY, block_frames=BLOCK_FRAMES):
+    """
+    Yield (frames, channels) float32 blocks at `sr` (native rate if None).
+    Mono downmixing happens before resampling, so only one channel is
+    resampled for analysis loads.
+    """
+    import soundfile as sf
+
+    with sf.SoundFile(audio_file) as f:
+        native_sr = f.samplerate
+        channels = 1 if mono else f.channels
+        start = int(round(offset * native_sr))
+        if start:
+            f.seek(min(start, f.frames))
+        remaining = f.frames - f.tell() if f.frames > 0 else None
+        if duration is not None:
+            wanted = int(round(duration * native_sr))
+            remaining = wanted if remaining is None else min(remaining, wanted)
+
+        resampler = None
+        if sr is not None and sr != native_sr:
+            import soxr
+            resampler = soxr.ResampleStream(native_sr, sr, channels, dtype='float32',
+                                            quality=_soxr_quality(quality))
+
+        while remaining is None or remaining > 0:
+            count = block_frames if remaining is None else min(block_frames, remaining)
+            block = f.read(count, dtype='float32', always_2d=True)
+            if len(block) == 0:
+                if resampler is not None:
+                    # Flush the resampler's delay line
+                    tail = resampler.resample_chunk(np.zeros((0, channels), dtype=np.float32), last=True)
+                    if len(tail):
+                        yield tail
+                break
+            if remaining is not None:
+                remaining -= len(block)
+            if mono and block.shape[1] > 1:
+                block = block.mean(axis=1, keepdims=True)
+            last = len(block) < count or remaining == 0
+            if resampler is not None:
+                block = resampler.resample_chunk(block, last=last)
+            if len(block):
+                yield block
+            if last:
+                break
+
+
+def load_audio(audio_file, sr=None, mono=True, offset=0.0, duration=None, quality=DEFAULT_QUALITY):
+    """
+    Drop-in for librosa.load: returns (y, sr) with y shaped (n,) for mono
+    or (channels, n) otherwise (also for mono files).
+    """
+    import soundfile as sf
+
+    try:
+        native_sr = sf.info(audio_file).samplerate
+    except RuntimeError:
+        return _load_fallback(audio_file, sr, mono, offset, duration, quality)
+
+    blocks = list(iter_blocks(audio_file, sr, mono, offset, duration, quality))
+    return _shape_output(blocks, mono), sr or native_sr
+
+
+def _load_fallback(audio_file, sr, mono, offset, duration, quality):
+    """Formats libsndfile cannot decode go through librosa/audioread"""
+    import librosa
+
+    y, sr = librosa.load(audio_file, sr=sr, mono=mono, offset=offset, duration=duration,
+                         res_type='soxr_' + _soxr_quality(quality).lower())
+    if not mono and y.ndim == 1:
+        y = y[np.newaxis, :]
+    return y.astype(np.float32, copy=False), sr
+
+
+def resample(y, orig_sr, target_sr, quality=DEFAULT_QUALITY):
+    """Resample an in-memory signal ((n,) or (channels, n)) with soxr"""
+    if orig_sr == target_sr:
+        return y
+    import soxr
+    y = np.asarray(y, dtype=np.float32)
+    out = soxr.resample(y.T, orig_sr, target_sr, quality=_soxr_quality(quality))
+    return np.ascontiguousarray(out.T)
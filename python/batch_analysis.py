@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Pooled batch analysis with per-file watchdogs
+Runs an analysis function over many files in worker processes. The
+supervisor enforces a wall-clock limit and an RSS limit per file, kills
+and replaces a worker that exceeds either (or crashes), and recycles
+workers after a number of jobs to cap slow leaks in decoders/librosa.
+Failures are returned as results with a failure code instead of stalling
+the scan (in a 'failure' key - 'reason' is left to the analysis itself,
+e.g. 'ambiguous' meter):
+
+  timeout         file took longer than the wall-clock limit
+  memory_limit    worker RSS went over the limit
+  worker_crashed  worker died (segfault in a decoder, killed, ...)
+  exception       the analysis function raised
+  analysis_error  the analysis function returned {'error': ...}
+
+Worker RSS is read with psutil when installed, else from /proc (Linux)
+or GetProcessMemoryInfo (Windows); if none works the limit is not
+enforced and a warning goes to stderr.
+
+The target is given as 'module:function' so spawned workers (Windows)
+can import it; pass the directories it lives in as sys_paths.
+"""
+import os
+import sys
+import time
+import importlib
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_MAX_RSS_MB = 2048
+DEFAULT_MAX_JOBS_PER_WORKER = 50
+POLL_SECONDS = 0.5
+
+# One BLAS/OpenMP thread per worker; parallelism comes from the pool
+WORKER_THREAD_ENV = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMBA_NUM_THREADS')
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+# OpenProcess access for GetProcessMemoryInfo
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+PROCESS_VM_READ = 0x0010
+
+
+def _windows_rss_mb(pid):
+    """Working set of a process via GetProcessMemoryInfo (no psutil needed)"""
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')
+        ]
+
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+    kernel32.K32GetProcessMemoryInfo.argtypes = (wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS),
+                                                 wintypes.DWORD)
+    kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ, False, pid)
+    if not handle:
+        return None
+    try:
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if not kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize / (1024 * 1024)
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def process_rss_mb(pid):
+    """Resident set size of a process in MB (None if it can't be read)"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    if os.name == 'nt':
+        try:
+            return _windows_rss_mb(pid)
+        except (OSError, AttributeError):
+            return None
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _worker_main(conn, target, sys_paths):
+    for path in reversed(sys_paths):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    module_name, func_name = target.split(':')
+    func = getattr(importlib.import_module(module_name), func_name)
+    conn.send(('ready', None, None))
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        task_id, args = message
+        try:
+            conn.send(('ok', task_id, func(*args)))
+        except Exception as e:
+            conn.send(('exception', task_id, f'{type(e).__name__}: {e}'))
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, context, target, sys_paths):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, target, sys_paths), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.task = None
+        self.started = None
+        self.timeout = None
+        self.jobs = 0
+
+    def send(self, task, timeout=None):
+        self.task = task
+        self.started = time.monotonic()
+        self.timeout = timeout
+        self.jobs += 1
+        self.conn.send((task[0], task[1]))
+
+    def retire(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class BatchRunner:
+    """
+    runner = BatchRunner('analyze_audio:detect_bpm_and_key', sys_paths=[root])
+    for path in files: runner.submit(path, path)
+    for task_id, result in runner.results(): ...
+    """
+
+    def __init__(self, target, workers=None, timeout=DEFAULT_TIMEOUT, max_rss_mb=DEFAULT_MAX_RSS_MB,
+                 max_jobs_per_worker=DEFAULT_MAX_JOBS_PER_WORKER, sys_paths=None):
+        self.target = target
+        self.workers = workers or default_workers()
+        self.timeout = timeout
+        self.max_rss_mb = max_rss_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.sys_paths = list(sys_paths or [])
+        self.context = multiprocessing.get_context('spawn')
+        self.pending = deque()
+        self.pool = []
+        self.task_timeouts = {}
+        self._rss_warned = False
+
+    def submit(self, task_id, *args, timeout=None):
+        """
+        Queue a call; may also be called while iterating results().
+        timeout: wall-clock limit for this task instead of the runner's
+        """
+        if timeout is not None:
+            self.task_timeouts[task_id] = timeout
+        self.pending.append((task_id, args))
+
+    def _start_worker(self):
+        for name in WORKER_THREAD_ENV:
+            os.environ.setdefault(name, '1')
+        worker = _Worker(self.context, self.target, self.sys_paths)
+        self.pool.append(worker)
+        return worker
+
+    def _replace(self, worker, kill=True):
+        self.pool.remove(worker)
+        if kill:
+            worker.kill()
+        else:
+            worker.retire()
+        if self.pending or any(w.task for w in self.pool):
+            self._start_worker()
+
+    def _rss_mb(self, worker):
+        """Worker RSS in MB; 0 (and a one-time warning) when it can't be measured"""
+        rss = process_rss_mb(worker.process.pid)
+        if rss is None and worker.process.is_alive() and not self._rss_warned:
+            self._rss_warned = True
+            print(f'Warning: cannot read worker memory here, the {self.max_rss_mb:g} MB RSS limit '
+                  'is not enforced (install psutil)', file=sys.stderr)
+        return rss or 0
+
+    @staticmethod
+    def _failure(task, failure, message):
+        task_id, args = task
+        name = os.path.basename(str(args[0])) if args else str(task_id)
+        return task_id, {'file': name, 'error': message, 'failure': failure}
+
+    def results(self):
+        """Yield (task_id, result) in completion order until nothing is pending"""
+        try:
+            while self.pending or any(w.task for w in self.pool):
+                while len(self.pool) < min(self.workers, len(self.pending) + sum(1 for w in self.pool if w.task)):
+                    self._start_worker()
+
+                # Hand out work; recycle workers that reached their job quota
+                for worker in list(self.pool):
+                    if worker.ready and worker.task is None and self.pending:
+                        if worker.jobs >= self.max_jobs_per_worker:
+                            self._replace(worker, kill=False)
+                            continue
+                        task = self.pending.popleft()
+                        worker.send(task, self.task_timeouts.pop(task[0], self.timeout))
+
+                by_conn = {w.conn: w for w in self.pool}
+                by_sentinel = {w.process.sentinel: w for w in self.pool}
+                for ready in wait(list(by_conn) + list(by_sentinel), timeout=POLL_SECONDS):
+                    worker = by_conn.get(ready) or by_sentinel.get(ready)
+                    if worker not in self.pool:
+                        continue
+                    if ready in by_conn:
+                        try:
+                            status, task_id, payload = worker.conn.recv()
+                        except (EOFError, OSError):
+                            status = 'dead'
+                        if status == 'ready':
+                            worker.ready = True
+                            continue
+                        if status in ('ok', 'exception'):
+                            task, worker.task = worker.task, None
+                            if status == 'exception':
+                                yield self._failure(task, 'exception', payload)
+                            elif isinstance(payload, dict) and 'error' in payload and 'failure' not in payload:
+                                yield task_id, dict(payload, failure='analysis_error')
+                            else:
+                                yield task_id, payload
+                            continue
+                    # Sentinel fired or pipe broke: the worker is gone
+                    worker.process.join(timeout=1)
+                    if worker.task is not None:
+                        yield self._failure(worker.task, 'worker_crashed',
+                                            f'Worker exited with code {worker.process.exitcode}')
+                    elif not worker.ready:
+                        raise RuntimeError(f'Analysis worker failed to start ({self.target})')
+                    self._replace(worker)
+
+                # Watchdog: wall clock and memory of every busy worker
+                now = time.monotonic()
+                for worker in list(self.pool):
+                    if worker.task is None:
+                        continue
+                    if worker.timeout and now - worker.started > worker.timeout:
+                        failure = self._failure(worker.task, 'timeout',
+                                                f'No result after {worker.timeout:g}s')
+                    elif self.max_rss_mb and self._rss_mb(worker) > self.max_rss_mb:
+                        failure = self._failure(worker.task, 'memory_limit',
+                                                f'Worker exceeded {self.max_rss_mb} MB RSS')
+                    else:
+                        continue
+                    worker.task = None
+                    self._replace(worker)
+                    yield failure
+        finally:
+            self.close()
+
+    def close(self):
+        for worker in self.pool:
+            if worker.task is None and worker.process.is_alive():
+                worker.retire()
+            else:
+                worker.kill()
+        self.pool = []
+
+
+class FileBatcher:
+    """
+    Groups files into batches for a runner whose target takes a list of
+    paths and returns a list of results (e.g. detect_time_signatures).
+    A batch that fails as a whole (timeout, crash, memory) is retried one
+    file per task, so only the bad file ends up failed. The runner's
+    timeout stays a per-file limit: a batch gets timeout x its file count.
+
+    batcher = FileBatcher(runner, batch_size=8)
+    for path in files: batcher.add(path)
+    for path, result in batcher.results(): ...
+    """
+
+    def __init__(self, runner, batch_size):
+        self.runner = runner
+        self.batch_size = max(1, int(batch_size))
+        self.queue = []
+        self.batches = {}
+        self._next_id = 0
+
+    def _submit(self, paths):
+        self.batches[self._next_id] = paths
+        timeout = self.runner.timeout * len(paths) if self.runner.timeout else None
+        self.runner.submit(self._next_id, paths, timeout=timeout)
+        self._next_id += 1
+
+    def add(self, path):
+        """Queue a file; may also be called while iterating results()"""
+        self.queue.append(path)
+        if len(self.queue) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.queue:
+            self._submit(self.queue)
+            self.queue = []
+
+    def results(self):
+        """
+        Yield (path, result) per file in completion order. Files added
+        while iterating are submitted right away.
+        """
+        self.flush()
+        for task_id, result in self.runner.results():
+            paths = self.batches.pop(task_id)
+            if isinstance(result, list):
+                pairs = [(path, dict(r, failure='analysis_error') if 'error' in r and 'failure' not in r else r)
+                         for path, r in zip(paths, result)]
+            elif len(paths) > 1:
+                # Something in the batch hung or crashed; find out which file
+                for path in paths:
+                    self._submit([path])
+                continue
+            else:
+                pairs = [(paths[0], dict(result, file=os.path.basename(paths[0])))]
+            for path, file_result in pairs:
+                yield path, file_result
+                self.flush()
+
+
+def runner_options(argv):
+    """
+    Pop --workers N, --timeout S, --max-rss MB from an argv list (in place)
+    and return BatchRunner keyword arguments. --timeout is seconds per file
+    (FileBatcher scales it by the batch size).
+    """
+    options = {}
+    for flag, key, cast in (('--workers', 'workers', int), ('--timeout', 'timeout', float),
+                            ('--max-rss', 'max_rss_mb', float)):
+        if flag in argv:
+            position = argv.index(flag)
+            options[key] = cast(argv[position + 1])
+            del argv[position:position + 2]
+    return options
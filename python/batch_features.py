@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Batched feature extraction over stacked excerpts
+Decodes the same fixed-length window (e.g. the first 30 s) of many tracks,
+stacks them into one (tracks, samples) array and computes the STFT (one
+FFT call over every frame of every track), mel spectrogram, onset
+envelopes and optionally CQT chroma for the whole batch at once. Each
+track's features are then trimmed back to its own length and handed to
+per-track scoring.
+
+Results match per-file calls up to float32 rounding: tracks shorter than
+the window are zero padded (what librosa's centered STFT pads with anyway)
+and the log-mel dynamic range (top_db) is applied per track, not across
+the batch.
+
+Usage: batch_features.py <folder> [--seconds S] [--batch-size N]
+Compares per-file and batched onset extraction (tracks/second).
+"""
+import sys
+import json
+import time
+
+import numpy as np
+
+from audio_decode import load_audio
+from startup import load_librosa
+
+SR = 22050
+HOP_LENGTH = 512
+N_FFT = 2048
+TOP_DB = 80.0
+DEFAULT_BATCH_SIZE = 8
+
+# Aggregation of the per-band flux into one onset envelope
+AGGREGATES = {'mean': np.mean, 'median': np.median}
+
+
+def load_excerpts(paths, seconds, sr=SR):
+    """
+    Decode the first `seconds` of each file and stack them.
+    Returns (Y (n, samples) float32, lengths, errors {index: message});
+    failed files get an empty row and length 0.
+    """
+    signals = []
+    errors = {}
+    for index, path in enumerate(paths):
+        try:
+            y, _ = load_audio(path, sr=sr, mono=True, duration=seconds)
+        except Exception as e:
+            errors[index] = str(e)
+            y = np.zeros(0, dtype=np.float32)
+        signals.append(y)
+    lengths = [len(y) for y in signals]
+    Y = np.zeros((len(signals), max(lengths + [1])), dtype=np.float32)
+    for row, y in zip(Y, signals):
+        row[:len(y)] = y
+    return Y, lengths, errors
+
+
+def frame_count(length, hop_length):
+    """Frames of a centered STFT over `length` samples"""
+    return 1 + length // hop_length
+
+
+def power_spectrogram(Y, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    |STFT|^2 of every row of Y in one FFT call, frames-major:
+    (tracks, frames, 1 + n_fft/2). Centered, zero padded, periodic Hann
+    window, as librosa.stft.
+    """
+    import scipy.fft
+    librosa = load_librosa()
+    window = librosa.filters.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+    padded = np.pad(Y, ((0, 0), (n_fft // 2, n_fft // 2)))
+    frames = np.lib.stride_tricks.sliding_window_view(padded, n_fft, axis=-1)[:, ::hop_length]
+    spectrum = scipy.fft.rfft(frames * window, axis=-1)
+    return spectrum.real ** 2 + spectrum.imag ** 2
+
+
+def onset_envelopes(Y, lengths, sr=SR, hop_length=HOP_LENGTH, aggregates=('mean',)):
+    """
+    Onset strength of every row of Y, as librosa.onset.onset_strength(y=row)
+    would give it. Returns {aggregate: [envelope per track]}.
+    """
+    librosa = load_librosa()
+    mel = librosa.filters.mel(sr=sr, n_fft=N_FFT).astype(np.float32)
+    S = np.swapaxes(power_spectrogram(Y, N_FFT, hop_length) @ mel.T, -1, -2)
+    # power_to_db(ref=1.0, top_db=80), with the top_db floor per track
+    S = 10.0 * np.log10(np.maximum(S, 1e-10))
+    np.maximum(S, S.max(axis=(-2, -1), keepdims=True) - TOP_DB, out=S)
+
+    envelopes = {}
+    for name in aggregates:
+        env = librosa.onset.onset_strength(S=S, sr=sr, hop_length=hop_length, aggregate=AGGREGATES[name])
+        envelopes[name] = [env[i, :frame_count(length, hop_length)] for i, length in enumerate(lengths)]
+    return envelopes
+
+
+def chromagrams(Y, lengths, sr=SR, hop_length=2048, bins_per_octave=36):
+    """CQT chroma of every row of Y (settings of detect_bpm_and_key), trimmed per track"""
+    librosa = load_librosa()
+    chroma = librosa.feature.chroma_cqt(y=Y, sr=sr, hop_length=hop_length, n_chroma=12,
+                                        bins_per_octave=bins_per_octave)
+    return [chroma[i, :, :frame_count(length, hop_length)] for i, length in enumerate(lengths)]
+
+
+def extract_features(paths, seconds, sr=SR, hop_length=HOP_LENGTH, aggregates=('mean',), chroma=False):
+    """
+    Features for a batch of files in one pass.
+    Returns one dict per path: {y, sr, onset: {aggregate: env}, chroma?}
+    or {error} for files that failed to decode.
+    """
+    Y, lengths, errors = load_excerpts(paths, seconds, sr)
+    envelopes = onset_envelopes(Y, lengths, sr, hop_length, aggregates)
+    chromas = chromagrams(Y, lengths, sr) if chroma else None
+
+    features = []
+    for i, length in enumerate(lengths):
+        if i in errors:
+            features.append({'error': errors[i]})
+            continue
+        track = {'y': Y[i, :length], 'sr': sr, 'onset': {name: envelopes[name][i] for name in aggregates}}
+        if chromas is not None:
+            track['chroma'] = chromas[i]
+        features.append(track)
+    return features
+
+
+def batches(items, batch_size):
+    """Consecutive slices of at most batch_size items"""
+    batch_size = max(1, int(batch_size))
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+if __name__ == '__main__':
+    from media_probe import find_audio_files
+
+    argv = sys.argv[1:]
+    options = {'seconds': 30.0, 'batch_size': DEFAULT_BATCH_SIZE}
+    for flag, key, cast in (('--seconds', 'seconds', float), ('--batch-size', 'batch_size', int)):
+        if flag in argv:
+            position = argv.index(flag)
+            options[key] = cast(argv[position + 1])
+            del argv[position:position + 2]
+    if not argv:
+        print(json.dumps({'error': 'Usage: batch_features.py <folder> [--seconds S] [--batch-size N]'}))
+        sys.exit(1)
+
+    librosa = load_librosa()
+    paths = find_audio_files(argv[0])
+    extract_features(paths[:1], options['seconds'])  # JIT/filter caches, outside the timing
+
+    started = time.perf_counter()
+    single = []
+    for path in paths:
+        try:
+            y, sr = load_audio(path, sr=SR, mono=True, duration=options['seconds'])
+            single.append(librosa.onset.onset_strength(y=y, sr=sr, hop_length=HOP_LENGTH))
+        except Exception:
+            single.append(None)
+    single_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batched = []
+    for batch in batches(paths, options['batch_size']):
+        batched.extend(track['onset']['mean'] if 'onset' in track else None
+                       for track in extract_features(batch, options['seconds']))
+    batch_seconds = time.perf_counter() - started
+
+    deviation = max((float(np.max(np.abs(a - b))) for a, b in zip(single, batched)
+                     if a is not None and b is not None and len(a)), default=0.0)
+    print(json.dumps({
+        'tracks': len(paths),
+        'batchSize': options['batch_size'],
+        'perFileTracksPerSecond': round(len(paths) / single_seconds, 2),
+        'batchedTracksPerSecond': round(len(paths) / batch_seconds, 2),
+        'maxDeviation': deviation
+    }, indent=2))
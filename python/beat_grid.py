@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Beat/downbeat grids stored as compact arrays
+A grid is the list of beat times plus the meter: beatsPerBar and the
+index of the first downbeat (the phase where beats are strongest on
+average). Bar numbers and downbeats follow from those two numbers, so
+only the beat times are stored - as float32 deltas (first beat time,
+then beat-to-beat intervals), little-endian, base64 in JSON and raw
+bytes in SQLite. That is 4 bytes per beat and decodes with one cumsum.
+
+Scan results carry the grid flattened (beatGrid, beatsPerBar,
+firstDownbeat) so it fits results_store columns. Full-track grids for
+the player live in beat_grids.db (app data), keyed by file path.
+
+Saved grids use the meter the scanners detected for the file (looked
+up in their results stores) unless --meter is given; a file with no
+detected meter is not saved, since a wrong beatsPerBar would give the
+player wrong downbeats and bar numbers.
+
+Usage:
+  beat_grid.py <audio_file> [--meter 4/4] [--save] [--db gridDbPath] [--results storePath]
+      full-track grid; --save stores it for the player
+  beat_grid.py --load <audio_file> [--db gridDbPath]
+      stored grid, expanded to beats/downbeats/bars
+"""
+import os
+import sys
+import json
+import time
+import base64
+
+import numpy as np
+
+from library_db import app_data_dir, connect, normalize_path
+from results_store import ResultsStore
+
+GRID_DTYPE = np.dtype('<f4')
+
+# Beats per bar for the meters the scanners report (6/8 counts eighths)
+BEATS_PER_BAR = {'4/4': 4, '3/4': 3, '6/8': 6}
+
+# Scan results stores holding detected meters (analyze_time_sigs.py, quick_time_sig_analysis.py)
+SCAN_RESULTS = ('time_sig_results', 'library_analysis_results')
+
+# Window around each beat for its downbeat strength
+BEAT_RADIUS_SECONDS = 0.05
+
+
+def default_grid_path():
+    return os.path.join(app_data_dir(), 'beat_grids.db')
+
+
+def encode_beats(beat_times):
+    """Beat times (seconds) -> float32 delta bytes"""
+    times = np.asarray(beat_times, dtype=np.float64)
+    return np.diff(times, prepend=0.0).astype(GRID_DTYPE).tobytes()
+
+
+def decode_beats(data):
+    """float32 delta bytes (or their base64 text) -> beat times (float64 seconds)"""
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    return np.cumsum(np.frombuffer(data, dtype=GRID_DTYPE), dtype=np.float64)
+
+
+def downbeat_strengths(y, sr, beat_times, radius=BEAT_RADIUS_SECONDS):
+    """Signal energy within +-radius of each beat (absorbs small beat-time offsets)"""
+    half = int(radius * sr)
+    centres = (np.asarray(beat_times) * sr).astype(int)
+    return np.array([np.sum(np.square(y[max(0, c - half):c + half], dtype=np.float64)) for c in centres])
+
+
+def downbeat_phase(strengths, beats_per_bar):
+    """Beat index (< beats_per_bar) whose beats are strongest on average"""
+    strengths = np.asarray(strengths, dtype=np.float64)
+    if len(strengths) < beats_per_bar:
+        return 0
+    means = [strengths[phase::beats_per_bar].mean() for phase in range(beats_per_bar)]
+    return int(np.argmax(means))
+
+
+def grid_fields(beat_times, time_signature='4/4', strengths=None):
+    """
+    Flat result fields for a grid: {beatGrid (base64), beatsPerBar, firstDownbeat}.
+    strengths: per-beat energy (downbeat_strengths), for the downbeat phase
+    """
+    beats_per_bar = BEATS_PER_BAR.get(time_signature, 4)
+    first = downbeat_phase(strengths, beats_per_bar) if strengths is not None else 0
+    return {
+        'beatGrid': base64.b64encode(encode_beats(beat_times)).decode('ascii'),
+        'beatsPerBar': beats_per_bar,
+        'firstDownbeat': first
+    }
+
+
+def expand_grid(beat_grid, beats_per_bar, first_downbeat):
+    """
+    Beats, downbeats and bar numbers of a stored grid.
+    Bar 1 starts at the first downbeat; pickup beats before it are bar 0.
+    """
+    beats = decode_beats(beat_grid)
+    index = np.arange(len(beats)) - first_downbeat
+    bars = np.where(index >= 0, index // beats_per_bar + 1, 0)
+    beat_in_bar = index % beats_per_bar + 1
+    return {
+        'beats': beats,
+        'downbeats': beats[(index >= 0) & (beat_in_bar == 1)],
+        'bars': bars,
+        'beatInBar': beat_in_bar
+    }
+
+
+def track_grid(audio_file, time_signature='4/4'):
+    """Full-track beat_track grid (same settings as analyze_time_signatures.py)"""
+    from audio_decode import load_audio
+    from startup import load_librosa
+    librosa = load_librosa()
+
+    y, sr = load_audio(audio_file, sr=22050, mono=True)
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, aggregate=np.median)
+    tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, units='time')
+    result = grid_fields(beats, time_signature, downbeat_strengths(y, sr, beats))
+    result.update(bpm=float(np.atleast_1d(tempo)[0]), beatCount=len(beats), duration=len(y) / float(sr))
+    return result
+
+
+def detected_meter(audio_file, results_paths=SCAN_RESULTS):
+    """Time signature a scan detected for the file, or None"""
+    key = normalize_path(audio_file)
+    for path in results_paths:
+        if not os.path.isdir(path):
+            continue
+        store = ResultsStore(path)
+        if 'timeSignature' not in store.kinds:
+            continue
+        matches = [i for i, p in enumerate(store.strings('filePath')) if p and normalize_path(p) == key]
+        if matches:
+            meter = store.records(matches[-1:])[0].get('timeSignature')
+            if meter in BEATS_PER_BAR:
+                return meter
+    return None
+
+
+class BeatGridStore:
+    """SQLite-backed full-track grids, keyed by normalized file path"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_grid_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.conn = connect(self.db_path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS beat_grids (
+              pathKey       TEXT PRIMARY KEY,
+              filePath      TEXT NOT NULL,
+              beatsPerBar   INTEGER NOT NULL,
+              firstDownbeat INTEGER NOT NULL,
+              beatCount     INTEGER NOT NULL,
+              beats         BLOB NOT NULL,
+              bpm           REAL,
+              created       REAL
+            ) WITHOUT ROWID;
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def save(self, file_path, grid):
+        """Store grid fields (as from grid_fields/track_grid) for a file"""
+        beats = base64.b64decode(grid['beatGrid'])
+        self.conn.execute(
+            "INSERT OR REPLACE INTO beat_grids VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (normalize_path(file_path), file_path, grid['beatsPerBar'], grid['firstDownbeat'],
+             len(beats) // GRID_DTYPE.itemsize, beats, grid.get('bpm'), time.time())
+        )
+        self.conn.commit()
+
+    def load(self, file_path):
+        """Grid fields for a file, or None"""
+        row = self.conn.execute(
+            "SELECT beats, beatsPerBar, firstDownbeat, bpm FROM beat_grids WHERE pathKey = ?",
+            (normalize_path(file_path),)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'beatGrid': base64.b64encode(row[0]).decode('ascii'),
+            'beatsPerBar': row[1],
+            'firstDownbeat': row[2],
+            'bpm': row[3]
+        }
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    options = {}
+    for flag in ('--meter', '--db', '--results'):
+        if flag in argv:
+            position = argv.index(flag)
+            options[flag[2:]] = argv[position + 1]
+            del argv[position:position + 2]
+    args = [a for a in argv if not a.startswith('--')]
+    if not args:
+        print(json.dumps({'error': 'Usage: beat_grid.py <audio_file> [--meter 4/4] [--save] [--db gridDbPath] '
+                                   '[--results storePath] | --load <audio_file> [--db gridDbPath]'}))
+        sys.exit(1)
+
+    try:
+        audio_file = args[0]
+        if '--load' in argv:
+            store = BeatGridStore(options.get('db'))
+            grid = store.load(audio_file)
+            store.close()
+            if grid is None:
+                print(json.dumps({'error': f'No beat grid stored for {audio_file}'}))
+                sys.exit(2)
+        else:
+            meter = options.get('meter')
+            if meter is None and '--save' in argv:
+                results_paths = (options['results'],) if 'results' in options else SCAN_RESULTS
+                meter = detected_meter(audio_file, results_paths)
+                if meter is None:
+                    print(json.dumps({'error': f'No detected time signature for {audio_file}; '
+                                               'scan it first or pass --meter'}))
+                    sys.exit(2)
+            grid = track_grid(audio_file, meter or '4/4')
+            if '--save' in argv:
+                store = BeatGridStore(options.get('db'))
+                store.save(audio_file, grid)
+                store.close()
+        expanded = expand_grid(grid['beatGrid'], grid['beatsPerBar'], grid['firstDownbeat'])
+        grid.update(
+            beats=[round(float(t), 4) for t in expanded['beats']],
+            downbeats=[round(float(t), 4) for t in expanded['downbeats']],
+            bars=int(expanded['bars'].max()) if len(expanded['bars']) else 0
+        )
+        print(json.dumps(grid))
+    except Exception as e:
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
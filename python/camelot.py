@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Key name / Camelot wheel helpers shared by the harmonic mixing tools
+"""
+import re
+
+KEY_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+FLATS = {'Db': 'C#', 'Eb': 'D#', 'Gb': 'F#', 'Ab': 'G#', 'Bb': 'A#', 'Cb': 'B', 'Fb': 'E'}
+
+_CAMELOT_RE = re.compile(r'^\s*(\d{1,2})\s*([ABab])\s*$')
+_KEY_RE = re.compile(r'^\s*([A-Ga-g])([#b]?)\s*(m|min|minor|maj|major)?\s*$')
+
+
+def parse_key(key, mode=None):
+    """
+    Parse 'C', 'Am', 'A minor', 'F# major', 'Bbm' or Camelot '8A'.
+    Returns (pitch_class, 'major'|'minor') or None.
+    """
+    if key is None:
+        return None
+    text = str(key).strip()
+    camelot = _CAMELOT_RE.match(text)
+    if camelot:
+        return camelot_to_key(int(camelot.group(1)), camelot.group(2).upper())
+
+    match = _KEY_RE.match(text)
+    if not match:
+        return None
+    name = match.group(1).upper() + match.group(2)
+    name = FLATS.get(name, name)
+    if name not in KEY_NAMES:
+        return None
+    suffix = (match.group(3) or mode or 'major').lower()
+    parsed_mode = 'minor' if suffix in ('m', 'min', 'minor') else 'major'
+    return KEY_NAMES.index(name), parsed_mode
+
+
+def key_to_camelot(pitch_class, mode):
+    """Pitch class + mode -> (number 1-12, 'A' minor | 'B' major)"""
+    if mode == 'minor':
+        # Minor keys share the number of their relative major
+        pitch_class = (pitch_class + 3) % 12
+    number = (pitch_class * 7 + 7) % 12 + 1
+    return number, 'A' if mode == 'minor' else 'B'
+
+
+def camelot_to_key(number, letter):
+    major_pc = ((number - 1 - 7) * 7) % 12
+    if letter == 'A':
+        return (major_pc - 3) % 12, 'minor'
+    return major_pc, 'major'
+
+
+def camelot_code(key, mode=None):
+    """'A minor' -> '8A' (None if unparseable)"""
+    parsed = parse_key(key, mode)
+    if parsed is None:
+        return None
+    number, letter = key_to_camelot(*parsed)
+    return f'{number}{letter}'
+
+
+def camelot_distance(a, b):
+    """
+    Steps between two Camelot positions (number, letter): wheel steps plus
+    one for switching between the A/B rings.
+    """
+    steps = abs(a[0] - b[0]) % 12
+    steps = min(steps, 12 - steps)
+    return steps + (0 if a[1] == b[1] else 1)
+
+
+def compatibility(a, b):
+    """DJ compatibility label for two Camelot positions"""
+    distance = camelot_distance(a, b)
+    if distance == 0:
+        return 'perfect'
+    if distance == 1:
+        return 'compatible'
+    if distance == 2 and a[1] == b[1]:
+        return 'energy-boost'
+    return 'clash'
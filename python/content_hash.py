@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Audio content hashing for result caches
+Hashes the audio payload of a file while skipping tag blocks (ID3v2/ID3v1
+on MP3, metadata blocks on FLAC), so re-tagged copies hash the same.
+"""
+import hashlib
+import os
+
+CHUNK_SIZE = 1 << 20
+
+
+def _id3v2_size(header):
+    """Total size of a leading ID3v2 tag (0 if none)"""
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _flac_audio_offset(f):
+    """Byte offset of the first FLAC audio frame (after all metadata blocks)"""
+    f.seek(4)
+    while True:
+        block_header = f.read(4)
+        if len(block_header) < 4:
+            return f.tell()
+        length = int.from_bytes(block_header[1:4], 'big')
+        f.seek(length, os.SEEK_CUR)
+        if block_header[0] & 0x80:  # last-metadata-block flag
+            return f.tell()
+
+
+def audio_payload_range(path):
+    """(start, end) byte range of the audio data inside the file"""
+    size = os.path.getsize(path)
+    start, end = 0, size
+    with open(path, 'rb') as f:
+        header = f.read(10)
+        if header[:4] == b'fLaC':
+            start = _flac_audio_offset(f)
+        else:
+            start = _id3v2_size(header)
+            if size >= 128:
+                f.seek(size - 128)
+                if f.read(3) == b'TAG':
+                    end = size - 128
+    return start, max(start, end)
+
+
+def audio_content_hash(path):
+    """Hex digest of the file's audio payload"""
+    start, end = audio_payload_range(path)
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Audio fingerprint index for duplicate track detection
+Hashes pair onset landmarks with the dominant chroma pitch classes and
+spectral band around them, so re-encodes/re-tags of the same recording
+share most hashes. Hashes live in an SQLite inverted index (hash -> track,
+frame offset).
+
+A match needs time-consistent hashes covering at least MIN_MATCH_SECONDS,
+a match ratio measured over the time span both fingerprints cover, and
+(when known) comparable track durations - a short clip of another song
+sharing a few landmark hashes is not a duplicate.
+
+Usage:
+  fingerprint_index.py add <folder> [indexPath]
+  fingerprint_index.py match <audio_file> [indexPath]
+  fingerprint_index.py check
+      regression check on synthetic songs: a noisy re-encode matches its
+      original, a short clip of a different song does not
+"""
+import sys
+import os
+import json
+import warnings
+warnings.filterwarnings('ignore')
+
+import numpy as np
+
+from library_db import app_data_dir, connect
+from audio_decode import load_audio, resample
+
+# Fingerprint analysis settings
+FINGERPRINT_SR = 11025
+FINGERPRINT_HOP = 1024
+FINGERPRINT_SECONDS = 60.0
+FAN_OUT = 3          # landmarks paired with each anchor
+MAX_DELTA = 127      # max frames between paired landmarks (7 bits)
+BANDS = 8            # spectral bands for the landmark's dominant band (3 bits)
+
+# Bump when the hash layout changes; older indexes are rebuilt
+HASH_VERSION = 2
+
+# Match acceptance
+MIN_MATCHES = 12
+MIN_MATCH_RATIO = 0.1
+# Matched hashes must span this much audio (short clips never match)
+MIN_MATCH_SECONDS = 8.0
+# Durations may differ by this much (seconds, or fraction of the longer one)
+DURATION_TOLERANCE_SECONDS = 2.0
+DURATION_TOLERANCE_RATIO = 0.02
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.m4a', '.ogg', '.wma')
+
+
+def default_index_path():
+    return os.path.join(app_data_dir(), 'fingerprints.db')
+
+
+def compute_fingerprint(y, sr):
+    """
+    Landmark hashes for a mono signal.
+    Returns (hashes uint32[n], offsets int32[n]) - offset is the anchor frame.
+    """
+    from startup import load_librosa
+    librosa = load_librosa()
+
+    if sr != FINGERPRINT_SR:
+        y = resample(y, sr, FINGERPRINT_SR, quality='fast')
+        sr = FINGERPRINT_SR
+
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=FINGERPRINT_HOP)
+    S = np.abs(librosa.stft(y, n_fft=4096, hop_length=FINGERPRINT_HOP)) ** 2
+    chroma = librosa.feature.chroma_stft(S=S, sr=sr, n_fft=4096)
+    bands = librosa.feature.melspectrogram(S=S, sr=sr, n_mels=BANDS)
+
+    # Smooth over ~0.5 s so codec noise does not flip the ranking
+    kernel = np.ones(5) / 5.0
+    chroma = np.apply_along_axis(lambda row: np.convolve(row, kernel, mode='same'), 1, chroma)
+    bands = np.apply_along_axis(lambda row: np.convolve(row, kernel, mode='same'), 1, bands)
+    order = np.argsort(-chroma, axis=0)
+    top1 = order[0].astype(np.uint32)
+    top2 = order[1].astype(np.uint32)
+    band = np.argmax(bands, axis=0).astype(np.uint32)
+
+    landmarks = librosa.onset.onset_detect(
+        onset_envelope=onset_env, sr=sr, hop_length=FINGERPRINT_HOP, backtrack=False
+    )
+    landmarks = landmarks[landmarks < chroma.shape[1]]
+    if len(landmarks) < 2:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int32)
+
+    # Pair each anchor with the next FAN_OUT landmarks (vectorized)
+    anchors = []
+    targets = []
+    for step in range(1, FAN_OUT + 1):
+        anchors.append(landmarks[:-step])
+        targets.append(landmarks[step:])
+    anchors = np.concatenate(anchors)
+    targets = np.concatenate(targets)
+    delta = targets - anchors
+    keep = (delta > 0) & (delta <= MAX_DELTA)
+    anchors, targets, delta = anchors[keep], targets[keep], delta[keep]
+
+    # 4+4+4+4 bits of pitch classes, 3+3 bits of dominant band, 7 bits of landmark spacing
+    hashes = (
+        (top1[anchors] << 25)
+        | (top2[anchors] << 21)
+        | (top1[targets] << 17)
+        | (top2[targets] << 13)
+        | (band[anchors] << 10)
+        | (band[targets] << 7)
+        | delta.astype(np.uint32)
+    ).astype(np.uint32)
+    return hashes, anchors.astype(np.int32)
+
+
+def track_duration(audio_file):
+    """Full length in seconds from the container header, or None"""
+    from media_probe import probe
+    return probe(audio_file)['duration']
+
+
+def fingerprint_file(audio_file, duration=FINGERPRINT_SECONDS, y=None, sr=None):
+    """Fingerprint the opening `duration` seconds of a file (or a preloaded signal)"""
+    if y is None:
+        y, sr = load_audio(audio_file, sr=FINGERPRINT_SR, mono=True, duration=duration, quality='fast')
+    elif duration:
+        y = y[:int(duration * sr)]
+    return compute_fingerprint(y, sr)
+
+
+def synthetic_song(seed, bpm, seconds, sr=FINGERPRINT_SR):
+    """Chord-per-bar test signal with a note on every beat (for check())"""
+    rng = np.random.default_rng(seed)
+    beat = 60.0 / bpm
+    y = np.zeros(int(seconds * sr), dtype=np.float32)
+    t = np.arange(int(beat * sr)) / sr
+    envelope = np.exp(-6.0 * t)
+    chord = None
+    for index in range(int(seconds / beat)):
+        if index % 4 == 0:
+            chord = 110.0 * 2.0 ** (rng.choice(24, size=3, replace=False) / 12.0)
+        start = int(index * beat * sr)
+        note = sum(np.sin(2 * np.pi * f * t) for f in chord) + np.sin(2 * np.pi * rng.choice(chord) * 2 * t)
+        segment = y[start:start + len(t)]
+        segment += (0.2 * note * envelope)[:len(segment)]
+    return y
+
+
+def check():
+    """
+    Duplicate/non-duplicate decisions on synthetic songs, in a throwaway index.
+    Returns {case: passed} - a re-encode must match, clips of other songs must not.
+    """
+    import tempfile
+    rng = np.random.default_rng(0)
+    original = synthetic_song(1, 124, 120)
+    other = synthetic_song(2, 128, 120)
+    reencode = 0.8 * original + 0.01 * rng.standard_normal(len(original)).astype(np.float32)
+    clip = other[:4 * FINGERPRINT_SR]
+
+    with tempfile.TemporaryDirectory() as root:
+        index = FingerprintIndex(os.path.join(root, 'fingerprints.db'))
+        try:
+            hashes, offsets = compute_fingerprint(original[:int(FINGERPRINT_SECONDS * FINGERPRINT_SR)], FINGERPRINT_SR)
+            index.add('original', hashes, offsets, 120.0)
+            cases = {}
+            hashes, offsets = compute_fingerprint(reencode[:int(FINGERPRINT_SECONDS * FINGERPRINT_SR)], FINGERPRINT_SR)
+            match = index.match(hashes, offsets, duration=120.0)
+            cases['reencodeMatches'] = bool(match and match['filePath'] == 'original')
+            hashes, offsets = compute_fingerprint(clip, FINGERPRINT_SR)
+            cases['shortClipOfOtherSongRejected'] = index.match(hashes, offsets, duration=4.0) is None
+            cases['shortClipWithoutDurationRejected'] = index.match(hashes, offsets) is None
+            hashes, offsets = compute_fingerprint(other[:int(FINGERPRINT_SECONDS * FINGERPRINT_SR)], FINGERPRINT_SR)
+            cases['otherSongRejected'] = index.match(hashes, offsets, duration=120.0) is None
+        finally:
+            index.close()
+    return cases
+
+
+class FingerprintIndex:
+    """SQLite-backed inverted index of fingerprint hashes"""
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path or default_index_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        self.conn = connect(self.index_path)
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != HASH_VERSION:
+            # Hashes from another layout never match the current ones
+            self.conn.executescript(f"""
+                DROP TABLE IF EXISTS fp_hashes;
+                DROP TABLE IF EXISTS fp_tracks;
+                PRAGMA user_version = {HASH_VERSION};
+            """)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS fp_tracks (
+              id         INTEGER PRIMARY KEY,
+              filePath   TEXT NOT NULL UNIQUE,
+              hashCount  INTEGER,
+              duration   REAL,
+              result     TEXT,
+              created_at DATETIME DEFAULT (datetime('now'))
+            );
+            CREATE TABLE IF NOT EXISTS fp_hashes (
+              hash     INTEGER NOT NULL,
+              track_id INTEGER NOT NULL,
+              offset   INTEGER NOT NULL,
+              PRIMARY KEY (hash, track_id, offset)
+            ) WITHOUT ROWID;
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def add(self, file_path, hashes, offsets, duration=None):
+        """
+        Insert (or replace) the fingerprint of a file. Returns its index id.
+        duration: full track length in seconds, if known (see match)
+        """
+        cur = self.conn.cursor()
+        row = cur.execute("SELECT id FROM fp_tracks WHERE filePath = ?", (file_path,)).fetchone()
+        if row:
+            track_id = row[0]
+            cur.execute("DELETE FROM fp_hashes WHERE track_id = ?", (track_id,))
+            cur.execute("UPDATE fp_tracks SET hashCount = ?, duration = ? WHERE id = ?",
+                        (len(hashes), duration, track_id))
+        else:
+            cur.execute("INSERT INTO fp_tracks (filePath, hashCount, duration) VALUES (?, ?, ?)",
+                        (file_path, len(hashes), duration))
+            track_id = cur.lastrowid
+        cur.executemany(
+            "INSERT OR IGNORE INTO fp_hashes (hash, track_id, offset) VALUES (?, ?, ?)",
+            ((int(h), track_id, int(o)) for h, o in zip(hashes, offsets))
+        )
+        self.conn.commit()
+        return track_id
+
+    def match(self, hashes, offsets, exclude_path=None, duration=None):
+        """
+        Find the indexed track sharing the most time-consistent hashes.
+        duration: full length of the queried track in seconds, if known;
+        tracks of a different length are not duplicates.
+        Returns {'filePath', 'matches', 'ratio', 'offset', 'span'} or None.
+        """
+        if len(hashes) == 0:
+            return None
+        by_hash = {}
+        for h, o in zip(hashes.tolist(), offsets.tolist()):
+            by_hash.setdefault(h, []).append(o)
+
+        # Vote on (track, offset difference) - true duplicates line up
+        votes = {}
+        keys = list(by_hash)
+        cur = self.conn.cursor()
+        excluded = None
+        if exclude_path:
+            row = cur.execute("SELECT id FROM fp_tracks WHERE filePath = ?", (exclude_path,)).fetchone()
+            excluded = row[0] if row else None
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for h, track_id, offset in cur.execute(
+                f"SELECT hash, track_id, offset FROM fp_hashes WHERE hash IN ({placeholders})", chunk
+            ):
+                if track_id == excluded:
+                    continue
+                for query_offset in by_hash[h]:
+                    key = (track_id, offset - query_offset)
+                    votes[key] = votes.get(key, 0) + 1
+
+        # Merge neighbouring offsets (landmarks can shift by a frame)
+        best = None
+        for (track_id, diff), count in votes.items():
+            total = count + votes.get((track_id, diff - 1), 0) + votes.get((track_id, diff + 1), 0)
+            if best is None or total > best[2]:
+                best = (track_id, diff, total)
+        if best is None or best[2] < MIN_MATCHES:
+            return None
+
+        track_id, diff, count = best
+        row = cur.execute("SELECT filePath, duration FROM fp_tracks WHERE id = ?", (track_id,)).fetchone()
+        if row is None:
+            return None
+        if duration and row[1]:
+            tolerance = max(DURATION_TOLERANCE_SECONDS, DURATION_TOLERANCE_RATIO * max(duration, row[1]))
+            if abs(duration - row[1]) > tolerance:
+                return None
+
+        # Ratio over the time span both fingerprints cover, against the larger hash count in it
+        indexed = np.array([o for (o,) in cur.execute("SELECT offset FROM fp_hashes WHERE track_id = ?",
+                                                      (track_id,))], dtype=np.int64)
+        aligned = np.asarray(offsets, dtype=np.int64) + diff
+        start = max(int(aligned.min()), int(indexed.min()))
+        end = min(int(aligned.max()), int(indexed.max()))
+        span = (end - start) * FINGERPRINT_HOP / float(FINGERPRINT_SR)
+        if span < MIN_MATCH_SECONDS:
+            return None
+        in_query = int(np.count_nonzero((aligned >= start) & (aligned <= end)))
+        in_indexed = int(np.count_nonzero((indexed >= start) & (indexed <= end)))
+        ratio = count / float(max(1, in_query, in_indexed))
+        if ratio < MIN_MATCH_RATIO:
+            return None
+        return {
+            'filePath': row[0],
+            'matches': int(count),
+            'ratio': round(float(ratio), 3),
+            'offset': round(float(diff * FINGERPRINT_HOP / FINGERPRINT_SR), 3),
+            'span': round(float(span), 1)
+        }
+
+    def set_result(self, file_path, result):
+        """Remember an analysis result so confirmed duplicates can reuse it"""
+        self.conn.execute("UPDATE fp_tracks SET result = ? WHERE filePath = ?", (json.dumps(result), file_path))
+        self.conn.commit()
+
+    def get_result(self, file_path):
+        row = self.conn.execute("SELECT result FROM fp_tracks WHERE filePath = ?", (file_path,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['check']:
+        cases = check()
+        print(json.dumps({'passed': all(cases.values()), 'cases': cases}))
+        sys.exit(0 if all(cases.values()) else 1)
+    if len(sys.argv) < 3 or sys.argv[1] not in ('add', 'match'):
+        print(json.dumps({'error': 'Usage: fingerprint_index.py add <folder> | match <audio_file> [indexPath] | check'}))
+        sys.exit(1)
+
+    command = sys.argv[1]
+    target = sys.argv[2]
+    index = FingerprintIndex(sys.argv[3] if len(sys.argv) > 3 else None)
+
+    try:
+        if command == 'match':
+            hashes, offsets = fingerprint_file(target)
+            match = index.match(hashes, offsets, exclude_path=target, duration=track_duration(target))
+            print(json.dumps({'file': target, 'duplicateOf': match}))
+        else:
+            duplicates = []
+            count = 0
+            for root, dirs, files in os.walk(target):
+                for file in files:
+                    if file.lower().endswith(AUDIO_EXTENSIONS):
+                        count += 1
+                        file_path = os.path.join(root, file)
+                        print(f"[{count}] Fingerprinting: {file}", file=sys.stderr)
+                        try:
+                            hashes, offsets = fingerprint_file(file_path)
+                            duration = track_duration(file_path)
+                        except Exception as e:
+                            print(f"  skipped: {e}", file=sys.stderr)
+                            continue
+                        match = index.match(hashes, offsets, exclude_path=file_path, duration=duration)
+                        if match:
+                            duplicates.append({'file': file_path, 'duplicateOf': match})
+                        index.add(file_path, hashes, offsets, duration)
+            print(json.dumps({'indexed': count, 'duplicates': duplicates}, indent=2))
+    finally:
+        index.close()
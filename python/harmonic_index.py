@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Harmonic-mixing similarity index
+Precomputes one feature vector per analyzed track (octave-folded tempo,
+Camelot wheel position, energy) so the top-K mix-compatible tracks for a
+seed come from a single vectorized distance pass.
+
+Usage:
+  harmonic_index.py build [dbPath] [indexPath]
+  harmonic_index.py query <trackId|filePath> [k] [indexPath]
+"""
+import sys
+import os
+import json
+
+import numpy as np
+
+from library_db import app_data_dir, connect, normalize_path
+from camelot import parse_key, key_to_camelot, compatibility
+
+# Feature weights (distances are Euclidean over the weighted vector)
+TEMPO_WEIGHT = 3.0
+KEY_WEIGHT = 1.5
+MODE_WEIGHT = 0.4
+ENERGY_WEIGHT = 1.0
+
+# Folded tempos further apart than this (fraction) are not mixable
+MAX_TEMPO_DIFFERENCE = 0.08
+
+DEFAULT_K = 10
+
+
+def default_index_path():
+    return os.path.join(app_data_dir(), 'harmonic_index.npz')
+
+
+def feature_vectors(bpm, camelot_number, camelot_major, energy):
+    """
+    Vectorized feature construction.
+    bpm, camelot_number, camelot_major, energy: (n,) arrays
+    """
+    # Tempo on the log2 circle: 70, 140 and 280 BPM land on the same point
+    tempo_angle = 2 * np.pi * np.mod(np.log2(np.maximum(bpm, 1.0)), 1.0)
+    key_angle = 2 * np.pi * (camelot_number - 1) / 12.0
+
+    return np.hstack([
+        TEMPO_WEIGHT * np.cos(tempo_angle)[:, None],
+        TEMPO_WEIGHT * np.sin(tempo_angle)[:, None],
+        KEY_WEIGHT * np.cos(key_angle)[:, None],
+        KEY_WEIGHT * np.sin(key_angle)[:, None],
+        MODE_WEIGHT * (camelot_major[:, None] - 0.5),
+        ENERGY_WEIGHT * energy[:, None]
+    ]).astype(np.float32)
+
+
+def folded_tempo_difference(bpm_a, bpm_b):
+    """Relative tempo difference allowing half/double time"""
+    ratio = np.log2(np.maximum(bpm_b, 1.0) / np.maximum(bpm_a, 1.0))
+    folded = np.abs(ratio - np.round(ratio))
+    return np.power(2.0, folded) - 1.0
+
+
+class HarmonicIndex:
+    """In-memory feature matrix with vectorized top-K queries"""
+
+    def __init__(self, ids, paths, bpm, camelot_number, camelot_major, energy, features):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.paths = list(paths)
+        self.bpm = np.asarray(bpm, dtype=np.float32)
+        self.camelot_number = np.asarray(camelot_number, dtype=np.int8)
+        self.camelot_major = np.asarray(camelot_major, dtype=np.int8)
+        self.energy = np.asarray(energy, dtype=np.float32)
+        self.features = np.asarray(features, dtype=np.float32)
+        self._norms = np.einsum('ij,ij->i', self.features, self.features)
+        self._row_by_id = {int(i): n for n, i in enumerate(self.ids)}
+        self._row_by_path = {normalize_path(p): n for n, p in enumerate(self.paths)}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows: iterable of (id, filePath, bpm, key, camelotKey, energy)"""
+        ids, paths, bpms, numbers, majors, energies = [], [], [], [], [], []
+        for track_id, path, bpm, key, camelot_key, energy in rows:
+            parsed = parse_key(camelot_key) or parse_key(key)
+            try:
+                bpm = float(bpm)
+            except (TypeError, ValueError):
+                continue
+            if parsed is None or bpm <= 0:
+                continue
+            number, letter = key_to_camelot(*parsed)
+            ids.append(track_id)
+            paths.append(path)
+            bpms.append(bpm)
+            numbers.append(number)
+            majors.append(1 if letter == 'B' else 0)
+            energies.append(np.nan if energy is None else float(energy))
+
+        if not ids:
+            raise ValueError('No analyzed tracks with BPM and key found')
+
+        energies = np.array(energies, dtype=np.float64)
+        # Energy scales differ between analyzers - normalize to 0..1
+        finite = np.isfinite(energies)
+        if finite.any():
+            low, high = np.min(energies[finite]), np.max(energies[finite])
+            energies = (energies - low) / (high - low) if high > low else np.where(finite, 0.5, energies)
+        energies[~np.isfinite(energies)] = 0.5
+
+        bpms = np.array(bpms)
+        numbers = np.array(numbers)
+        majors = np.array(majors)
+        features = feature_vectors(bpms, numbers, majors, energies)
+        return cls(ids, paths, bpms, numbers, majors, energies, features)
+
+    @classmethod
+    def build(cls, db_path=None):
+        conn = connect(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT id, filePath, bpm, key, camelotKey, energy FROM tracks WHERE bpm IS NOT NULL"
+            ).fetchall()
+        finally:
+            conn.close()
+        return cls.from_rows(rows)
+
+    def save(self, index_path=None):
+        index_path = index_path or default_index_path()
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        np.savez(
+            index_path,
+            ids=self.ids,
+            paths=np.array(self.paths, dtype=str),
+            bpm=self.bpm,
+            camelot_number=self.camelot_number,
+            camelot_major=self.camelot_major,
+            energy=self.energy,
+            features=self.features
+        )
+        return index_path
+
+    @classmethod
+    def load(cls, index_path=None):
+        data = np.load(index_path or default_index_path())
+        return cls(data['ids'], data['paths'].tolist(), data['bpm'], data['camelot_number'],
+                   data['camelot_major'], data['energy'], data['features'])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_for(self, seed):
+        """Resolve a track id or file path to an index row"""
+        if isinstance(seed, (int, np.integer)) or (isinstance(seed, str) and seed.isdigit()):
+            row = self._row_by_id.get(int(seed))
+        else:
+            row = self._row_by_path.get(normalize_path(seed))
+        if row is None:
+            raise KeyError(f'Track not in harmonic index: {seed}')
+        return row
+
+    def query(self, seed, k=DEFAULT_K, compatible_only=True):
+        """
+        Top-K mix-compatible tracks for a seed track (id or path).
+        Returns a list of dicts sorted by distance.
+        """
+        row = self.row_for(seed)
+        seed_vector = self.features[row]
+
+        # ||a - b||^2 = |a|^2 + |b|^2 - 2 a.b for every track at once
+        distances = self._norms + self._norms[row] - 2.0 * (self.features @ seed_vector)
+        distances[row] = np.inf
+
+        tempo_gap = folded_tempo_difference(self.bpm[row], self.bpm)
+        if compatible_only:
+            wheel = np.abs(self.camelot_number.astype(np.int16) - self.camelot_number[row]) % 12
+            wheel = np.minimum(wheel, 12 - wheel)
+            ring = (self.camelot_major != self.camelot_major[row]).astype(np.int16)
+            key_ok = (wheel + ring) <= 1
+            distances[(tempo_gap > MAX_TEMPO_DIFFERENCE) | ~key_ok] = np.inf
+
+        k = min(k, len(distances) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(distances, k)[:k]
+        top = top[np.argsort(distances[top])]
+
+        seed_pos = (int(self.camelot_number[row]), 'B' if self.camelot_major[row] else 'A')
+        results = []
+        for n in top:
+            if not np.isfinite(distances[n]):
+                break
+            pos = (int(self.camelot_number[n]), 'B' if self.camelot_major[n] else 'A')
+            results.append({
+                'id': int(self.ids[n]),
+                'filePath': self.paths[n],
+                'bpm': round(float(self.bpm[n]), 2),
+                'camelotKey': f'{pos[0]}{pos[1]}',
+                'compatibility': compatibility(seed_pos, pos),
+                'tempoDifference': round(float(tempo_gap[n]), 4),
+                'distance': round(float(np.sqrt(max(distances[n], 0.0))), 4)
+            })
+        return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'query'):
+        print(json.dumps({'error': 'Usage: harmonic_index.py build [dbPath] [indexPath] | query <trackId|filePath> [k] [indexPath]'}))
+        sys.exit(1)
+
+    try:
+        if sys.argv[1] == 'build':
+            db_path = sys.argv[2] if len(sys.argv) > 2 else None
+            index = HarmonicIndex.build(db_path)
+            path = index.save(sys.argv[3] if len(sys.argv) > 3 else None)
+            print(json.dumps({'tracks': len(index), 'index': path}))
+        else:
+            import time
+            index = HarmonicIndex.load(sys.argv[4] if len(sys.argv) > 4 else None)
+            k = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_K
+            start = time.perf_counter()
+            matches = index.query(sys.argv[2], k)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(json.dumps({'seed': sys.argv[2], 'matches': matches, 'queryMs': round(elapsed_ms, 2)}))
+    except Exception as e:
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Import track lists from spreadsheets/CSV into batch analysis
+Reads file paths from an XLSX (openpyxl read-only mode, row by row) or
+CSV sheet in chunks, normalizes Windows paths, resolves them against
+library.db (one pass over the tracks table, not a query per row),
+drops duplicates and queues the files on a BatchRunner pool - no
+DataFrame and no process per row.
+
+The path column is the one named --column, else the first header that
+looks like a path column (path, filePath, file, location...), else the
+first column whose values look like audio file paths.
+
+Usage:
+  import_track_list.py <list.xlsx|list.csv> [--column NAME] [--sheet NAME] [--db dbPath]
+                       [--write] [--dry-run] [--workers N] [--timeout S] [--max-rss MB]
+--write stores the results in library.db (one DbWriter thread);
+--dry-run only resolves the list.
+Prints JSON-lines progress, then a {"status": "complete"} summary.
+"""
+import os
+import re
+import sys
+import csv
+import json
+import ntpath
+from urllib.parse import unquote, urlparse
+
+from library_db import connect, default_db_path, normalize_path, analysis_update, DbWriter
+from batch_analysis import BatchRunner, runner_options
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHUNK_ROWS = 1000
+PATH_HEADERS = ('filepath', 'file path', 'path', 'fullpath', 'full path', 'location', 'file', 'filename')
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.m4a', '.ogg', '.wma', '.aac', '.aif', '.aiff')
+# Rows inspected when guessing the path column from its values
+SNIFF_ROWS = 20
+
+_WINDOWS_PATH = re.compile(r'^([a-zA-Z]:[\\/]|\\\\|//[^/])')
+
+
+def normalize_track_path(value):
+    """
+    Clean a path cell: quotes/whitespace, file:// URIs, mixed separators.
+    Windows paths (drive letter or UNC) come back in ntpath form.
+    Returns None for empty cells.
+    """
+    if value is None:
+        return None
+    path = str(value).strip().strip('"\'').strip()
+    if not path:
+        return None
+    if path.lower().startswith('file:'):
+        parsed = urlparse(path)
+        path = unquote(parsed.path)
+        if parsed.netloc and parsed.netloc.lower() != 'localhost':
+            path = f'//{parsed.netloc}{path}'  # UNC share
+        elif re.match(r'^/[a-zA-Z]:', path):
+            path = path[1:]  # file:///C:/Music/...
+    if _WINDOWS_PATH.match(path):
+        return ntpath.normpath(path.replace('/', '\\'))
+    return os.path.normpath(path)
+
+
+def _looks_like_path(value):
+    text = str(value or '').strip().lower()
+    return ('\\' in text or '/' in text) and text.strip('"\'').endswith(AUDIO_EXTENSIONS)
+
+
+def _pick_column(header, sample, column=None):
+    """Index of the path column (and whether the first row is a header)"""
+    names = [str(h or '').strip().lower() for h in header]
+    if column is not None:
+        if str(column).isdigit():
+            return int(column), not any(_looks_like_path(h) for h in header)
+        if column.lower() not in names:
+            raise ValueError(f'Column not found: {column} (columns: {", ".join(map(str, header))})')
+        return names.index(column.lower()), True
+    for name in PATH_HEADERS:
+        if name in names:
+            return names.index(name), True
+    rows = [header] + sample
+    for index in range(max(len(r) for r in rows)):
+        if any(_looks_like_path(r[index]) for r in rows if index < len(r)):
+            return index, not _looks_like_path(header[index] if index < len(header) else None)
+    raise ValueError('No column with file paths found (use --column)')
+
+
+def _xlsx_rows(path, sheet=None):
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        yield worksheet.max_row  # from the sheet dimension, may be None
+        for row in worksheet.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def _csv_rows(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+        yield None
+        for row in csv.reader(f, dialect):
+            yield row
+
+
+def read_paths(path, column=None, sheet=None, chunk_rows=CHUNK_ROWS):
+    """
+    Yield (paths, rows_read, total_rows) chunk by chunk; total_rows may be None.
+    Only the current chunk is held in memory.
+    """
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        rows = _xlsx_rows(path, sheet)
+    elif path.lower().endswith(('.csv', '.tsv', '.txt')):
+        rows = _csv_rows(path)
+    else:
+        raise ValueError(f'Unsupported track list format: {os.path.basename(path)} (use .xlsx or .csv)')
+
+    total = next(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    sample = []
+    for row in rows:
+        sample.append(row)
+        if len(sample) >= SNIFF_ROWS:
+            break
+    index, has_header = _pick_column(header, sample, column)
+
+    def cell(row):
+        return normalize_track_path(row[index]) if index < len(row) else None
+
+    chunk = [] if has_header else [cell(header)]
+    read = 1
+    for row in sample:
+        chunk.append(cell(row))
+        read += 1
+    for row in rows:
+        chunk.append(cell(row))
+        read += 1
+        if len(chunk) >= chunk_rows:
+            yield [p for p in chunk if p], read, total
+            chunk = []
+    yield [p for p in chunk if p], read, total
+
+
+def library_paths(db_path=None):
+    """{normalized path: (track id, stored filePath)} from one pass over tracks"""
+    db_path = db_path or default_db_path()
+    if not os.path.exists(db_path):
+        return {}
+    conn = connect(db_path)
+    try:
+        tracks = {}
+        for track_id, file_path, path in conn.execute("SELECT id, filePath, path FROM tracks"):
+            for candidate in (file_path, path):
+                if candidate:
+                    tracks.setdefault(normalize_path(candidate), (track_id, file_path or path))
+        return tracks
+    finally:
+        conn.close()
+
+
+def emit(payload):
+    print(json.dumps(payload))
+    sys.stdout.flush()
+
+
+def import_track_list(list_path, column=None, sheet=None, db_path=None, write=False, dry_run=False,
+                      **runner_kwargs):
+    tracks = library_paths(db_path)
+    seen = set()
+    queued = []  # (path, track id or None)
+    summary = {'rows': 0, 'duplicates': 0, 'missing': [], 'notInLibrary': 0}
+
+    # Stage 1: stream the sheet, resolve and dedupe (0-10%)
+    for paths, rows_read, total in read_paths(list_path, column, sheet):
+        summary['rows'] = rows_read
+        for path in paths:
+            key = normalize_path(path)
+            track = tracks.get(key)
+            if track is not None:
+                key = ('track', track[0])
+            if key in seen:
+                summary['duplicates'] += 1
+                continue
+            seen.add(key)
+            if track is not None:
+                queued.append((track[1], track[0]))
+            elif os.path.exists(path):
+                summary['notInLibrary'] += 1
+                queued.append((path, None))
+            else:
+                summary['missing'].append(path)
+        emit({
+            'status': 'reading',
+            'progress': int(10 * rows_read / total) if total else 0,
+            'message': f'Read {rows_read} rows, {len(queued)} files queued'
+        })
+
+    summary['queued'] = len(queued)
+    if dry_run or not queued:
+        emit(dict(summary, status='complete', progress=100, analyzed=0, failed=[]))
+        return summary
+
+    # Stage 2: analyze on the worker pool (10-100%), results through one writer
+    runner = BatchRunner('analyze_audio:detect_bpm_and_key', sys_paths=[ROOT_DIR], **runner_kwargs)
+    track_ids = {}
+    for path, track_id in queued:
+        track_ids[path] = track_id
+        runner.submit(path, path)
+
+    writer = DbWriter(db_path) if write and tracks else None
+    analyzed = 0
+    failed = []
+    results = []
+    try:
+        for done, (path, result) in enumerate(runner.results(), 1):
+            if 'error' in result:
+                failed.append({'filePath': path, 'error': result['error'], 'failure': result.get('failure')})
+            else:
+                analyzed += 1
+                if writer is not None and track_ids[path] is not None:
+                    assignments, params = analysis_update(result)
+                    writer.execute(f"UPDATE tracks SET {assignments} WHERE id=?", params + [track_ids[path]])
+            results.append(dict(result, filePath=path, trackId=track_ids[path]))
+            emit({
+                'status': 'analyzing',
+                'progress': 10 + int(90 * done / len(queued)),
+                'message': f'Analyzed {done}/{len(queued)}: {os.path.basename(path)}'
+            })
+    finally:
+        if writer is not None:
+            writer.close()
+
+    summary.update(analyzed=analyzed, failed=failed, written=write and writer is not None)
+    emit(dict(summary, status='complete', progress=100, results=results))
+    return summary
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    options = runner_options(argv)
+    for flag in ('--column', '--sheet', '--db'):
+        if flag in argv:
+            position = argv.index(flag)
+            options[flag[2:]] = argv[position + 1]
+            del argv[position:position + 2]
+    args = [a for a in argv if not a.startswith('--')]
+    if not args:
+        print(json.dumps({'error': 'Usage: import_track_list.py <list.xlsx|list.csv> [--column NAME] [--sheet NAME] '
+                                   '[--db dbPath] [--write] [--dry-run] [--workers N] [--timeout S] [--max-rss MB]'}))
+        sys.exit(1)
+
+    try:
+        import_track_list(
+            args[0],
+            column=options.pop('column', None),
+            sheet=options.pop('sheet', None),
+            db_path=options.pop('db', None),
+            write='--write' in argv,
+            dry_run='--dry-run' in argv,
+            **options
+        )
+    except Exception as e:
+        emit({'status': 'error', 'error': str(e)})
+        sys.exit(1)
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Unified job scheduler for analysis, stem separation, transcription and keylock rendering
+One asyncio supervisor process owns every Python worker, so a library
+scan, a stem job and a transcription no longer fight over the same cores.
+
+Each job class has its own concurrency limit. Interactive jobs are always
+dequeued before background jobs and may use INTERACTIVE_RESERVE extra
+slots per class, so they never wait behind a long background scan.
+Background workers also run at lower OS priority.
+
+Analyze, stems and transcribe jobs run on long-lived workers: the
+existing scripts in --batch mode (analyze_audio.py, separate_stems.py,
+transcribe_audio.py), one job at a time each, at most limit + reserve per
+class. A worker imports librosa/torch once and keeps its loaded Demucs or
+Whisper models for the next job. Workers are kept per priority (background
+ones niced), and retire after WORKER_IDLE_SECONDS without work.
+Cancelling a running job kills only the worker running it; the next job
+starts a fresh one. Keylock jobs (keylock_render.py prepare, no model to
+keep) run as one process each. Progress lines are relayed tagged with the
+job id.
+
+Protocol (one JSON object per stdin line):
+  {"op": "submit", "id": "j1", "kind": "analyze|stems|transcribe|keylock",
+   "priority": "interactive|background", "args": {...}}
+  {"op": "cancel", "id": "j1"}
+  {"op": "status"}
+  {"op": "shutdown"}
+
+args per kind:
+  analyze:    {"file": ..., "structure": false, "key_segments": false}
+  stems:      {"input_file": ..., "output_dir": ..., "stems_mode": "4stems",
+               "format": ..., "quality": ..., "cpu_accel": false, "cache": true}
+  transcribe: transcribe_audio.py's JSON config
+  keylock:    keylock_render.py's prepare config (a set's tracks and stems)
+"""
+import os
+import sys
+import json
+import heapq
+import asyncio
+import itertools
+from collections import deque
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PRIORITIES = {'interactive': 0, 'background': 1}
+
+# Concurrent jobs per class (background), plus slots only interactive jobs may use
+CLASS_LIMITS = {
+    'analyze': max(1, (os.cpu_count() or 2) // 2),
+    'stems': 1,
+    'transcribe': 1,
+    'keylock': 1,
+}
+INTERACTIVE_RESERVE = 1
+
+# stderr lines kept per job for error reports
+STDERR_TAIL = 20
+# Max JSON line from a worker (complete transcriptions are large)
+STREAM_LIMIT = 64 * 1024 * 1024
+
+# Lower scheduling priority for background workers
+BACKGROUND_NICE = 10
+BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+
+# Idle long-lived workers exit after this long (frees their models' memory)
+WORKER_IDLE_SECONDS = 600
+
+
+def analyze_worker():
+    return [os.path.join(os.path.dirname(SCRIPT_DIR), 'analyze_audio.py'), '--batch']
+
+
+def analyze_job(args):
+    return {'file': args['file'], 'structure': bool(args.get('structure')),
+            'key_segments': bool(args.get('key_segments'))}
+
+
+def stems_worker():
+    return [os.path.join(SCRIPT_DIR, 'separate_stems.py'), '--batch']
+
+
+def stems_job(args):
+    # separate_stems.py --batch takes the submit args as they are
+    return dict(args, stems_mode=args.get('stems_mode', '4stems'))
+
+
+def transcribe_worker():
+    return [os.path.join(SCRIPT_DIR, 'transcribe_audio.py'), '--batch']
+
+
+def transcribe_job(args):
+    return args
+
+
+def keylock_command(args):
+    return [os.path.join(SCRIPT_DIR, 'keylock_render.py'), 'prepare', '--json'], json.dumps(args) + '\n'
+
+
+# Long-lived --batch workers: (worker argv, job line for the submit args)
+WORKERS = {
+    'analyze': (analyze_worker, analyze_job),
+    'stems': (stems_worker, stems_job),
+    'transcribe': (transcribe_worker, transcribe_job),
+}
+
+# One process per job: (argv, stdin text)
+COMMANDS = {
+    'keylock': keylock_command,
+}
+
+KINDS = tuple(WORKERS) + tuple(COMMANDS)
+
+
+class Job:
+    def __init__(self, job_id, kind, priority, args):
+        self.id = job_id
+        self.kind = kind
+        self.priority = priority
+        self.args = args
+        self.state = 'queued'
+        self.process = None
+
+
+class Worker:
+    """
+    One long-lived --batch script. Jobs are sent one at a time; the script
+    numbers them 1, 2, ... and tags its output lines with that number.
+    """
+
+    def __init__(self, kind, priority, process):
+        self.kind = kind
+        self.priority = priority
+        self.process = process
+        self.job = None
+        self.sent = 0
+        self.done = None
+        self.finished = False
+        self.idle_timer = None
+        self.stderr_tail = deque(maxlen=STDERR_TAIL)
+
+    @property
+    def alive(self):
+        return self.process.returncode is None
+
+
+def relay_payload(kind, payload):
+    """Worker output line -> scheduler event fields (analyze prints one bare result)"""
+    if kind == 'analyze':
+        return ({'status': 'error', 'error': payload['error']} if 'error' in payload
+                else {'status': 'complete', 'progress': 100, 'result': payload})
+    return payload
+
+
+class JobScheduler:
+    def __init__(self, limits=None, reserve=INTERACTIVE_RESERVE, emit=None, idle_seconds=WORKER_IDLE_SECONDS):
+        self.limits = dict(CLASS_LIMITS, **(limits or {}))
+        self.reserve = reserve
+        self.emit = emit or self._print
+        self.idle_seconds = idle_seconds
+        self.queues = {kind: [] for kind in KINDS}
+        self.running = {kind: set() for kind in KINDS}
+        self.workers = {kind: [] for kind in WORKERS}
+        self.jobs = {}
+        self.tasks = set()
+        self._seq = itertools.count()
+
+    @staticmethod
+    def _print(payload):
+        print(json.dumps(payload))
+        sys.stdout.flush()
+
+    def submit(self, job_id, kind, priority='background', args=None):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown job kind: {kind}')
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority: {priority}')
+        if job_id in self.jobs and self.jobs[job_id].state in ('queued', 'running'):
+            raise ValueError(f'Job already active: {job_id}')
+        job = Job(job_id, kind, priority, args or {})
+        self.jobs[job_id] = job
+        heapq.heappush(self.queues[kind], (PRIORITIES[priority], next(self._seq), job))
+        self.emit({'id': job_id, 'kind': kind, 'status': 'queued',
+                   'position': len(self.queues[kind]), 'priority': priority})
+        self._dispatch(kind)
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.state not in ('queued', 'running'):
+            return False
+        if job.state == 'running' and job.process is not None and job.process.returncode is None:
+            job.process.kill()  # a long-lived worker is replaced for the next job
+        job.state = 'cancelled'  # queued jobs are skipped when popped
+        self.emit({'id': job_id, 'kind': job.kind, 'status': 'cancelled'})
+        return True
+
+    def status(self):
+        return {
+            'status': 'scheduler',
+            'running': {kind: sorted(j.id for j in jobs) for kind, jobs in self.running.items()},
+            'queued': {kind: sum(1 for _, _, j in queue if j.state == 'queued')
+                       for kind, queue in self.queues.items()},
+            'workers': {kind: len(workers) for kind, workers in self.workers.items()},
+            'limits': self.limits,
+        }
+
+    def _has_slot(self, kind, priority):
+        limit = self.limits[kind] + (self.reserve if priority == 'interactive' else 0)
+        return len(self.running[kind]) < limit
+
+    def _dispatch(self, kind):
+        queue = self.queues[kind]
+        while queue:
+            _, _, job = queue[0]
+            if job.state != 'queued':
+                heapq.heappop(queue)
+                continue
+            if not self._has_slot(kind, job.priority):
+                break
+            heapq.heappop(queue)
+            job.state = 'running'
+            self.running[kind].add(job)
+            self._track(self._run_on_worker(job) if kind in WORKERS else self._run(job))
+
+    def _track(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _exec(self, argv, priority, stdin):
+        kwargs = {}
+        if priority == 'background':
+            if os.name == 'nt':
+                kwargs['creationflags'] = BELOW_NORMAL_PRIORITY_CLASS
+            else:
+                kwargs['preexec_fn'] = lambda: os.nice(BACKGROUND_NICE)
+        return await asyncio.create_subprocess_exec(
+            sys.executable, *argv,
+            stdin=stdin,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=SCRIPT_DIR,
+            limit=STREAM_LIMIT,
+            **kwargs
+        )
+
+    async def _spawn(self, job):
+        argv, stdin_text = COMMANDS[job.kind](job.args)
+        process = await self._exec(argv, job.priority,
+                                   asyncio.subprocess.PIPE if stdin_text else asyncio.subprocess.DEVNULL)
+        if stdin_text:
+            process.stdin.write(stdin_text.encode('utf-8'))
+            await process.stdin.drain()
+            process.stdin.close()
+        return process
+
+    @staticmethod
+    async def _drain_stderr(process, tail):
+        async for line in process.stderr:
+            tail.append(line.decode('utf-8', 'replace').rstrip())
+
+    @staticmethod
+    def _parse(raw):
+        """One worker stdout line as a dict, or None for blank lines and log noise"""
+        line = raw.decode('utf-8', 'replace').strip()
+        if not line:
+            return None
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            return None  # library log noise on stdout
+        return payload if isinstance(payload, dict) else None
+
+    async def _run(self, job):
+        """One-process job (COMMANDS)"""
+        stderr_tail = deque(maxlen=STDERR_TAIL)
+        finished = False
+        try:
+            job.process = await self._spawn(job)
+            if job.state == 'cancelled':
+                job.process.kill()
+            else:
+                self.emit({'id': job.id, 'kind': job.kind, 'status': 'started'})
+
+            stderr_task = asyncio.ensure_future(self._drain_stderr(job.process, stderr_tail))
+            async for raw in job.process.stdout:
+                payload = self._parse(raw)
+                if payload is None or job.state == 'cancelled':
+                    continue
+                payload.update(id=job.id, kind=job.kind)
+                finished = finished or payload.get('status') in ('complete', 'error')
+                self.emit(payload)
+            await job.process.wait()
+            await stderr_task
+
+            if job.state != 'cancelled' and not finished:
+                error = '\n'.join(stderr_tail) or f'Worker exited with code {job.process.returncode}'
+                self.emit({'id': job.id, 'kind': job.kind, 'status': 'error', 'error': error})
+        except Exception as e:
+            if job.state != 'cancelled':
+                self.emit({'id': job.id, 'kind': job.kind, 'status': 'error', 'error': str(e)})
+        finally:
+            if job.state != 'cancelled':
+                job.state = 'done'
+            self.running[job.kind].discard(job)
+            self._dispatch(job.kind)
+
+    async def _start_worker(self, kind, priority):
+        process = await self._exec(WORKERS[kind][0](), priority, asyncio.subprocess.PIPE)
+        worker = Worker(kind, priority, process)
+        self.workers[kind].append(worker)
+        self._track(self._drain_stderr(process, worker.stderr_tail))
+        self._track(self._read_worker(worker))
+        return worker
+
+    async def _acquire_worker(self, job):
+        """An idle worker of the job's class and priority, else a new one"""
+        pool = self.workers[job.kind]
+        for worker in pool:
+            if worker.job is None and worker.priority == job.priority and worker.alive:
+                worker.job = job
+                return worker
+        # At the class's process cap, the idle worker of the other priority makes room
+        idle = [w for w in pool if w.job is None]
+        while idle and len(pool) >= self.limits[job.kind] + self.reserve:
+            self._retire(idle.pop(0))
+        worker = await self._start_worker(job.kind, job.priority)
+        worker.job = job
+        return worker
+
+    def _retire(self, worker):
+        """Let an idle worker exit (its --batch loop ends at EOF on stdin)"""
+        if worker in self.workers[worker.kind]:
+            self.workers[worker.kind].remove(worker)
+        if worker.idle_timer is not None:
+            worker.idle_timer.cancel()
+        if worker.alive and not worker.process.stdin.is_closing():
+            worker.process.stdin.close()
+
+    def _retire_if_idle(self, worker):
+        if worker.job is None:
+            self._retire(worker)
+
+    async def _read_worker(self, worker):
+        """Relay a worker's lines to the job it is running (until the worker exits)"""
+        try:
+            async for raw in worker.process.stdout:
+                payload = self._parse(raw)
+                job = worker.job
+                if payload is None or job is None or payload.pop('job', None) != worker.sent:
+                    continue  # batch_complete, profile and stale lines
+                if job.state == 'cancelled' or worker.finished:
+                    continue
+                payload = relay_payload(worker.kind, payload)
+                payload.update(id=job.id, kind=job.kind)
+                self.emit(payload)
+                if payload.get('status') in ('complete', 'error'):
+                    worker.finished = True
+                    if worker.done is not None and not worker.done.done():
+                        worker.done.set_result(True)
+        finally:
+            await worker.process.wait()
+            if worker.done is not None and not worker.done.done():
+                worker.done.set_result(False)
+            if worker in self.workers[worker.kind]:
+                self.workers[worker.kind].remove(worker)
+
+    async def _run_on_worker(self, job):
+        """Long-lived worker job (WORKERS)"""
+        worker = None
+        try:
+            worker = await self._acquire_worker(job)
+            if worker.idle_timer is not None:
+                worker.idle_timer.cancel()
+                worker.idle_timer = None
+            job.process = worker.process
+            if job.state == 'cancelled':
+                worker.process.kill()
+                return
+            worker.sent += 1
+            worker.finished = False
+            worker.stderr_tail.clear()
+            worker.done = asyncio.get_running_loop().create_future()
+            self.emit({'id': job.id, 'kind': job.kind, 'status': 'started'})
+
+            line = json.dumps(WORKERS[job.kind][1](job.args)) + '\n'
+            worker.process.stdin.write(line.encode('utf-8'))
+            await worker.process.stdin.drain()
+            finished = await worker.done
+
+            if not finished and job.state != 'cancelled':
+                await worker.process.wait()
+                error = '\n'.join(worker.stderr_tail) or f'Worker exited with code {worker.process.returncode}'
+                self.emit({'id': job.id, 'kind': job.kind, 'status': 'error', 'error': error})
+        except Exception as e:
+            if job.state != 'cancelled':
+                self.emit({'id': job.id, 'kind': job.kind, 'status': 'error', 'error': str(e)})
+            if worker is not None and worker.alive:
+                worker.process.kill()  # its state is unknown now
+        finally:
+            if job.state != 'cancelled':
+                job.state = 'done'
+            if worker is not None:
+                worker.job = None
+                worker.done = None
+                if worker.alive and worker in self.workers[worker.kind]:
+                    worker.idle_timer = asyncio.get_running_loop().call_later(
+                        self.idle_seconds, self._retire_if_idle, worker)
+            self.running[job.kind].discard(job)
+            self._dispatch(job.kind)
+
+    async def shutdown(self, cancel_running=True):
+        if cancel_running:
+            for job in list(self.jobs.values()):
+                self.cancel(job.id)
+        else:
+            # Let queued and running jobs finish first
+            while any(self.running.values()) or any(
+                    j.state == 'queued' for queue in self.queues.values() for _, _, j in queue):
+                await asyncio.sleep(0.1)
+        for workers in self.workers.values():
+            for worker in list(workers):
+                self._retire(worker)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def serve(scheduler):
+    """Read commands from stdin (on a thread, which also works on Windows pipes)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+        if not line.strip():
+            continue
+        try:
+            command = json.loads(line)
+            op = command.get('op')
+            if op == 'submit':
+                scheduler.submit(command['id'], command['kind'], command.get('priority', 'background'),
+                                 command.get('args'))
+            elif op == 'cancel':
+                if not scheduler.cancel(command['id']):
+                    scheduler.emit({'id': command['id'], 'status': 'error', 'error': 'No active job with that id'})
+            elif op == 'status':
+                scheduler.emit(scheduler.status())
+            elif op == 'shutdown':
+                break
+            else:
+                raise ValueError(f'Unknown op: {op}')
+        except Exception as e:
+            scheduler.emit({'status': 'error', 'error': str(e)})
+    await scheduler.shutdown()
+    scheduler.emit({'status': 'shutdown'})
+
+
+def main():
+    asyncio.run(serve(JobScheduler()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Windowed key tracking
+Follows key changes/modulations by scoring all 24 keys over a sliding
+chroma window and smoothing the key path with a Viterbi pass.
+"""
+import numpy as np
+
+KEY_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Krumhansl-Schmuckler key profiles (same as detect_bpm_and_key)
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+# Default window/hop for tracking (seconds)
+WINDOW_SECONDS = 12.0
+STEP_SECONDS = 2.0
+
+# Cost of changing key between consecutive windows (in correlation units)
+SWITCH_PENALTY = 0.35
+
+
+def key_templates():
+    """
+    24 z-normalized key templates, rows ordered C major, C minor, C# major, ...
+    Returns (templates (24, 12), keys [(name, mode), ...])
+    """
+    rows = []
+    keys = []
+    for rotation in range(12):
+        for profile, mode in ((MAJOR_PROFILE, 'major'), (MINOR_PROFILE, 'minor')):
+            rows.append(np.roll(profile, rotation))
+            keys.append((KEY_NAMES[rotation], mode))
+    templates = np.array(rows, dtype=np.float64)
+    templates -= templates.mean(axis=1, keepdims=True)
+    templates /= templates.std(axis=1, keepdims=True)
+    return templates, keys
+
+
+def score_keys(chroma, templates=None):
+    """
+    Pearson correlation of every chroma column against all 24 keys in
+    one matrix product. chroma: (12,) or (12, n). Returns (24,) or (24, n).
+    templates: key_templates()[0], for callers scoring many times
+    """
+    if templates is None:
+        templates, _ = key_templates()
+    chroma = np.asarray(chroma, dtype=np.float64)
+    z = chroma - chroma.mean(axis=0, keepdims=True)
+    z /= z.std(axis=0, keepdims=True) + 1e-9
+    return templates @ z / 12.0
+
+
+def windowed_chroma(chromagram, window_frames, step_frames):
+    """
+    Mean chroma over sliding windows using cumulative sums (O(1) per window).
+    Returns (12, n_windows) and the start frame of each window.
+    """
+    n = chromagram.shape[1]
+    window_frames = max(1, min(int(window_frames), n))
+    step_frames = max(1, int(step_frames))
+    starts = np.arange(0, max(1, n - window_frames + 1), step_frames)
+    if starts[-1] + window_frames < n:
+        starts = np.append(starts, n - window_frames)
+
+    cumsum = np.zeros((chromagram.shape[0], n + 1), dtype=np.float64)
+    np.cumsum(chromagram, axis=1, out=cumsum[:, 1:])
+    sums = cumsum[:, starts + window_frames] - cumsum[:, starts]
+    return sums / window_frames, starts
+
+
+def viterbi_path(scores, switch_penalty=SWITCH_PENALTY):
+    """
+    Best key path through per-window scores (24, n) where staying in a key
+    is free and switching costs switch_penalty.
+    """
+    n_states, n = scores.shape
+    transition = np.full((n_states, n_states), -switch_penalty)
+    np.fill_diagonal(transition, 0.0)
+
+    value = scores[:, 0].copy()
+    backpointer = np.zeros((n_states, n), dtype=np.int32)
+    for t in range(1, n):
+        candidates = value[:, np.newaxis] + transition  # from x to
+        backpointer[:, t] = np.argmax(candidates, axis=0)
+        value = candidates[backpointer[:, t], np.arange(n_states)] + scores[:, t]
+
+    path = np.zeros(n, dtype=np.int32)
+    path[-1] = int(np.argmax(value))
+    for t in range(n - 1, 0, -1):
+        path[t - 1] = backpointer[path[t], t]
+    return path
+
+
+def track_keys(chromagram, sr, hop_length, window_seconds=WINDOW_SECONDS,
+               step_seconds=STEP_SECONDS, switch_penalty=SWITCH_PENALTY):
+    """
+    Segment a track into keys from an existing chromagram.
+    Returns {'keySegments': [...], 'dominantKey': {...}, 'keyChanges': n}
+    """
+    frame_seconds = hop_length / float(sr)
+    n_frames = chromagram.shape[1]
+    duration = n_frames * frame_seconds
+    if n_frames == 0:
+        return {'keySegments': [], 'dominantKey': None, 'keyChanges': 0}
+
+    window_frames = int(round(window_seconds / frame_seconds))
+    step_frames = int(round(step_seconds / frame_seconds))
+    windows, starts = windowed_chroma(chromagram, window_frames, step_frames)
+
+    scores = score_keys(windows)
+    path = viterbi_path(scores, switch_penalty)
+    _, keys = key_templates()
+
+    # Window centres decide where one key hands over to the next
+    centres = (starts + min(window_frames, n_frames) / 2.0) * frame_seconds
+    change_points = np.flatnonzero(np.diff(path)) + 1
+    bounds = np.concatenate([[0], change_points, [len(path)]])
+
+    segments = []
+    for seg_start, seg_end in zip(bounds[:-1], bounds[1:]):
+        state = int(path[seg_start])
+        name, mode = keys[state]
+        start_time = 0.0 if seg_start == 0 else (centres[seg_start - 1] + centres[seg_start]) / 2.0
+        end_time = duration if seg_end == len(path) else (centres[seg_end - 1] + centres[seg_end]) / 2.0
+        segments.append({
+            'start': round(float(start_time), 3),
+            'end': round(float(end_time), 3),
+            'key': name,
+            'mode': mode,
+            'confidence': round(float(max(0.0, scores[state, seg_start:seg_end].mean())), 3)
+        })
+
+    # Dominant key = longest total time across segments
+    totals = {}
+    for segment in segments:
+        k = (segment['key'], segment['mode'])
+        totals[k] = totals.get(k, 0.0) + segment['end'] - segment['start']
+    dominant = max(totals, key=totals.get)
+
+    return {
+        'keySegments': segments,
+        'dominantKey': {
+            'key': dominant[0],
+            'mode': dominant[1],
+            'coverage': round(float(totals[dominant] / max(duration, 1e-6)), 3)
+        },
+        'keyChanges': len(segments) - 1
+    }
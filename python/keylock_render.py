@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Keylock pre-rendering of pitch-shifted / time-stretched stems
+Harmonic mixing needs stems moved by a semitone or two and stretched to
+the set's tempo, which is too slow to do at play time. Variants are
+rendered ahead of time with a vectorized phase vocoder and cached.
+
+The phase vocoder works block by block: the input is decoded in blocks,
+STFT frames are computed for BLOCK_FRAMES output frames at a time (one
+FFT call per block, all channels together), phases are advanced with a
+cumulative sum over the block instead of a per-frame loop, and output
+frames are overlap-added into a short carried tail. Memory stays bounded
+by the block size whatever the stem length, and the result matches
+librosa.effects.time_stretch / pitch_shift (pitch = stretch by the pitch
+ratio, then resample with a streaming soxr resampler).
+
+Renders are cached by (stem audio hash, semitones, stretch ratio) in a
+StemCache-layout store (see stem_cache.py) under keylock_cache/, as
+float16 (channels, samples) arrays that load with np.load(mmap_mode='r');
+least recently used variants are evicted beyond DEFAULT_MAX_BYTES (by
+prepare, once the whole set is rendered, never evicting the set's own).
+
+Usage:
+  keylock_render.py render <stem_file> [--semitones N] [--ratio R | --bpm FROM TO]
+      ratio = output/input duration (FROM/TO when given as BPMs)
+  keylock_render.py prepare --json   (one stdin line:
+      {"tracks": [{"id": 12, "stems": {"vocals": path, ...}}, ...],
+       "bpm": target (default: first track), "maxShift": 2,
+       "db": dbPath, "workers": N})
+      key-matches each track to the one before it (Camelot, using the
+      tracks table's key/bpm) and renders every stem's variant
+Prints JSON-lines progress, then a {"status": "complete"} result.
+"""
+import os
+import sys
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from audio_decode import iter_blocks, QUALITY_TIERS
+from camelot import parse_key, key_to_camelot, camelot_distance
+from content_hash import audio_content_hash
+from library_db import app_data_dir, connect
+from stem_cache import StemCache
+
+N_FFT = 2048
+HOP_LENGTH = 512
+# Output STFT frames synthesized per vectorized block
+BLOCK_FRAMES = 256
+
+# Sample rate of .npy stems (Demucs models run at 44.1 kHz)
+STEM_SR = 44100
+RESAMPLE_QUALITY = 'high'
+
+# Cache "model" name and size budget for rendered variants
+RENDER_MODEL = 'keylock-pv'
+RENDER_SOURCE = 'render'
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+# Key matching: largest shift tried, and the Camelot distance that counts as matched
+DEFAULT_MAX_SHIFT = 2
+MATCHED_DISTANCE = 1
+
+DEFAULT_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+def default_cache_root():
+    return os.path.join(app_data_dir(), 'keylock_cache')
+
+
+def render_params(semitones, ratio):
+    """Cache key parameters; the ratio is rounded so equal BPM pairs share entries"""
+    return {'semitones': int(semitones), 'ratio': round(float(ratio), 4),
+            'nFft': N_FFT, 'hop': HOP_LENGTH, 'quality': RESAMPLE_QUALITY}
+
+
+class PhaseVocoder:
+    """
+    Streaming librosa.phase_vocoder + istft: feed (channels, n) blocks,
+    get stretched (channels, m) blocks back. stretch = output/input duration.
+    """
+
+    def __init__(self, channels, stretch, n_fft=N_FFT, hop_length=HOP_LENGTH, block_frames=BLOCK_FRAMES):
+        from scipy.signal import get_window
+
+        if n_fft % hop_length:
+            raise ValueError('n_fft must be a multiple of hop_length')
+        self.channels = channels
+        self.rate = 1.0 / stretch
+        self.n_fft = n_fft
+        self.hop = hop_length
+        self.overlap = n_fft // hop_length
+        self.block_frames = block_frames
+        self.window = get_window('hann', n_fft, fftbins=True).astype(np.float32)
+        self.window_sq = (self.window.astype(np.float64) ** 2).reshape(self.overlap, hop_length)
+        self.phi_advance = np.linspace(0, np.pi * hop_length, 1 + n_fft // 2)
+
+        # Input in padded coordinates (centered STFT: n_fft // 2 leading zeros)
+        self.buffer = np.zeros((channels, n_fft // 2), dtype=np.float32)
+        self.buffer_start = 0
+        self.input_length = 0
+        self.next_frame = 0
+        self.phase = None
+        # Overlap-add samples (and window sums) past the last completed output
+        self.tail = np.zeros((channels, n_fft - hop_length), dtype=np.float64)
+        self.tail_norm = np.zeros(n_fft - hop_length)
+        self.trim = n_fft // 2
+
+    def _spectra(self, first, count, n_frames=None):
+        """STFT frames first..first+count-1 of the buffered input (zero past n_frames)"""
+        import scipy.fft
+        start = first * self.hop - self.buffer_start
+        needed = start + (count - 1) * self.hop + self.n_fft
+        segment = self.buffer[:, start:needed]
+        if segment.shape[1] < needed - start:
+            segment = np.pad(segment, ((0, 0), (0, needed - start - segment.shape[1])))
+        frames = np.lib.stride_tricks.sliding_window_view(segment, self.n_fft, axis=-1)[:, ::self.hop]
+        spectra = scipy.fft.rfft(frames * self.window, axis=-1)
+        if n_frames is not None and first + count > n_frames:
+            spectra[:, max(0, n_frames - first):] = 0
+        return spectra
+
+    def _synthesize(self, j0, j1, n_frames=None):
+        """Output frames j0..j1-1 -> completed output samples"""
+        import scipy.fft
+        steps = np.arange(j0, j1) * self.rate
+        columns = np.floor(steps).astype(np.int64)
+        alpha = (steps - columns)[:, np.newaxis]
+        spectra = self._spectra(columns[0], columns[-1] - columns[0] + 2, n_frames)
+        # Magnitude/angle once per input frame, then gathered per output frame
+        magnitudes = np.abs(spectra)
+        angles = np.angle(spectra)
+        left = columns - columns[0]
+
+        magnitude = (1.0 - alpha) * magnitudes[:, left] + alpha * magnitudes[:, left + 1]
+        dphase = angles[:, left + 1] - angles[:, left] - self.phi_advance
+        dphase -= 2.0 * np.pi * np.round(dphase / (2.0 * np.pi))
+        advance = self.phi_advance + dphase
+        if self.phase is None:
+            self.phase = angles[:, 0].astype(np.float64)
+        # Phase of each frame = running phase + advances of the frames before it
+        phases = np.cumsum(advance, axis=1)
+        phases -= advance
+        phases += self.phase[:, np.newaxis]
+        self.phase = np.mod(phases[:, -1] + advance[:, -1], 2.0 * np.pi)
+
+        # Synthesis in single precision; only the phase accumulator needs float64
+        phases = phases.astype(np.float32)
+        spectrum = np.empty(phases.shape, dtype=np.complex64)
+        np.multiply(magnitude, np.cos(phases), out=spectrum.real)
+        np.multiply(magnitude, np.sin(phases), out=spectrum.imag)
+        frames = scipy.fft.irfft(spectrum, n=self.n_fft, axis=-1) * self.window
+        count = j1 - j0
+        segments = count + self.overlap - 1
+        output = np.zeros((self.channels, segments, self.hop))
+        norm = np.zeros((segments, self.hop))
+        carried = self.tail.shape[1] // self.hop
+        output[:, :carried] = self.tail.reshape(self.channels, carried, self.hop)
+        norm[:carried] = self.tail_norm.reshape(carried, self.hop)
+        for r in range(self.overlap):
+            output[:, r:r + count] += frames[:, :, r * self.hop:(r + 1) * self.hop]
+            norm[r:r + count] += self.window_sq[r]
+
+        output = output.reshape(self.channels, -1)
+        norm = norm.reshape(-1)
+        done = count * self.hop
+        self.tail = output[:, done:].copy()
+        self.tail_norm = norm[done:].copy()
+        return self._normalize(output[:, :done], norm[:done])
+
+    def _normalize(self, samples, norm):
+        nonzero = norm > np.finfo(np.float32).tiny
+        samples[:, nonzero] /= norm[nonzero]
+        if self.trim:
+            drop = min(self.trim, samples.shape[1])
+            samples = samples[:, drop:]
+            self.trim -= drop
+        return samples.astype(np.float32)
+
+    def _run(self, frame_limit, n_frames=None):
+        blocks = []
+        while self.next_frame < frame_limit:
+            j1 = min(frame_limit, self.next_frame + self.block_frames)
+            blocks.append(self._synthesize(self.next_frame, j1, n_frames))
+            self.next_frame = j1
+            # Input before the next frame's left column is no longer needed
+            keep = int(math.floor(self.next_frame * self.rate)) * self.hop
+            if keep > self.buffer_start:
+                self.buffer = self.buffer[:, keep - self.buffer_start:]
+                self.buffer_start = keep
+        return np.concatenate(blocks, axis=1) if blocks else np.zeros((self.channels, 0), dtype=np.float32)
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        self.buffer = np.concatenate([self.buffer, block], axis=1)
+        self.input_length += block.shape[1]
+        # Output frame j needs input frames floor(j * rate) and the one after it
+        complete = (self.buffer_start + self.buffer.shape[1] - self.n_fft) // self.hop + 1
+        frame_limit = max(0, int(math.ceil((complete - 1) / self.rate)))
+        return self._run(frame_limit)
+
+    def finish(self):
+        """Remaining output, including the overlap-add tail"""
+        n_frames = 1 + self.input_length // self.hop
+        self.buffer = np.pad(self.buffer, ((0, 0), (0, self.n_fft // 2)))
+        total = len(np.arange(0, n_frames, self.rate))
+        output = self._run(total, n_frames)
+        tail = self._normalize(self.tail, self.tail_norm)
+        self.tail = self.tail[:, :0]
+        return np.concatenate([output, tail], axis=1)
+
+
+def stem_source(stem_path):
+    """(samplerate, channels, frames, (channels, n) block iterator) for a stem file"""
+    if stem_path.endswith('.npy'):
+        data = np.load(stem_path, mmap_mode='r')
+        if data.ndim == 1:
+            data = data[np.newaxis, :]
+        step = 1 << 16
+        blocks = (np.asarray(data[:, i:i + step], dtype=np.float32) for i in range(0, data.shape[1], step))
+        return STEM_SR, data.shape[0], data.shape[1], blocks
+
+    import soundfile as sf
+    info = sf.info(stem_path)
+    blocks = (block.T for block in iter_blocks(stem_path, mono=False))
+    return info.samplerate, info.channels, info.frames, blocks
+
+
+def render_blocks(blocks, samplerate, channels, semitones=0, ratio=1.0):
+    """
+    Pitch-shift by `semitones` and stretch to `ratio` x the duration, block
+    by block. Pitch shifting stretches by the pitch factor as well and then
+    resamples back, as librosa.effects.pitch_shift does.
+    """
+    pitch = 2.0 ** (semitones / 12.0)
+    vocoder = PhaseVocoder(channels, ratio * pitch)
+    resampler = None
+    if semitones:
+        import soxr
+        resampler = soxr.ResampleStream(samplerate * pitch, samplerate, channels, dtype='float32',
+                                        quality=QUALITY_TIERS[RESAMPLE_QUALITY])
+
+    def resampled(output, last=False):
+        if resampler is None:
+            return output
+        return np.ascontiguousarray(resampler.resample_chunk(np.ascontiguousarray(output.T), last=last).T)
+
+    for block in blocks:
+        output = vocoder.process(block)
+        if output.shape[1]:
+            yield resampled(output)
+    yield resampled(vocoder.finish(), last=True)
+
+
+class RenderCache(StemCache):
+    """
+    StemCache layout with one 'render' source per (stem hash, semitones, ratio).
+    While `deferred`, publishing does not evict (prepare_set evicts once at
+    the end, keeping the set's own renders).
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(root or default_cache_root(), max_bytes)
+        self.deferred = False
+
+    def evict(self, keep=()):
+        if not self.deferred:
+            super().evict(keep)
+
+    def lookup_render(self, stem_hash, semitones, ratio):
+        return self.lookup(stem_hash, RENDER_MODEL, render_params(semitones, ratio))
+
+
+def render_variant(stem_path, semitones=0, ratio=1.0, cache=None, stem_hash=None):
+    """
+    Cached render of one stem variant.
+    Returns {renderPath, cached, semitones, ratio, samplerate}; renderPath is
+    a float16 (channels, samples) .npy, or the stem itself when there is
+    nothing to do.
+    """
+    semitones = int(semitones)
+    ratio = round(float(ratio), 4)
+    result = {'stemPath': stem_path, 'semitones': semitones, 'ratio': ratio}
+    if semitones == 0 and ratio == 1.0:
+        return dict(result, renderPath=stem_path, cached=True)
+
+    cache = cache or RenderCache()
+    stem_hash = stem_hash or audio_content_hash(stem_path)
+    entry = cache.lookup_render(stem_hash, semitones, ratio)
+    if entry is not None:
+        return dict(result, renderPath=entry.source_path(RENDER_SOURCE), cached=True, samplerate=entry.samplerate)
+
+    samplerate, channels, frames, blocks = stem_source(stem_path)
+    total = int(round(frames * ratio))
+    sinks, commit = cache.store_streaming(stem_hash, RENDER_MODEL, render_params(semitones, ratio),
+                                          [RENDER_SOURCE], channels, total, samplerate)
+    sink = sinks[RENDER_SOURCE]
+    for output in render_blocks(blocks, samplerate, channels, semitones, ratio):
+        output = output[:, :total - sink.position]
+        if output.shape[1]:
+            sink.write(output)
+    if sink.position < total:
+        sink.write(np.zeros((channels, total - sink.position), dtype=np.float32))
+    entry = commit()
+    if not os.path.exists(entry.source_path(RENDER_SOURCE)):
+        raise RuntimeError('Render was evicted from the cache by another process')
+    return dict(result, renderPath=entry.source_path(RENDER_SOURCE), cached=False, samplerate=samplerate)
+
+
+def shifted_camelot(parsed_key, semitones):
+    pitch_class, mode = parsed_key
+    return key_to_camelot((pitch_class + semitones) % 12, mode)
+
+
+def plan_set(tracks, target_bpm=None, max_shift=DEFAULT_MAX_SHIFT):
+    """
+    Semitone shift and stretch ratio per track of a set, in order.
+    tracks: dicts with camelotKey (or key) and bpm - camelotKey first, as the
+    analyzers store key without its mode. Each track is shifted
+    by the smallest amount that puts it within MATCHED_DISTANCE Camelot
+    steps of the (shifted) track before it; tempo is matched to target_bpm
+    (the first track's by default), allowing half/double time.
+    """
+    target_bpm = target_bpm or next((t['bpm'] for t in tracks if t.get('bpm')), None)
+    shifts = sorted(range(-max_shift, max_shift + 1), key=abs)
+    previous = None
+    plan = []
+    for track in tracks:
+        parsed = parse_key(track.get('camelotKey')) or parse_key(track.get('key'))
+        semitones = 0
+        if parsed is not None and previous is not None:
+            semitones = min(shifts, key=lambda s: (
+                max(MATCHED_DISTANCE, camelot_distance(previous, shifted_camelot(parsed, s))), abs(s)))
+        if parsed is not None:
+            previous = shifted_camelot(parsed, semitones)
+
+        ratio = 1.0
+        if target_bpm and track.get('bpm'):
+            octave = round(math.log2(target_bpm / float(track['bpm'])))
+            ratio = float(track['bpm']) * 2.0 ** octave / target_bpm
+        plan.append({
+            'id': track.get('id'),
+            'semitones': semitones,
+            'ratio': round(ratio, 4),
+            'camelot': f'{previous[0]}{previous[1]}' if parsed is not None else None
+        })
+    return plan
+
+
+def emit(payload):
+    print(json.dumps(payload))
+    sys.stdout.flush()
+
+
+def prepare_set(config, cache=None):
+    """Key/tempo-match a set and render every stem variant (see module docstring)"""
+    tracks = config['tracks']
+    ids = [t['id'] for t in tracks if t.get('id') is not None]
+    known = {}
+    if ids:
+        conn = connect(config.get('db'))
+        try:
+            placeholders = ', '.join('?' * len(ids))
+            for row in conn.execute(f"SELECT id, key, camelotKey, bpm FROM tracks WHERE id IN ({placeholders})", ids):
+                known[row[0]] = {'key': row[1], 'camelotKey': row[2], 'bpm': row[3]}
+        finally:
+            conn.close()
+    tracks = [dict(known.get(t.get('id'), {}), **t) for t in tracks]
+    plan = plan_set(tracks, config.get('bpm'), config.get('maxShift', DEFAULT_MAX_SHIFT))
+
+    cache = cache or RenderCache()
+    # The same stem variant requested twice in a set is rendered once
+    variants = {}
+    for index, track in enumerate(tracks):
+        for name, path in sorted((track.get('stems') or {}).items()):
+            variant = (path, plan[index]['semitones'], plan[index]['ratio'])
+            variants.setdefault(variant, []).append((index, name))
+    emit({'status': 'initializing', 'progress': 0, 'message': f'Rendering {len(variants)} stem variants...'})
+
+    failed = []
+    cache.deferred = True
+    with ThreadPoolExecutor(max_workers=config.get('workers') or DEFAULT_WORKERS) as pool:
+        futures = {pool.submit(render_variant, *variant, cache): variant for variant in variants}
+        for count, future in enumerate(as_completed(futures), 1):
+            variant = futures[future]
+            try:
+                render_path = future.result()['renderPath']
+            except Exception as e:
+                render_path = None
+                failed.extend({'id': plan[index]['id'], 'stem': name, 'file': variant[0], 'error': str(e)}
+                              for index, name in variants[variant])
+            if render_path is not None:
+                for index, name in variants[variant]:
+                    plan[index].setdefault('stems', {})[name] = render_path
+            emit({'status': 'rendering', 'progress': int(100 * count / len(variants)),
+                  'message': f'Rendered {count}/{len(variants)}: {os.path.basename(variant[0])}'})
+
+    # Evict once, after the whole set is rendered, never dropping the set's own renders
+    cache.deferred = False
+    rendered = {path for track in plan for path in (track.get('stems') or {}).values()}
+    cache.evict(keep=[os.path.dirname(os.path.dirname(path)) for path in rendered
+                      if os.path.abspath(path).startswith(os.path.abspath(cache.root))])
+    for track in plan:
+        for name, path in list((track.get('stems') or {}).items()):
+            if not os.path.exists(path):
+                del track['stems'][name]
+                failed.append({'id': track['id'], 'stem': name, 'file': path, 'error': 'Render is no longer cached'})
+
+    result = {'status': 'complete', 'progress': 100, 'tracks': plan, 'failed': failed}
+    emit(result)
+    return result
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    options = {}
+    for flag, key, cast in (('--semitones', 'semitones', int), ('--ratio', 'ratio', float)):
+        if flag in argv:
+            position = argv.index(flag)
+            options[key] = cast(argv[position + 1])
+            del argv[position:position + 2]
+    if '--bpm' in argv:
+        position = argv.index('--bpm')
+        options['ratio'] = float(argv[position + 1]) / float(argv[position + 2])
+        del argv[position:position + 3]
+    args = [a for a in argv if not a.startswith('--')]
+
+    try:
+        if args[:1] == ['prepare'] and '--json' in argv:
+            prepare_set(json.loads(sys.stdin.readline()))
+        elif args[:1] == ['render'] and len(args) == 2:
+            emit(dict(render_variant(args[1], **options), status='complete', progress=100))
+        else:
+            print(json.dumps({'error': 'Usage: keylock_render.py render <stem_file> [--semitones N] '
+                                       '[--ratio R | --bpm FROM TO] | prepare --json'}))
+            sys.exit(1)
+    except Exception as e:
+        emit({'status': 'error', 'error': str(e)})
+        sys.exit(1)
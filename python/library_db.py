@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for locating and querying the NGKsPlayer library database
+
+Connections use WAL (as Electron does), so readers never block the writer
+and a commit costs one WAL append instead of a full journal sync. Python
+tools that write many rows - parallel analysis in particular - send them
+through one DbWriter thread, which batches commits by count and time;
+readers take their own connections from a ReaderPool.
+"""
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+# Wait this long for a lock before 'database is locked'
+BUSY_TIMEOUT_SECONDS = 10.0
+
+# DbWriter commits after this many statements or this many seconds
+WRITE_BATCH_ROWS = 500
+WRITE_BATCH_SECONDS = 0.25
+
+READER_POOL_SIZE = 4
+
+# analyze_audio.py result field -> tracks column
+ANALYSIS_COLUMNS = (
+    ('bpm', 'bpm'),
+    ('bpm', 'rawBpm'),
+    ('bpmConfidence', 'bpmConfidence'),
+    ('key', 'key'),
+    ('cueIn', 'cueIn'),
+    ('cueOut', 'cueOut'),
+    ('phraseLength', 'phraseLength'),
+    ('phraseData', 'phraseData'),
+)
+
+_FLUSH = object()
+
+
+def app_data_dir():
+    """Per-user NGKsPlayer data directory (same place Electron keeps library.db)"""
+    return os.path.join(os.environ.get('APPDATA') or os.path.expanduser('~'), 'ngksplayer')
+
+
+def default_db_path():
+    return os.path.join(app_data_dir(), 'library.db')
+
+
+def normalize_path(path):
+    """Case/separator-insensitive form used for path comparisons"""
+    return str(path).replace('?', '').replace('\\', '/').lower()
+
+
+def configure(conn):
+    """WAL journal, NORMAL sync (durable at checkpoints under WAL) and a busy timeout"""
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={int(BUSY_TIMEOUT_SECONDS * 1000)}')
+    return conn
+
+
+def connect(db_path=None, check_same_thread=True):
+    return configure(sqlite3.connect(db_path or default_db_path(), timeout=BUSY_TIMEOUT_SECONDS,
+                                     check_same_thread=check_same_thread))
+
+
+def find_track(cur, target, columns='id, filePath'):
+    """Look up a track row by filePath/path, ignoring case and separators"""
+    norm = target.replace('\\\\', '\\')
+    cur.execute(
+        f"SELECT {columns} FROM tracks WHERE LOWER(REPLACE(REPLACE(filePath, '?', ''), '\\\\', '/')) = LOWER(REPLACE(?, '\\\\', '/')) "
+        "OR LOWER(REPLACE(REPLACE(path, '?', ''), '\\\\', '/')) = LOWER(REPLACE(?, '\\\\', '/')) LIMIT 1",
+        (norm, norm)
+    )
+    return cur.fetchone()
+
+
+def analysis_update(result):
+    """(SET clause, params) for the analysis fields present in a result"""
+    columns = []
+    params = []
+    for field, column in ANALYSIS_COLUMNS:
+        if result.get(field) is not None:
+            value = result[field]
+            columns.append(f'{column}=?')
+            params.append(json.dumps(value) if isinstance(value, (list, dict)) else value)
+    if isinstance(result.get('confidence'), dict) and result['confidence'].get('key') is not None:
+        columns.append('keyConfidence=?')
+        params.append(result['confidence']['key'])
+    columns.append('analyzed=1')
+    return ', '.join(columns), params
+
+
+class DbWriter:
+    """
+    Single writer thread for a database. Statements are queued from any
+    thread and committed in batches (WRITE_BATCH_ROWS statements or
+    WRITE_BATCH_SECONDS, whichever comes first).
+
+    Every call returns a Future that resolves once its batch is committed
+    (to the rowcount, or to the return value of call()), or fails with the
+    statement's own error; one bad row does not lose the rest of the batch.
+
+    with DbWriter(db_path) as writer:
+        writer.execute("UPDATE tracks SET bpm = ? WHERE id = ?", (bpm, track_id))
+    """
+
+    def __init__(self, db_path=None, batch_rows=WRITE_BATCH_ROWS, batch_seconds=WRITE_BATCH_SECONDS):
+        self.db_path = db_path or default_db_path()
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self.queue = queue.Queue()
+        self.committed = 0
+        self.errors = 0
+        self._ready = Future()
+        self._thread = threading.Thread(target=self._run, name='DbWriter', daemon=True)
+        self._thread.start()
+        self._ready.result()  # surface connection errors in the caller
+
+    def execute(self, sql, params=()):
+        return self._submit(lambda conn: conn.execute(sql, params).rowcount)
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        return self._submit(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    def call(self, func):
+        """Run func(conn) on the writer thread inside the current batch"""
+        return self._submit(func)
+
+    def _submit(self, func):
+        if not self._thread.is_alive():
+            raise RuntimeError('DbWriter is closed')
+        future = Future()
+        self.queue.put((func, future))
+        return future
+
+    def flush(self):
+        """Block until everything queued so far is committed"""
+        future = Future()
+        self.queue.put((_FLUSH, future))
+        return future.result()
+
+    def close(self):
+        if self._thread.is_alive():
+            self.queue.put((None, None))
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        try:
+            conn = connect(self.db_path)
+        except Exception as e:
+            self._ready.set_exception(e)
+            return
+        self._ready.set_result(True)
+
+        pending = []  # (future, result) waiting for the commit
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                func, future = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                func, future = _FLUSH, None  # batch time is up
+            if func is not None and func is not _FLUSH:
+                try:
+                    pending.append((future, func(conn)))
+                except Exception as e:
+                    self.errors += 1
+                    future.set_exception(e)
+                if deadline is None:
+                    deadline = time.monotonic() + self.batch_seconds
+                if len(pending) < self.batch_rows and time.monotonic() < deadline:
+                    continue
+            self._commit(conn, pending)
+            pending = []
+            deadline = None
+            if func is _FLUSH and future is not None:
+                future.set_result(True)
+            if func is None:
+                break
+        conn.close()
+
+    def _commit(self, conn, pending):
+        try:
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            for future, _ in pending:
+                future.set_exception(e)
+            self.errors += len(pending)
+            return
+        for future, result in pending:
+            future.set_result(result)
+        self.committed += len(pending)
+
+
+class ReaderPool:
+    """
+    Pooled read-only connections; under WAL they read a consistent snapshot
+    while DbWriter commits.
+
+    pool = ReaderPool(db_path)
+    with pool.connection() as conn:
+        conn.execute("SELECT ...")
+    """
+
+    def __init__(self, db_path=None, size=READER_POOL_SIZE):
+        self.db_path = db_path or default_db_path()
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = connect(self.db_path, check_same_thread=False)
+        conn.execute('PRAGMA query_only=1')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            conn = self._open() if create else self._idle.get()
+        try:
+            yield conn
+        finally:
+            conn.rollback()  # end the read snapshot before the next user
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
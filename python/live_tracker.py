@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Streaming BPM and key tracker for live decks and line-in
+PCM blocks go into a ring buffer; every hop (512 samples) one STFT frame
+updates the onset envelope (log-mel flux, as librosa.onset.onset_strength),
+a per-frame tempo estimate (autocorrelation of the last 8 s of onsets with
+librosa's log-normal tempo prior) and the chroma key profile. Nothing is
+recomputed over the whole history, so the cost per block is constant:
+a few FFTs and small matrix products, about a millisecond for a
+2048-sample block (93 ms of audio at 22050 Hz).
+
+Tempo uses the same most-common-tempo histogram and octave correction as
+detect_bpm_and_key (tempo_octave.py); key uses the same Krumhansl-Schmuckler
+scoring as key_tracking.py, over STFT chroma instead of CQT chroma.
+
+Live estimates forget old audio with a half-life of memory_seconds so a
+mix that changes tempo/key follows along; summary() reports the whole stream.
+
+Usage:
+  live_tracker.py <audio_file> [--block N] [--memory S] [--compare]
+      feed a file block by block; --compare also runs the offline analysis
+  live_tracker.py --stdin [--sr 44100] [--channels 2] [--block N] [--memory S]
+      raw float32 little-endian interleaved PCM on stdin (line-in capture)
+Prints one JSON line per update: {"status": "update", "time", "bpm", "key", ...}
+"""
+import os
+import sys
+import json
+import time
+
+import numpy as np
+
+from key_tracking import score_keys, key_templates
+from tempo_octave import TEMPO_BINS, TEMPO_RANGE, histogram_peak, correct_octave
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SR = 22050
+BLOCK_SIZE = 2048
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+
+# Tempo estimation, as librosa.feature.tempo in detect_bpm_and_key
+AC_SECONDS = 8.0
+START_BPM = 120.0
+STD_BPM = 2.0
+MAX_TEMPO = 400.0
+
+# Log-mel dynamic range (power_to_db top_db, against the running maximum)
+TOP_DB = 80.0
+
+# Half-life of the live estimates (seconds of audio)
+MEMORY_SECONDS = 30.0
+# Seconds between updates, and audio needed before the first one
+UPDATE_SECONDS = 1.0
+MIN_SECONDS = 4.0
+
+
+class RingBuffer:
+    """
+    Fixed-size float ring; every sample is stored twice so the latest n
+    samples are always one contiguous view (no copy, no wrap-around).
+    """
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=dtype)
+        self._position = 0
+        self.count = 0
+
+    def write(self, values):
+        values = np.asarray(values)[-self.capacity:]
+        n = len(values)
+        if n == 0:
+            return
+        indices = (self._position + np.arange(n)) % self.capacity
+        self._data[indices] = values
+        self._data[indices + self.capacity] = values
+        self._position = (self._position + n) % self.capacity
+        self.count = min(self.capacity, self.count + n)
+
+    def latest(self, n):
+        """View of the last n samples (zeros before the first write)"""
+        end = self._position + self.capacity
+        return self._data[end - n:end]
+
+
+class LiveTracker:
+    """
+    tracker = LiveTracker(sr=44100)
+    for block in blocks:
+        update = tracker.process(block)   # dict or None
+    tracker.summary()
+    """
+
+    def __init__(self, sr=DEFAULT_SR, n_fft=N_FFT, hop_length=HOP_LENGTH, memory_seconds=MEMORY_SECONDS,
+                 update_seconds=UPDATE_SECONDS, min_seconds=MIN_SECONDS):
+        from startup import load_librosa
+        librosa = load_librosa()
+
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.frame_rate = sr / float(hop_length)
+        self.update_seconds = update_seconds
+        self.min_seconds = min_seconds
+
+        # Filterbanks and windows are built once; per frame it is matrix products only
+        self._window = librosa.filters.get_window('hann', n_fft, fftbins=True).astype(np.float64)
+        self._mel = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=N_MELS)
+        self._chroma = librosa.filters.chroma(sr=sr, n_fft=n_fft)
+        self._templates, self._keys = key_templates()
+
+        self.ac_frames = int(AC_SECONDS * self.frame_rate)
+        self._ac_window = librosa.filters.get_window('hann', self.ac_frames, fftbins=True)
+        lags = np.arange(self.ac_frames, dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            bpms = 60.0 * self.frame_rate / lags
+        self._bpms = bpms
+        self._log_prior = -0.5 * ((np.log2(bpms) - np.log2(START_BPM)) / STD_BPM) ** 2
+        self._log_prior[bpms >= MAX_TEMPO] = -np.inf
+        self._ac_fft = 2 * self.ac_frames
+
+        self._samples = RingBuffer(n_fft)
+        self._onsets = RingBuffer(self.ac_frames, dtype=np.float64)
+        # First frame is centred on sample 0 (librosa center=True, zero padded)
+        self._until_frame = n_fft // 2
+        self._previous_db = None
+        self._db_max = -np.inf
+
+        self._decay = 0.5 ** (1.0 / (memory_seconds * self.frame_rate)) if memory_seconds else 1.0
+        self._live_hist = np.zeros(TEMPO_BINS)
+        self._total_hist = np.zeros(TEMPO_BINS)
+        self._live_chroma = np.zeros(12)
+        self._total_chroma = np.zeros(12)
+        self._onset_count = 0
+        self._onset_mean = 0.0
+        self._onset_m2 = 0.0
+
+        self.frames = 0
+        self.samples = 0
+        self._next_update = max(min_seconds, update_seconds)
+        self.block_ms = []
+
+    def process(self, block):
+        """
+        Feed one PCM block ((n,) mono or (n, channels), any length).
+        Returns an update dict when one is due, else None.
+        """
+        started = time.perf_counter()
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+
+        offset = 0
+        while offset < len(block):
+            take = min(self._until_frame, len(block) - offset)
+            self._samples.write(block[offset:offset + take])
+            offset += take
+            self._until_frame -= take
+            if self._until_frame == 0:
+                self._frame()
+                self._until_frame = self.hop_length
+        self.samples += len(block)
+
+        update = None
+        if self.samples / self.sr >= self._next_update:
+            self._next_update += self.update_seconds
+            update = dict(self.estimate(), status='update', time=round(self.samples / self.sr, 3))
+        elapsed = (time.perf_counter() - started) * 1000.0
+        self.block_ms.append(elapsed)
+        if update is not None:
+            update['latencyMs'] = round(elapsed, 3)
+        return update
+
+    def _frame(self):
+        power = np.abs(np.fft.rfft(self._samples.latest(self.n_fft) * self._window)) ** 2
+
+        # Onset strength: median over mel bands of the positive log-mel flux
+        db = 10.0 * np.log10(np.maximum(self._mel @ power, 1e-10))
+        self._db_max = max(self._db_max, float(db.max()))
+        np.maximum(db, self._db_max - TOP_DB, out=db)
+        if self._previous_db is not None:
+            onset = float(np.median(np.maximum(0.0, db - self._previous_db)))
+            self._onsets.write([onset])
+            self._onset_count += 1
+            delta = onset - self._onset_mean
+            self._onset_mean += delta / self._onset_count
+            self._onset_m2 += delta * (onset - self._onset_mean)
+            self._tempo_frame()
+        self._previous_db = db
+
+        chroma = self._chroma @ power
+        peak = chroma.max()
+        if peak > 1e-10:
+            chroma /= peak
+        self._live_chroma *= self._decay
+        self._live_chroma += chroma
+        self._total_chroma += chroma
+        self.frames += 1
+
+    def _tempo_frame(self):
+        """Tempo of the last AC_SECONDS of onsets into the tempo histograms"""
+        self._live_hist *= self._decay
+        if self._onsets.count < self.ac_frames // 2:
+            return
+        frame = self._onsets.latest(self.ac_frames) * self._ac_window
+        spectrum = np.fft.rfft(frame, n=self._ac_fft)
+        ac = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, n=self._ac_fft)[:self.ac_frames]
+        if ac[0] <= 0:
+            return
+        ac /= ac[0]
+        with np.errstate(invalid='ignore'):
+            scores = np.log1p(1e6 * np.maximum(ac, 0.0)) + self._log_prior
+        scores[0] = -np.inf
+        tempo = self._bpms[int(np.argmax(scores))]
+        if TEMPO_RANGE[0] <= tempo <= TEMPO_RANGE[1]:
+            width = (TEMPO_RANGE[1] - TEMPO_RANGE[0]) / TEMPO_BINS
+            index = min(int((tempo - TEMPO_RANGE[0]) / width), TEMPO_BINS - 1)
+            self._live_hist[index] += 1.0
+            self._total_hist[index] += 1.0
+
+    def _result(self, hist, chroma):
+        result = {'bpm': None, 'bpmConfidence': 0.0, 'key': None, 'mode': None, 'keyConfidence': 0.0}
+        if hist.sum() > 0:
+            bpm = float(correct_octave(histogram_peak(hist)))
+            onset_std = np.sqrt(self._onset_m2 / self._onset_count) if self._onset_count else 0.0
+            # Same confidence heuristic as detect_bpm_and_key
+            result['bpm'] = round(bpm, 1)
+            result['bpmConfidence'] = float(min(1.0, onset_std / 10.0)) if onset_std > 0 else 0.5
+        if chroma.sum() > 0:
+            scores = score_keys(chroma, self._templates)
+            best = int(np.argmax(scores))
+            result['key'], result['mode'] = self._keys[best]
+            result['keyConfidence'] = round(float(max(0.0, scores[best])), 3)
+        return result
+
+    def estimate(self):
+        """Current (decayed) tempo and key"""
+        return self._result(self._live_hist, self._live_chroma)
+
+    def summary(self):
+        """Tempo and key over the whole stream, plus per-block latency"""
+        result = self._result(self._total_hist, self._total_chroma)
+        latency = np.array(self.block_ms or [0.0])
+        result.update(
+            seconds=round(self.samples / self.sr, 3),
+            blocks=len(self.block_ms),
+            latencyMs={
+                'mean': round(float(latency.mean()), 3),
+                'p99': round(float(np.percentile(latency, 99)), 3),
+                'max': round(float(latency.max()), 3)
+            }
+        )
+        return result
+
+
+def emit(payload):
+    print(json.dumps(payload))
+    sys.stdout.flush()
+
+
+def track_file(audio_file, block_size=BLOCK_SIZE, compare=False, **tracker_kwargs):
+    """Feed a file through the tracker block by block (as a deck would)"""
+    from audio_decode import load_audio
+    y, sr = load_audio(audio_file, sr=DEFAULT_SR, mono=True)
+    tracker = LiveTracker(sr=sr, **tracker_kwargs)
+    for start in range(0, len(y), block_size):
+        update = tracker.process(y[start:start + block_size])
+        if update is not None:
+            emit(update)
+
+    summary = tracker.summary()
+    if compare:
+        if ROOT_DIR not in sys.path:
+            sys.path.insert(0, ROOT_DIR)
+        from analyze_audio import detect_bpm_and_key
+        offline = detect_bpm_and_key(audio_file)
+        summary['offline'] = offline
+        if offline.get('bpm') is not None and summary['bpm'] is not None:
+            summary['bpmDifference'] = round(abs(summary['bpm'] - offline['bpm']), 1)
+            summary['keyMatch'] = (summary['key'], summary['mode']) == (offline['key'], offline['mode'])
+    emit(dict(summary, status='complete'))
+    return summary
+
+
+def track_stdin(sr, channels=1, block_size=BLOCK_SIZE, **tracker_kwargs):
+    """Raw float32 interleaved PCM from stdin until EOF"""
+    tracker = LiveTracker(sr=sr, **tracker_kwargs)
+    stream = sys.stdin.buffer
+    frame_bytes = 4 * channels
+    while True:
+        data = stream.read(block_size * frame_bytes)
+        if not data:
+            break
+        usable = len(data) - len(data) % frame_bytes
+        block = np.frombuffer(data[:usable], dtype='<f4').reshape(-1, channels)
+        update = tracker.process(block)
+        if update is not None:
+            emit(update)
+    emit(dict(tracker.summary(), status='complete'))
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    options = {}
+    for flag, key, cast in (('--block', 'block_size', int), ('--memory', 'memory_seconds', float),
+                            ('--sr', 'sr', int), ('--channels', 'channels', int)):
+        if flag in argv:
+            position = argv.index(flag)
+            options[key] = cast(argv[position + 1])
+            del argv[position:position + 2]
+
+    try:
+        if '--stdin' in argv:
+            track_stdin(options.pop('sr', 44100), **options)
+        elif argv and not argv[0].startswith('--'):
+            options.pop('sr', None)
+            options.pop('channels', None)
+            track_file(argv[0], compare='--compare' in argv, **options)
+        else:
+            print(json.dumps({'error': 'Usage: live_tracker.py <audio_file> [--block N] [--memory S] [--compare] | '
+                                       '--stdin [--sr 44100] [--channels 2]'}))
+            sys.exit(1)
+    except Exception as e:
+        emit({'status': 'error', 'error': str(e)})
+        sys.exit(1)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Full-text lyric search over transcribed words
+Transcriptions are ingested into library.db: every word with its
+timestamps goes to lyric_words, and each Whisper segment's text is indexed
+in an FTS5 table (lyric_fts, external content = lyric_segments). A phrase
+query is an FTS5 MATCH; the hit is then located inside the segment's
+words to return a jump-to timestamp.
+
+Usage:
+  lyrics_index.py ingest <trackIdOrPath> [transcription.json|-] [dbPath]
+      (transcription JSON from the file, or stdin for '-': either the
+       `transcription` object or transcribe_audio.py's complete message)
+  lyrics_index.py search "<phrase>" [--limit N] [dbPath]
+  lyrics_index.py remove <trackIdOrPath> [dbPath]
+"""
+import re
+import sys
+import json
+import unicodedata
+
+from library_db import connect, find_track
+
+DEFAULT_LIMIT = 50
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS lyric_segments (
+      id         INTEGER PRIMARY KEY,
+      track_id   INTEGER NOT NULL,
+      segment_id INTEGER,
+      start      REAL,
+      end        REAL,
+      first_word INTEGER,
+      word_count INTEGER,
+      text       TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_lyric_segments_track ON lyric_segments(track_id);
+    CREATE TABLE IF NOT EXISTS lyric_words (
+      track_id   INTEGER NOT NULL,
+      position   INTEGER NOT NULL,
+      word       TEXT,
+      start      REAL,
+      end        REAL,
+      segment_id INTEGER,
+      PRIMARY KEY (track_id, position)
+    ) WITHOUT ROWID;
+    CREATE VIRTUAL TABLE IF NOT EXISTS lyric_fts USING fts5(
+      text, content='lyric_segments', content_rowid='id',
+      tokenize='unicode61 remove_diacritics 2'
+    );
+"""
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokens(text):
+    """Same word split as the FTS5 unicode61 tokenizer (lowercase, no diacritics)"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN.findall(text)
+
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+
+
+def remove(conn, track_id):
+    cur = conn.cursor()
+    # External-content FTS rows are deleted by replaying their old text
+    cur.execute(
+        "INSERT INTO lyric_fts(lyric_fts, rowid, text) "
+        "SELECT 'delete', id, text FROM lyric_segments WHERE track_id = ?", (track_id,)
+    )
+    cur.execute("DELETE FROM lyric_segments WHERE track_id = ?", (track_id,))
+    cur.execute("DELETE FROM lyric_words WHERE track_id = ?", (track_id,))
+
+
+def ingest(conn, track_id, transcription):
+    """Replace the indexed lyrics of a track with a transcription payload"""
+    ensure_schema(conn)
+    remove(conn, track_id)
+    cur = conn.cursor()
+    position = 0
+    segments = 0
+    for segment in transcription.get('segments', []):
+        words = segment.get('words') or []
+        cur.execute(
+            "INSERT INTO lyric_segments (track_id, segment_id, start, end, first_word, word_count, text) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (track_id, segment.get('id'), segment.get('start'), segment.get('end'), position,
+             len(words), segment.get('text', '').strip())
+        )
+        cur.execute("INSERT INTO lyric_fts(rowid, text) VALUES (?, ?)",
+                    (cur.lastrowid, segment.get('text', '').strip()))
+        cur.executemany(
+            "INSERT INTO lyric_words (track_id, position, word, start, end, segment_id) VALUES (?, ?, ?, ?, ?, ?)",
+            ((track_id, position + i, w['word'], w['start'], w['end'], segment.get('id'))
+             for i, w in enumerate(words))
+        )
+        position += len(words)
+        segments += 1
+    conn.commit()
+    return {'trackId': track_id, 'segments': segments, 'words': position}
+
+
+def _locate(words, phrase_tokens):
+    """(start, end) of the first occurrence of the phrase in a word list"""
+    flat = []  # (token, word index)
+    for i, (word, _, _) in enumerate(words):
+        flat.extend((token, i) for token in tokens(word))
+    n = len(phrase_tokens)
+    for k in range(len(flat) - n + 1):
+        if all(flat[k + j][0] == phrase_tokens[j] for j in range(n)):
+            first, last = flat[k][1], flat[k + n - 1][1]
+            return words[first][1], words[last][2]
+    return None
+
+
+def search(conn, phrase, limit=DEFAULT_LIMIT):
+    """
+    Tracks whose lyrics contain `phrase`, best matches first.
+    Returns [{trackId, filePath, title, artist, matches: [{start, end, text}]}].
+    """
+    phrase_tokens = tokens(phrase)
+    if not phrase_tokens:
+        return []
+    ensure_schema(conn)
+    cur = conn.cursor()
+    query = '"' + ' '.join(phrase_tokens) + '"'
+    hits = cur.execute(
+        "SELECT s.track_id, s.start, s.end, s.first_word, s.word_count, s.text, t.filePath, t.title, t.artist "
+        "FROM lyric_fts f JOIN lyric_segments s ON s.id = f.rowid "
+        "LEFT JOIN tracks t ON t.id = s.track_id "
+        "WHERE lyric_fts MATCH ? ORDER BY f.rank LIMIT ?",
+        (query, limit * 4)
+    ).fetchall()
+
+    results = {}
+    for track_id, seg_start, seg_end, first_word, word_count, text, file_path, title, artist in hits:
+        if track_id not in results:
+            if len(results) >= limit:
+                continue
+            results[track_id] = {'trackId': track_id, 'filePath': file_path, 'title': title,
+                                 'artist': artist, 'matches': []}
+        words = cur.execute(
+            "SELECT word, start, end FROM lyric_words WHERE track_id = ? AND position >= ? AND position < ? "
+            "ORDER BY position",
+            (track_id, first_word, first_word + (word_count or 0))
+        ).fetchall()
+        span = _locate(words, phrase_tokens) if words else None
+        start, end = span if span else (seg_start, seg_end)
+        results[track_id]['matches'].append({'start': start, 'end': end, 'text': text})
+
+    for result in results.values():
+        result['matches'].sort(key=lambda m: m['start'] or 0)
+    return list(results.values())
+
+
+def resolve_track_id(conn, target):
+    if str(target).isdigit():
+        return int(target)
+    row = find_track(conn.cursor(), target, 'id')
+    if row is None:
+        raise ValueError(f'Track not found in library: {target}')
+    return row[0]
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    limit = DEFAULT_LIMIT
+    if '--limit' in argv:
+        position = argv.index('--limit')
+        limit = int(argv[position + 1])
+        del argv[position:position + 2]
+    if len(argv) < 2 or argv[0] not in ('ingest', 'search', 'remove'):
+        print(json.dumps({'error': 'Usage: lyrics_index.py ingest <trackIdOrPath> [transcription.json|-] [dbPath] | '
+                                   'search "<phrase>" [--limit N] [dbPath] | remove <trackIdOrPath> [dbPath]'}))
+        sys.exit(1)
+
+    try:
+        command = argv[0]
+        if command == 'ingest':
+            source = argv[2] if len(argv) > 2 else '-'
+            if source != '-':
+                with open(source, 'r', encoding='utf-8') as f:
+                    payload = json.load(f)
+            else:
+                payload = json.loads(sys.stdin.read())
+            conn = connect(argv[3] if len(argv) > 3 else None)
+            try:
+                print(json.dumps(ingest(conn, resolve_track_id(conn, argv[1]),
+                                        payload.get('transcription', payload))))
+            finally:
+                conn.close()
+        elif command == 'search':
+            conn = connect(argv[2] if len(argv) > 2 else None)
+            try:
+                print(json.dumps(search(conn, argv[1], limit)))
+            finally:
+                conn.close()
+        else:
+            conn = connect(argv[2] if len(argv) > 2 else None)
+            try:
+                ensure_schema(conn)
+                remove(conn, resolve_track_id(conn, argv[1]))
+                conn.commit()
+                print(json.dumps({'removed': True}))
+            finally:
+                conn.close()
+    except Exception as e:
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
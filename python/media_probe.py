@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Header-only media probe and scan planning
+Reads container headers (duration, sample rate, channels, codec) without
+decoding audio, so broken, DRM-protected, empty or overlong files are
+rejected before a worker spends time on them. Probes, cheapest first:
+
+  soundfile  libsndfile header read (wav, flac, ogg, mp3, aiff)
+  mutagen    tag/stream headers for everything else (m4a, wma), if installed
+  ffprobe    if on PATH
+
+Files no probe can read but that no probe rejected either (e.g. m4a with
+neither mutagen nor ffprobe available) are kept with an unknown duration;
+the decoder still gets its chance. A libsndfile failure is final only for
+SOUNDFILE_EXTENSIONS: mp3s it cannot parse (ID3/VBR header quirks) go on
+to the other probes and, failing those, to the decoder's fallbacks.
+
+plan_work() probes a file list in parallel and orders the accepted files
+longest-first, so a process pool finishes at about the same time on every
+worker, and estimates the scan time (refined with observed throughput
+while the scan runs).
+
+Usage: media_probe.py <folder|file> [--workers N] [--window S] [--max-duration S]
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.m4a', '.ogg', '.wma')
+
+# Extensions libsndfile decides on by itself (a failed header read is final);
+# mp3 only with libsndfile >= 1.1
+SOUNDFILE_EXTENSIONS = ('.wav', '.flac', '.ogg', '.aif', '.aiff')
+
+# Codec ids of protected streams (iTunes FairPlay, PlayReady)
+DRM_CODECS = ('drms', 'drmi', 'enca')
+
+PROBE_WORKERS = 8
+FFPROBE_TIMEOUT = 10
+
+# Planning cost of a file whose duration is unknown (seconds of audio)
+UNKNOWN_DURATION = 240.0
+# Wall seconds of analysis per second of audio on one worker, until the
+# scan has measured its own
+DEFAULT_SECONDS_PER_AUDIO_SECOND = 0.05
+
+
+def find_audio_files(folder, extensions=AUDIO_EXTENSIONS):
+    """All files under folder (recursively) with an audio extension"""
+    if os.path.isfile(folder):
+        return [folder]
+    paths = []
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            if file.lower().endswith(extensions):
+                paths.append(os.path.join(root, file))
+    return paths
+
+
+_soundfile_extensions = None
+
+
+def soundfile_extensions():
+    global _soundfile_extensions
+    if _soundfile_extensions is None:
+        try:
+            import soundfile as sf
+            mp3 = ('.mp3',) if 'MP3' in sf.available_formats() else ()
+            _soundfile_extensions = SOUNDFILE_EXTENSIONS + mp3
+        except (ImportError, OSError):
+            _soundfile_extensions = ()
+    return _soundfile_extensions
+
+
+def _probe_soundfile(path):
+    import soundfile as sf
+    info = sf.info(path)
+    return {
+        'duration': info.frames / info.samplerate if info.frames > 0 else None,
+        'sampleRate': info.samplerate,
+        'channels': info.channels,
+        'codec': f'{info.format}/{info.subtype}'.lower()
+    }
+
+
+def _probe_mutagen(path):
+    import mutagen
+    media = mutagen.File(path)
+    if media is None or media.info is None:
+        raise ValueError('Unrecognized container')
+    info = media.info
+    return {
+        'duration': getattr(info, 'length', None) or None,
+        'sampleRate': getattr(info, 'sample_rate', None),
+        'channels': getattr(info, 'channels', None),
+        'codec': (getattr(info, 'codec', None) or type(media).__name__).lower()
+    }
+
+
+def _probe_ffprobe(path):
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        raise ImportError('ffprobe not found')
+    completed = subprocess.run(
+        [ffprobe, '-v', 'error', '-select_streams', 'a:0', '-show_entries',
+         'stream=codec_name,codec_tag_string,sample_rate,channels:format=duration', '-of', 'json', path],
+        capture_output=True, text=True, timeout=FFPROBE_TIMEOUT
+    )
+    if completed.returncode != 0:
+        raise ValueError(completed.stderr.strip() or 'ffprobe failed')
+    data = json.loads(completed.stdout or '{}')
+    streams = data.get('streams') or []
+    if not streams:
+        raise ValueError('No audio stream')
+    stream = streams[0]
+    duration = data.get('format', {}).get('duration')
+    codec = stream.get('codec_name') or stream.get('codec_tag_string') or 'unknown'
+    if stream.get('codec_tag_string') in DRM_CODECS:
+        codec = stream['codec_tag_string']
+    return {
+        'duration': float(duration) if duration not in (None, 'N/A') else None,
+        'sampleRate': int(stream['sample_rate']) if stream.get('sample_rate') else None,
+        'channels': stream.get('channels'),
+        'codec': codec.lower()
+    }
+
+
+PROBES = (('soundfile', _probe_soundfile), ('mutagen', _probe_mutagen), ('ffprobe', _probe_ffprobe))
+
+
+def probe(path, max_duration=None):
+    """
+    Header info for one file:
+    {filePath, readable, duration, sampleRate, channels, codec, probe}
+    plus {error, reason} (unreadable, empty, drm, too_long) when rejected.
+    """
+    result = {'filePath': path, 'readable': False, 'duration': None, 'sampleRate': None,
+              'channels': None, 'codec': None, 'probe': None}
+
+    def reject(reason, error):
+        result.update(reason=reason, error=error)
+        return result
+
+    try:
+        if os.path.getsize(path) == 0:
+            return reject('empty', 'File is empty')
+    except OSError as e:
+        return reject('unreadable', str(e))
+
+    errors = []
+    rejected = False
+    for name, func in PROBES:
+        if name == 'soundfile' and not path.lower().endswith(soundfile_extensions()):
+            continue
+        try:
+            info = func(path)
+        except ImportError:
+            continue  # probe not available here
+        except Exception as e:
+            errors.append(f'{name}: {e}')
+            if name != 'soundfile':
+                rejected = True
+            elif path.lower().endswith(SOUNDFILE_EXTENSIONS):
+                rejected = True
+                break  # libsndfile knows these formats; nothing else will decode it either
+            continue
+        result.update(info, probe=name)
+        if any(result['codec'].startswith(codec) for codec in DRM_CODECS):
+            return reject('drm', f"DRM-protected stream ({result['codec']})")
+        if info['duration'] is not None and info['duration'] <= 0:
+            return reject('empty', 'No audio frames')
+        if max_duration and (info['duration'] or 0) > max_duration:
+            return reject('too_long', f"{info['duration']:.0f}s is over the {max_duration:.0f}s limit")
+        result['readable'] = True
+        return result
+
+    if rejected:
+        return reject('unreadable', '; '.join(errors))
+    # No probe could look inside (or only libsndfile's optional mp3 support
+    # failed); let the decoder try
+    result['readable'] = True
+    return result
+
+
+class WorkPlan:
+    """
+    Probed, longest-first work list with a scan time estimate.
+    window: seconds of each file the analysis actually reads (None = all)
+    """
+
+    def __init__(self, probes, workers=1, window=None, seconds_per_audio_second=DEFAULT_SECONDS_PER_AUDIO_SECOND):
+        self.workers = max(1, workers)
+        self.window = window
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self.rejected = [p for p in probes if not p['readable']]
+        self.files = sorted((p for p in probes if p['readable']), key=self.cost, reverse=True)
+        self.costs = {p['filePath']: self.cost(p) for p in self.files}
+        self.total_cost = sum(self.costs.values())
+        self.done_cost = 0.0
+        self.started = None
+
+    def cost(self, info):
+        duration = info['duration'] if info['duration'] is not None else UNKNOWN_DURATION
+        return min(duration, self.window) if self.window else duration
+
+    def estimate_seconds(self):
+        """Longest-first schedule over the workers, at the default rate"""
+        loads = [0.0] * self.workers
+        for path in (p['filePath'] for p in self.files):
+            heapq.heapreplace(loads, loads[0] + self.costs[path])
+        return max(loads) * self.seconds_per_audio_second
+
+    def start(self):
+        self.started = time.monotonic()
+
+    def completed(self, path):
+        self.done_cost += self.costs.get(path, 0.0)
+
+    def eta(self):
+        """Seconds left, from measured throughput once anything has finished"""
+        remaining = self.total_cost - self.done_cost
+        if self.started is None or self.done_cost <= 0:
+            return remaining / self.total_cost * self.estimate_seconds() if self.total_cost else 0.0
+        throughput = self.done_cost / max(time.monotonic() - self.started, 1e-6)
+        return remaining / throughput
+
+    def rejections(self):
+        """Rejected files in the scan scripts' failure format"""
+        return [{'file': os.path.basename(p['filePath']), 'error': p['error'], 'failure': p['reason']}
+                for p in self.rejected]
+
+    def summary(self):
+        return {
+            'files': len(self.files),
+            'rejected': [dict(r, filePath=p['filePath']) for r, p in zip(self.rejections(), self.rejected)],
+            'audioSeconds': round(sum(p['duration'] or 0 for p in self.files), 1),
+            'unknownDuration': sum(1 for p in self.files if p['duration'] is None),
+            'estimatedSeconds': round(self.estimate_seconds(), 1)
+        }
+
+
+def probe_all(paths, max_duration=None, workers=PROBE_WORKERS):
+    """Probe many files; header reads are I/O bound so threads overlap them"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda path: probe(path, max_duration), paths))
+
+
+def plan_work(paths, workers=1, window=None, max_duration=None):
+    return WorkPlan(probe_all(paths, max_duration), workers=workers, window=window)
+
+
+def format_eta(seconds):
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+    return f'{seconds // 60}m{seconds % 60:02d}s'
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    options = {}
+    for flag, key, cast in (('--workers', 'workers', int), ('--window', 'window', float),
+                            ('--max-duration', 'max_duration', float)):
+        if flag in argv:
+            position = argv.index(flag)
+            options[key] = cast(argv[position + 1])
+            del argv[position:position + 2]
+    if not argv:
+        print(json.dumps({'error': 'Usage: media_probe.py <folder|file> [--workers N] [--window S] [--max-duration S]'}))
+        sys.exit(1)
+
+    started = time.perf_counter()
+    plan = plan_work(find_audio_files(argv[0]), **options)
+    summary = plan.summary()
+    summary['probeSeconds'] = round(time.perf_counter() - started, 3)
+    summary['order'] = [{'filePath': p['filePath'], 'duration': p['duration'], 'sampleRate': p['sampleRate'],
+                         'channels': p['channels'], 'codec': p['codec']} for p in plan.files]
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+CPU acceleration for Demucs and Whisper
+Dynamic int8 quantization of the Linear (incl. attention projections and
+transformer feed-forward) and LSTM layers. Weights are quantized once,
+activations on the fly, so no calibration data is needed. The quantized
+model is pickled under <appdata>/model_cache and reloaded directly on later
+runs (skipping the float model entirely), together with a drift report
+measured against the float model on a reference clip at build time.
+
+Quantized kernels are CPU-only; callers should only enable this when
+running without CUDA.
+"""
+import os
+import json
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from library_db import app_data_dir
+
+QUANTIZED_TYPES = {nn.Linear, nn.LSTM}
+
+
+def default_model_cache_dir():
+    return os.path.join(app_data_dir(), 'model_cache')
+
+
+def cached_model_path(name, cache_dir=None):
+    """Pickled modules are tied to the torch build that produced them"""
+    version = torch.__version__.split('+')[0]
+    return os.path.join(cache_dir or default_model_cache_dir(), f'{name}-int8-torch{version}.pt')
+
+
+def _plain_linears(model):
+    """
+    Whisper subclasses nn.Linear (only to cast weight dtype), and the
+    quantizer matches exact types - turn subclasses back into nn.Linear.
+    """
+    for module in model.modules():
+        if isinstance(module, nn.Linear) and type(module) not in (
+                nn.Linear, nn.modules.linear.NonDynamicallyQuantizableLinear):
+            module.__class__ = nn.Linear
+    return model
+
+
+def quantize_model(model):
+    """int8 dynamic-quantized copy of a float model (the original is untouched)"""
+    import copy
+    from torch.ao.quantization import quantize_dynamic
+
+    quantized = _plain_linears(copy.deepcopy(model).cpu().eval())
+    return quantize_dynamic(quantized, QUANTIZED_TYPES, dtype=torch.qint8)
+
+
+def snr_db(reference, test):
+    """Signal-to-noise ratio (dB) of `test` against `reference`"""
+    reference = np.asarray(reference, dtype=np.float64)
+    noise = reference - np.asarray(test, dtype=np.float64)
+    signal_power = np.sum(reference ** 2)
+    noise_power = np.sum(noise ** 2)
+    if noise_power == 0:
+        return float('inf')
+    return float(10 * np.log10((signal_power + 1e-12) / noise_power))
+
+
+def load_quantized(name, load_float, measure_drift=None, cache_dir=None):
+    """
+    Quantized model for `name`, built once and cached.
+    load_float() returns the float model (only called on a cache miss);
+    measure_drift(float_model, quantized_model) returns a JSON-able dict.
+    Returns (model, drift_report).
+    """
+    path = cached_model_path(name, cache_dir)
+    report_path = path + '.json'
+    if os.path.exists(path):
+        model = torch.load(path, map_location='cpu', weights_only=False)
+        drift = None
+        if os.path.exists(report_path):
+            with open(report_path, 'r') as f:
+                drift = json.load(f)
+        return model.eval(), drift
+
+    float_model = load_float()
+    model = quantize_model(float_model)
+    drift = {'model': name, 'built': time.time()}
+    if measure_drift is not None:
+        with torch.no_grad():
+            drift.update(measure_drift(float_model, model))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    torch.save(model, tmp)
+    os.replace(tmp, path)
+    with open(report_path, 'w') as f:
+        json.dump(drift, f, indent=2)
+    return model, drift
+
+
+def demucs_drift(load_reference):
+    """
+    Drift measure for Demucs: per-source SNR (dB) of the quantized output
+    against the float output on a reference clip.
+    load_reference(samplerate) -> (channels, samples) array, only called
+    when the quantized model is actually built.
+    """
+    def measure(float_model, quantized_model):
+        from demucs.apply import apply_model
+
+        reference = torch.as_tensor(load_reference(float_model.samplerate))
+        mix = reference.float().cpu().unsqueeze(0)
+        expected = apply_model(float_model.cpu(), mix, device='cpu', shifts=0, split=True)[0]
+        actual = apply_model(quantized_model, mix, device='cpu', shifts=0, split=True)[0]
+        per_source = {
+            name: round(snr_db(expected[i].numpy(), actual[i].numpy()), 2)
+            for i, name in enumerate(float_model.sources)
+        }
+        return {
+            'referenceSeconds': round(reference.shape[-1] / float_model.samplerate, 2),
+            'snrDb': per_source,
+            'minSnrDb': min(per_source.values())
+        }
+    return measure
+
+
+def whisper_drift(load_reference):
+    """
+    Drift measure for Whisper: encoder SNR and decoded text agreement on a
+    reference clip. load_reference() -> 16 kHz mono array (first 30 s used).
+    """
+    def measure(float_model, quantized_model):
+        import difflib
+        import whisper
+
+        reference = load_reference()
+        audio = whisper.pad_or_trim(torch.from_numpy(np.asarray(reference, dtype=np.float32)))
+        mel = whisper.log_mel_spectrogram(audio, float_model.dims.n_mels).unsqueeze(0)
+        options = whisper.DecodingOptions(fp16=False, without_timestamps=True)
+
+        float_model = float_model.cpu()
+        encoder_snr = snr_db(float_model.encoder(mel).numpy(), quantized_model.encoder(mel).numpy())
+        expected = whisper.decode(float_model, mel, options)[0].text.strip()
+        actual = whisper.decode(quantized_model, mel, options)[0].text.strip()
+        return {
+            'referenceSeconds': round(min(len(reference), whisper.audio.N_SAMPLES) / whisper.audio.SAMPLE_RATE, 2),
+            'encoderSnrDb': round(encoder_snr, 2),
+            'textAgreement': round(difflib.SequenceMatcher(None, expected, actual).ratio(), 3)
+        }
+    return measure
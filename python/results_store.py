@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Columnar on-disk store for analysis results, plus library statistics
+A store is a directory with one append-only file per column and a small
+meta.json (schema, category dictionaries, committed row count):
+
+  float32/int32/bool  raw little-endian values           <column>.bin
+  category            int16 dictionary codes (-1 = none) <column>.bin
+  string              utf-8 bytes + int64 end offsets    <column>.bin/.off
+
+Appends write the column files first and meta.json last (atomic
+replace), so a crash mid-append loses at most the uncommitted rows.
+Readers memory-map only the columns they need, and statistics are
+vectorized group-bys (bincount/histogram) over those columns, so a
+summary of 100k tracks touches a few hundred KB.
+
+Usage:
+  results_store.py stats <store> [--db dbPath] [--top N]
+  results_store.py import <results.json> <store>
+      (a scan's JSON output or a {"results": [...]} progress file)
+"""
+import os
+import sys
+import json
+
+import numpy as np
+
+META_FILE = 'meta.json'
+FORMAT_VERSION = 1
+
+NUMERIC_DTYPES = {'float32': np.float32, 'int32': np.int32, 'bool': np.bool_}
+CATEGORY_DTYPE = np.int16
+OFFSET_DTYPE = np.int64
+
+# Results of the time signature / BPM scan scripts
+TIME_SIG_SCHEMA = (
+    ('file', 'string'),
+    ('filePath', 'string'),
+    ('timeSignature', 'category'),
+    ('confidence', 'float32'),
+    ('bpm', 'float32'),
+    ('bpmConfidence', 'float32'),
+    ('key', 'category'),
+    ('mode', 'category'),
+    ('duplicateOf', 'string'),
+    ('error', 'string'),
+    ('reason', 'category'),       # scoring outcome (ambiguous, insufficient_beats, ...)
+    ('failure', 'category'),      # why a file has no result (timeout, unreadable, ...)
+    # Beat grid (see beat_grid.py): base64 float32 deltas; 0 beatsPerBar = no grid
+    ('beatGrid', 'string'),
+    ('beatsPerBar', 'int32'),
+    ('firstDownbeat', 'int32'),
+)
+
+DEFAULT_TOP = 25
+HIGH_CONFIDENCE = 0.6
+BPM_BINS = np.arange(40, 250, 10)
+CONFIDENCE_BINS = np.linspace(0.0, 1.0, 11)
+
+
+class ResultsStore:
+    """
+    store = ResultsStore.create('time_sig_results', TIME_SIG_SCHEMA)
+    store.append(result_dicts); store.flush()
+    store = ResultsStore('time_sig_results'); store.column('bpm')
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.schema = [tuple(column) for column in self.meta['schema']]
+        self.kinds = dict(self.schema)
+        self._codes = {name: {value: code for code, value in enumerate(values)}
+                       for name, values in self.meta['categories'].items()}
+        self._buffer = []
+
+    @classmethod
+    def create(cls, path, schema=TIME_SIG_SCHEMA, **info):
+        """New empty store (replaces one already at path); info goes into meta"""
+        os.makedirs(path, exist_ok=True)
+        for name, kind in schema:
+            for suffix in ('.bin', '.off'):
+                column_file = os.path.join(path, name + suffix)
+                if os.path.exists(column_file):
+                    os.remove(column_file)
+        meta = {
+            'version': FORMAT_VERSION,
+            'schema': [list(column) for column in schema],
+            'categories': {name: [] for name, kind in schema if kind == 'category'},
+            'rows': 0,
+            'info': info
+        }
+        cls._write_meta(path, meta)
+        return cls(path)
+
+    @staticmethod
+    def _write_meta(path, meta):
+        tmp = os.path.join(path, META_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, META_FILE))
+
+    def __len__(self):
+        return self.meta['rows']
+
+    @property
+    def info(self):
+        return self.meta['info']
+
+    def set_info(self, **info):
+        self.meta['info'].update(info)
+        self._write_meta(self.path, self.meta)
+
+    # Writing
+
+    def append(self, rows):
+        """Buffer result dicts; they are committed by flush()"""
+        self._buffer.extend(rows)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        committed = self.meta['rows']
+        for name, kind in self.schema:
+            values = [row.get(name) for row in rows]
+            column_file = os.path.join(self.path, name + '.bin')
+            if kind == 'string':
+                data = [(value if value is not None else '').encode('utf-8') for value in values]
+                ends = self._string_end(name, committed) + np.cumsum([len(d) for d in data], dtype=OFFSET_DTYPE)
+                self._append_bytes(column_file, b''.join(data), self._string_end(name, committed))
+                self._append_array(os.path.join(self.path, name + '.off'), ends, committed)
+            elif kind == 'category':
+                codes = self._codes[name]
+                for value in values:
+                    if value is not None and value not in codes:
+                        codes[value] = len(codes)
+                        self.meta['categories'][name].append(value)
+                array = np.array([codes[v] if v is not None else -1 for v in values], dtype=CATEGORY_DTYPE)
+                self._append_array(column_file, array, committed)
+            else:
+                dtype = NUMERIC_DTYPES[kind]
+                if kind == 'float32':
+                    array = np.array([v if isinstance(v, (int, float, np.number)) else np.nan for v in values], dtype=dtype)
+                else:
+                    array = np.array([v if v is not None else 0 for v in values], dtype=dtype)
+                self._append_array(column_file, array, committed)
+        self.meta['rows'] = committed + len(rows)
+        self._write_meta(self.path, self.meta)
+
+    def _string_end(self, name, rows):
+        """Byte length of a string column's committed data"""
+        if rows == 0:
+            return 0
+        offsets = np.memmap(os.path.join(self.path, name + '.off'), dtype=OFFSET_DTYPE, mode='r', shape=(rows,))
+        return int(offsets[-1])
+
+    @staticmethod
+    def _append_array(column_file, array, committed):
+        ResultsStore._append_bytes(column_file, array.astype(array.dtype.newbyteorder('<')).tobytes(),
+                                   committed * array.dtype.itemsize)
+
+    @staticmethod
+    def _append_bytes(column_file, data, committed_bytes):
+        # Drop anything past the committed length (left by an interrupted append)
+        with open(column_file, 'ab') as f:
+            if f.tell() != committed_bytes:
+                f.truncate(committed_bytes)
+                f.seek(committed_bytes)
+            f.write(data)
+
+    # Reading
+
+    def column(self, name):
+        """
+        Numeric column as a read-only memmap; category columns as int16
+        codes (see categories()); string columns as a list of str.
+        """
+        kind = self.kinds[name]
+        rows = len(self)
+        if kind == 'string':
+            return self.strings(name)
+        dtype = CATEGORY_DTYPE if kind == 'category' else NUMERIC_DTYPES[kind]
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name + '.bin'), dtype=np.dtype(dtype).newbyteorder('<'),
+                         mode='r', shape=(rows,))
+
+    def categories(self, name):
+        return list(self.meta['categories'][name])
+
+    def strings(self, name, indices=None):
+        """Decode a string column (only the given row indices if passed)"""
+        rows = len(self)
+        if rows == 0:
+            return []
+        ends = np.memmap(os.path.join(self.path, name + '.off'), dtype=OFFSET_DTYPE, mode='r', shape=(rows,))
+        if int(ends[-1]) == 0:
+            return [''] * (rows if indices is None else len(indices))
+        data = np.memmap(os.path.join(self.path, name + '.bin'), dtype=np.uint8, mode='r')
+        indices = range(rows) if indices is None else indices
+        return [bytes(data[(int(ends[i - 1]) if i else 0):int(ends[i])]).decode('utf-8') for i in indices]
+
+    def present(self, name):
+        """Rows where a string column is non-empty, from the offsets alone"""
+        rows = len(self)
+        if rows == 0:
+            return np.zeros(0, dtype=bool)
+        ends = np.memmap(os.path.join(self.path, name + '.off'), dtype=OFFSET_DTYPE, mode='r', shape=(rows,))
+        return np.diff(ends, prepend=0) > 0
+
+    def records(self, indices):
+        """Rows as result dicts (for small selections)"""
+        indices = [int(i) for i in indices]
+        columns = {}
+        for name, kind in self.schema:
+            if kind == 'string':
+                columns[name] = self.strings(name, indices)
+            elif kind == 'category':
+                values = self.categories(name)
+                codes = self.column(name)[indices]
+                columns[name] = [values[c] if c >= 0 else None for c in codes]
+            else:
+                columns[name] = [v.item() for v in self.column(name)[indices]]
+        records = []
+        for position in range(len(indices)):
+            record = {}
+            for name, kind in self.schema:
+                value = columns[name][position]
+                if value is None or value == '' or (kind == 'float32' and np.isnan(value)):
+                    continue
+                record[name] = value
+            records.append(record)
+        return records
+
+
+def import_json(source, path, schema=TIME_SIG_SCHEMA):
+    """Convert a scan's JSON output (or {"results": [...]}) into a store"""
+    with open(source, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    results = data.get('results', []) if isinstance(data, dict) else data
+    store = ResultsStore.create(path, schema, source=os.path.abspath(source))
+    store.append(results)
+    store.flush()
+    return store
+
+
+def library_total(db_path=None):
+    """Track count in library.db, or None if there is no library"""
+    from library_db import connect, default_db_path
+    db_path = db_path or default_db_path()
+    if not os.path.exists(db_path):
+        return None
+    conn = connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _distribution(store, name, mask):
+    """{value: count} of a category column over the masked rows"""
+    values = store.categories(name)
+    codes = np.asarray(store.column(name))[mask]
+    counts = np.bincount(codes[codes >= 0], minlength=len(values))
+    return {value: int(count) for value, count in zip(values, counts) if count}
+
+
+def library_stats(store, library_tracks=None, top=DEFAULT_TOP):
+    """
+    Meter, BPM, key and confidence distributions over a results store.
+    library_tracks: true library size (library.db); falls back to the
+    number of files the scan planned, then to the stored rows.
+    """
+    rows = len(store)
+    failed = store.present('error')
+    ok = ~failed
+    analyzed = int(ok.sum())
+
+    total = library_tracks or store.info.get('planned') or rows
+    stats = {
+        'libraryTracks': int(total),
+        'analyzed': analyzed,
+        'errors': int(failed.sum()),
+        'coverage': round(analyzed / total, 4) if total else 0.0,
+        'errorReasons': _distribution(store, 'failure', failed) if 'failure' in store.kinds else {},
+    }
+
+    if 'timeSignature' in store.kinds:
+        meters = store.categories('timeSignature')
+        codes = np.asarray(store.column('timeSignature'))
+        valid = ok & (codes >= 0)
+        counts = np.bincount(codes[valid], minlength=len(meters))
+        confidence = np.asarray(store.column('confidence'), dtype=np.float64) if 'confidence' in store.kinds else None
+        meter_stats = {}
+        for code, meter in enumerate(meters):
+            if not counts[code]:
+                continue
+            entry = {'count': int(counts[code]), 'share': round(counts[code] / max(1, analyzed), 4)}
+            if confidence is not None:
+                entry['meanConfidence'] = round(float(np.nanmean(confidence[valid & (codes == code)])), 4)
+            meter_stats[meter] = entry
+        stats['meters'] = meter_stats
+
+        if confidence is not None:
+            non_common = valid & (codes != (meters.index('4/4') if '4/4' in meters else -2))
+            candidates = np.flatnonzero(non_common)
+            order = candidates[np.argsort(-np.nan_to_num(confidence[candidates], nan=-1.0), kind='stable')][:top]
+            # Only the listed rows' file names are decoded (not every string column)
+            files = store.strings('file', order) if 'file' in store.kinds else [None] * len(order)
+            stats['nonCommonTime'] = {
+                'count': int(non_common.sum()),
+                'highConfidence': int((non_common & (confidence > HIGH_CONFIDENCE)).sum()),
+                'top': [{'file': file or None, 'timeSignature': meters[codes[row]],
+                         'confidence': round(float(np.nan_to_num(confidence[row])), 4)}
+                        for row, file in zip(order, files)]
+            }
+
+    if 'bpm' in store.kinds:
+        bpm = np.asarray(store.column('bpm'), dtype=np.float64)
+        bpm = bpm[ok & np.isfinite(bpm)]
+        if len(bpm):
+            hist, edges = np.histogram(bpm, bins=BPM_BINS)
+            p10, median, p90 = np.percentile(bpm, [10, 50, 90])
+            stats['bpm'] = {
+                'mean': round(float(bpm.mean()), 2),
+                'median': round(float(median), 2),
+                'p10': round(float(p10), 2),
+                'p90': round(float(p90), 2),
+                'histogram': {f'{int(lo)}-{int(hi)}': int(n) for lo, hi, n in zip(edges[:-1], edges[1:], hist) if n}
+            }
+
+    if 'key' in store.kinds:
+        keys = store.categories('key')
+        key_codes = np.asarray(store.column('key'))
+        modes = store.categories('mode') if 'mode' in store.kinds else []
+        mode_codes = np.asarray(store.column('mode')) if modes else np.full(rows, -1, dtype=CATEGORY_DTYPE)
+        valid = ok & (key_codes >= 0)
+        # One bincount over (key, mode) pairs; mode -1 -> its own slot
+        width = len(modes) + 1
+        pairs = key_codes[valid].astype(np.int64) * width + (mode_codes[valid].astype(np.int64) + 1)
+        counts = np.bincount(pairs, minlength=len(keys) * width)
+        key_stats = {}
+        for pair in np.flatnonzero(counts):
+            key, mode = keys[pair // width], (modes[pair % width - 1] if pair % width else None)
+            key_stats[f'{key} {mode}' if mode else key] = int(counts[pair])
+        stats['keys'] = dict(sorted(key_stats.items(), key=lambda item: -item[1]))
+
+    for name in ('confidence', 'bpmConfidence'):
+        if name in store.kinds:
+            values = np.asarray(store.column(name), dtype=np.float64)
+            values = values[ok & np.isfinite(values)]
+            if len(values):
+                hist, _ = np.histogram(np.clip(values, 0.0, 1.0), bins=CONFIDENCE_BINS)
+                stats[name] = {'mean': round(float(values.mean()), 4), 'histogram': [int(n) for n in hist]}
+
+    return stats
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    db_path = None
+    top = DEFAULT_TOP
+    if '--db' in argv:
+        position = argv.index('--db')
+        db_path = argv[position + 1]
+        del argv[position:position + 2]
+    if '--top' in argv:
+        position = argv.index('--top')
+        top = int(argv[position + 1])
+        del argv[position:position + 2]
+
+    try:
+        if len(argv) == 2 and argv[0] == 'stats':
+            store = ResultsStore(argv[1])
+            print(json.dumps(library_stats(store, library_total(db_path), top), indent=2))
+        elif len(argv) == 3 and argv[0] == 'import':
+            store = import_json(argv[1], argv[2])
+            print(json.dumps({'rows': len(store), 'store': argv[2]}))
+        else:
+            print(json.dumps({'error': 'Usage: results_store.py stats <store> [--db dbPath] [--top N] | '
+                                       'import <results.json> <store>'}))
+            sys.exit(1)
+    except Exception as e:
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Sample-pad analysis and PCM cache for the sampler's samples table
+Each sample is decoded once, in a pool of workers, and analyzed for:
+
+  trim        start/end after silence removal (one-shots only; loops keep
+              their exact length so they stay in time)
+  gain        peak-normalizing gain (stored, not applied)
+  root pitch  median pYIN f0 of the first second -> note, MIDI, cents
+  kind        'loop' when the length is a whole number of bars at the
+              detected tempo and the sound does not decay away, else 'one-shot'
+  bpm         for loops, from the loop length (beats * 60 / seconds)
+
+The trimmed audio is written to the cache as raw planar float32 at
+CACHE_SR, one file per audio content hash, so a pad bank loads with
+np.memmap (or a Float32Array over the file) and no decoding. Results go
+into a sample_analysis table in library.db next to samples, keyed by
+filePath; unchanged files (same content hash, cache file present) are
+skipped on the next run.
+
+Usage:
+  sample_analysis.py analyze [files...] [--db dbPath] [--cache dir] [--force]
+                     [--workers N] [--timeout S] [--max-rss MB]
+      (no files: every row of the samples table)
+  sample_analysis.py bank [--db dbPath]
+      memory-map the analyzed pad bank and report load time
+Prints JSON-lines progress, then a {"status": "complete"} summary.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+import numpy as np
+
+from library_db import app_data_dir, connect, default_db_path, DbWriter
+from batch_analysis import BatchRunner, runner_options
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cached PCM format
+CACHE_SR = 44100
+CACHE_DTYPE = np.dtype('<f4')
+MAX_CHANNELS = 2
+# Bump when the cached PCM or the analysis changes meaning
+CACHE_VERSION = 1
+
+ANALYSIS_SR = 22050
+TRIM_TOP_DB = 60
+PEAK_TARGET = 0.98
+
+# Pitch (pYIN) search range and analyzed length
+PITCH_FMIN = 32.7     # C1
+PITCH_FMAX = 2093.0   # C7
+PITCH_SECONDS = 1.0
+MIN_VOICED_RATIO = 0.3
+
+# Loop detection
+LOOP_MIN_SECONDS = 1.0
+LOOP_BEATS = (2, 4, 8, 12, 16, 24, 32, 48, 64)
+LOOP_TEMPO_TOLERANCE = 0.06
+LOOP_BPM_RANGE = (60.0, 200.0)
+# Energy of the last quarter vs. the whole: loops keep playing, one-shots decay
+LOOP_TAIL_RATIO = 0.25
+LOOP_MIN_ONSETS = 4
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+
+def default_cache_root():
+    return os.path.join(app_data_dir(), 'sample_cache')
+
+
+def cache_path(root, content_hash):
+    return os.path.join(root, content_hash[:2], f'{content_hash}.v{CACHE_VERSION}.f32')
+
+
+def ensure_table(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS sample_analysis (
+          filePath        TEXT PRIMARY KEY,
+          contentHash     TEXT NOT NULL,
+          kind            TEXT,
+          trimStart       REAL,
+          trimEnd         REAL,
+          duration        REAL,
+          peak            REAL,
+          gain            REAL,
+          gainDb          REAL,
+          rootNote        TEXT,
+          rootMidi        REAL,
+          rootHz          REAL,
+          pitchConfidence REAL,
+          bpm             REAL,
+          beats           INTEGER,
+          sampleRate      INTEGER,
+          channels        INTEGER,
+          frames          INTEGER,
+          pcmPath         TEXT,
+          analyzed_at     DATETIME DEFAULT (datetime('now'))
+        );
+    """)
+
+
+def root_pitch(y, sr):
+    """Median f0 of the voiced frames at the start of the sample, or None"""
+    from startup import load_librosa
+    librosa = load_librosa()
+
+    y = y[:int(PITCH_SECONDS * sr)]
+    if len(y) < 2048:
+        y = np.pad(y, (0, 2048 - len(y)))
+    f0, voiced, _ = librosa.pyin(y, fmin=PITCH_FMIN, fmax=PITCH_FMAX, sr=sr, frame_length=2048)
+    voiced_ratio = float(np.mean(voiced)) if len(voiced) else 0.0
+    if voiced_ratio < MIN_VOICED_RATIO:
+        return None
+    hz = float(np.nanmedian(f0[voiced]))
+    midi = 69 + 12 * np.log2(hz / 440.0)
+    nearest = int(round(midi))
+    return {
+        'rootNote': f'{NOTE_NAMES[nearest % 12]}{nearest // 12 - 1}',
+        'rootMidi': round(float(midi), 2),
+        'rootHz': round(hz, 2),
+        'pitchConfidence': round(voiced_ratio, 3)
+    }
+
+
+def classify(y, sr):
+    """
+    ('loop', bpm, beats) when y spans a whole number of beats at its own
+    tempo and keeps its energy to the end, else ('one-shot', None, None)
+    """
+    from startup import load_librosa
+    from tempo_octave import correct_octave
+    librosa = load_librosa()
+
+    duration = len(y) / float(sr)
+    if duration < LOOP_MIN_SECONDS:
+        return 'one-shot', None, None
+    energy = np.square(y, dtype=np.float64)
+    tail = energy[-max(1, len(y) // 4):].mean() / (energy.mean() + 1e-12)
+    if tail < LOOP_TAIL_RATIO:
+        return 'one-shot', None, None
+
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr, aggregate=np.median)
+    if len(librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)) < LOOP_MIN_ONSETS:
+        return 'one-shot', None, None
+    tempo = correct_octave(float(librosa.feature.tempo(onset_envelope=onset_env, sr=sr)[0]))
+
+    # The loop length decides the exact BPM; the detected tempo picks the beat count
+    best = None
+    for beats in LOOP_BEATS:
+        bpm = beats * 60.0 / duration
+        if not LOOP_BPM_RANGE[0] <= bpm <= LOOP_BPM_RANGE[1]:
+            continue
+        error = abs(bpm / tempo - 1.0)
+        if error <= LOOP_TEMPO_TOLERANCE and (best is None or error < best[0]):
+            best = (error, bpm, beats)
+    if best is None:
+        return 'one-shot', None, None
+    return 'loop', round(best[1], 2), best[2]
+
+
+def analyze_sample(file_path, cache_root=None):
+    """
+    Analyze one sample and write its trimmed PCM to the cache.
+    Returns the sample_analysis row as a dict.
+    """
+    from audio_decode import load_audio, resample
+    from content_hash import audio_content_hash
+    from startup import load_librosa
+    librosa = load_librosa()
+
+    cache_root = cache_root or default_cache_root()
+    content_hash = audio_content_hash(file_path)
+    y, sr = load_audio(file_path, sr=CACHE_SR, mono=False, quality='high')
+    y = y[:MAX_CHANNELS]
+    if y.shape[1] == 0:
+        return {'filePath': file_path, 'error': 'No audio frames'}
+    mono = resample(y.mean(axis=0), CACHE_SR, ANALYSIS_SR)
+
+    kind, bpm, beats = classify(mono, ANALYSIS_SR)
+    start, end = 0, y.shape[1]
+    if kind == 'one-shot':
+        _, (start, end) = librosa.effects.trim(y.mean(axis=0), top_db=TRIM_TOP_DB, frame_length=512, hop_length=128)
+        if end <= start:
+            start, end = 0, y.shape[1]
+    pcm = np.ascontiguousarray(y[:, start:end], dtype=CACHE_DTYPE)
+
+    peak = float(np.max(np.abs(pcm))) if pcm.size else 0.0
+    gain = PEAK_TARGET / peak if peak > 0 else 1.0
+
+    pcm_path = cache_path(cache_root, content_hash)
+    os.makedirs(os.path.dirname(pcm_path), exist_ok=True)
+    # Unique temp name: pads sharing one sample may be analyzed by several workers at once
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(pcm_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pcm.tofile(f)
+        os.replace(tmp, pcm_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    result = {
+        'filePath': file_path,
+        'contentHash': content_hash,
+        'kind': kind,
+        'trimStart': round(int(start) / float(CACHE_SR), 4),
+        'trimEnd': round(int(end) / float(CACHE_SR), 4),
+        'duration': round(int(end - start) / float(CACHE_SR), 4),
+        'peak': round(peak, 5),
+        'gain': round(gain, 5),
+        'gainDb': round(float(20 * np.log10(gain)), 2),
+        'rootNote': None, 'rootMidi': None, 'rootHz': None, 'pitchConfidence': None,
+        'bpm': bpm,
+        'beats': beats,
+        'sampleRate': CACHE_SR,
+        'channels': pcm.shape[0],
+        'frames': pcm.shape[1],
+        'pcmPath': pcm_path
+    }
+    offset = int(start * ANALYSIS_SR / CACHE_SR)
+    result.update(root_pitch(mono[offset:offset + int((end - start) * ANALYSIS_SR / CACHE_SR)], ANALYSIS_SR) or {})
+    return result
+
+
+ROW_COLUMNS = ('filePath', 'contentHash', 'kind', 'trimStart', 'trimEnd', 'duration', 'peak', 'gain', 'gainDb',
+               'rootNote', 'rootMidi', 'rootHz', 'pitchConfidence', 'bpm', 'beats', 'sampleRate', 'channels',
+               'frames', 'pcmPath')
+
+
+def emit(payload):
+    print(json.dumps(payload))
+    sys.stdout.flush()
+
+
+def analyze_samples(files=None, db_path=None, cache_root=None, force=False, **runner_kwargs):
+    db_path = db_path or default_db_path()
+    cache_root = cache_root or default_cache_root()
+    conn = connect(db_path)
+    try:
+        ensure_table(conn)
+        conn.commit()
+        if not files:
+            files = [row[0] for row in conn.execute("SELECT filePath FROM samples ORDER BY pad_index")]
+        done = {row[0]: (row[1], row[2]) for row in
+                conn.execute("SELECT filePath, contentHash, pcmPath FROM sample_analysis")}
+    finally:
+        conn.close()
+
+    from content_hash import audio_content_hash
+    todo, skipped, failed = [], [], []
+    for file_path in files:
+        try:
+            previous = done.get(file_path)
+            if (not force and previous and os.path.exists(previous[1] or '')
+                    and audio_content_hash(file_path) == previous[0]):
+                skipped.append(file_path)
+            else:
+                todo.append(file_path)
+        except OSError as e:
+            failed.append({'filePath': file_path, 'error': str(e), 'failure': 'unreadable'})
+    emit({'status': 'initializing', 'progress': 0,
+          'message': f'{len(todo)} samples to analyze, {len(skipped)} unchanged'})
+
+    analyzed = []
+    if todo:
+        runner = BatchRunner('sample_analysis:analyze_sample', sys_paths=[SCRIPT_DIR], **runner_kwargs)
+        for file_path in todo:
+            runner.submit(file_path, file_path, cache_root)
+        placeholders = ', '.join('?' * len(ROW_COLUMNS))
+        with DbWriter(db_path) as writer:
+            for count, (file_path, result) in enumerate(runner.results(), 1):
+                if 'error' in result:
+                    failed.append(dict(result, filePath=file_path))
+                else:
+                    writer.execute(f"INSERT OR REPLACE INTO sample_analysis ({', '.join(ROW_COLUMNS)}) "
+                                   f"VALUES ({placeholders})", [result.get(c) for c in ROW_COLUMNS])
+                    analyzed.append(result)
+                emit({'status': 'analyzing', 'progress': int(100 * count / len(todo)),
+                      'message': f'Analyzed {count}/{len(todo)}: {os.path.basename(file_path)}'})
+
+    summary = {'status': 'complete', 'progress': 100, 'analyzed': len(analyzed), 'skipped': len(skipped),
+               'failed': failed, 'results': analyzed}
+    emit(summary)
+    return summary
+
+
+def load_bank(db_path=None):
+    """
+    Analyzed pads in pad order, each with its trimmed PCM as a read-only
+    (channels, frames) float32 memmap - no decoding.
+    """
+    conn = connect(db_path or default_db_path())
+    try:
+        ensure_table(conn)
+        conn.row_factory = lambda cursor, row: {d[0]: v for d, v in zip(cursor.description, row)}
+        rows = conn.execute("""
+            SELECT s.id, s.name, s.pad_index AS padIndex, a.*
+            FROM samples s JOIN sample_analysis a ON a.filePath = s.filePath
+            ORDER BY s.pad_index
+        """).fetchall()
+    finally:
+        conn.close()
+    bank = []
+    for row in rows:
+        if not row['pcmPath'] or not os.path.exists(row['pcmPath']) or not row['frames']:
+            continue
+        row['pcm'] = np.memmap(row['pcmPath'], dtype=CACHE_DTYPE, mode='r', shape=(row['channels'], row['frames']))
+        bank.append(row)
+    return bank
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    options = runner_options(argv)
+    for flag, key in (('--db', 'db_path'), ('--cache', 'cache_root')):
+        if flag in argv:
+            position = argv.index(flag)
+            options[key] = argv[position + 1]
+            del argv[position:position + 2]
+    args = [a for a in argv if not a.startswith('--')]
+    if not args or args[0] not in ('analyze', 'bank'):
+        print(json.dumps({'error': 'Usage: sample_analysis.py analyze [files...] [--db dbPath] [--cache dir] [--force] '
+                                   '[--workers N] | bank [--db dbPath]'}))
+        sys.exit(1)
+
+    try:
+        if args[0] == 'analyze':
+            analyze_samples(args[1:], force='--force' in argv, **options)
+        else:
+            started = time.perf_counter()
+            bank = load_bank(options.get('db_path'))
+            print(json.dumps({
+                'pads': len(bank),
+                'frames': int(sum(pad['frames'] for pad in bank)),
+                'loadSeconds': round(time.perf_counter() - started, 4),
+                'samples': [{k: v for k, v in pad.items() if k != 'pcm'} for pad in bank]
+            }))
+    except Exception as e:
+        emit({'status': 'error', 'error': str(e)})
+        sys.exit(1)
@@ -3,145 +3,439 @@
 Demucs Stem Separation CLI Wrapper
 Extracts vocals, drums, bass, and other instruments from audio files
 Uses Demucs v4 (better quality than Spleeter, Python 3.13 compatible)
+
+Usage:
+  separate_stems.py <input_file> <output_dir> <stems_count> [format] [--no-cache] [--quality tier] [--cpu-accel]
+  separate_stems.py --batch [format]   (JSON job per stdin line:
+      {"input_file": ..., "output_dir": ..., "stems_mode": ..., "format": ...,
+       "quality": ..., "cpu_accel": ...})
+
+format: wav (32-bit float, default), wav16, flac, f16 - see stem_writer.py
+quality: resampler tier used when the file is not at the model rate
+         (fast, balanced, high (default), best) - see audio_decode.py
+--cpu-accel: int8 dynamic-quantized model when running without CUDA
+             (built once and cached, see model_accel.py)
+--profile: print a {"status": "profile"} line with import and run timings
+Separated sources are cached by audio content (see stem_cache.py), so
+repeat requests skip Demucs entirely. torch is only imported on a miss,
+except with --cpu-accel: whether CUDA is available decides which model's
+stems are cached, so torch is imported before the lookup.
 """
 import sys
 import json
 import os
-import torch
+import time
+import threading
 import numpy as np
-import librosa
-import soundfile as sf
 
-def main():
-    if len(sys.argv) < 4:
-        print(json.dumps({"error": "Usage: separate_stems.py <input_file> <output_dir> <stems_count>"}))
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_dir = sys.argv[2]
-    stems_mode = sys.argv[3]  # "2stems" or "4stems" or "5stems"
-    
+from audio_decode import load_audio, QUALITY_TIERS
+from startup import load_torch, pop_profile_flag, profile_report
+from stem_writer import StemWriter, StreamingStemFile, OUTPUT_FORMATS, DEFAULT_FORMAT, stem_extension
+from stem_cache import StemCache
+from content_hash import audio_content_hash
+
+# Inference parameters (part of the stem cache key)
+APPLY_PARAMS = {'shifts': 1, 'split': True, 'overlap': 0.25}
+TWO_STEM_PARAMS = dict(APPLY_PARAMS, stems='2stems')
+
+# Resampler tier for decoding to the model rate
+SEPARATION_QUALITY = 'high'
+
+# Seconds of the input used to measure quantization drift
+DRIFT_REFERENCE_SECONDS = 10.0
+
+# Lean 2-stem mode: chunk length and crossfade between chunks (seconds)
+TWO_STEM_CHUNK_SECONDS = 30.0
+TWO_STEM_OVERLAP_SECONDS = 1.0
+
+_print_lock = threading.Lock()
+_models = {}
+
+
+def emit(payload):
+    """Print one JSON progress line (writer threads report too)"""
+    with _print_lock:
+        print(json.dumps(payload))
+        sys.stdout.flush()
+
+
+def load_float_model(model_name):
+    from demucs.pretrained import get_model
+    return get_model(model_name)
+
+
+def get_separation_model(model_name, device, cpu_accel=False, load_reference=None, report=None):
+    """
+    Load each Demucs model once per process (batch jobs share it).
+    cpu_accel returns the cached int8 model, building it (and its drift
+    report against the float model on load_reference) on first use.
+    """
+    key = (model_name, cpu_accel)
+    if key not in _models:
+        if cpu_accel:
+            from model_accel import load_quantized, demucs_drift
+            model, drift = load_quantized(
+                model_name,
+                lambda: load_float_model(model_name),
+                demucs_drift(load_reference) if load_reference else None
+            )
+            if report and drift and 'minSnrDb' in drift:
+                report({
+                    "status": "initializing",
+                    "progress": 20,
+                    "message": f"Using int8 model (drift vs float: {drift['minSnrDb']} dB SNR)",
+                    "drift": drift
+                })
+        else:
+            model = load_float_model(model_name)
+        model.to(device)
+        _models[key] = model
+    return _models[key]
+
+
+def stream_two_stems(model, wav, device, vocal_sinks, accompaniment_sinks, report=None):
+    """
+    Vocals/accompaniment separation chunk by chunk. Each chunk's sources are
+    reduced to vocals + (sum of the rest) right away and appended to the
+    sinks, so the full sources tensor and its numpy copies never exist.
+    Chunks overlap by TWO_STEM_OVERLAP_SECONDS and are linearly crossfaded.
+    """
+    from demucs.apply import apply_model
+    torch = load_torch()
+
+    total = wav.shape[-1]
+    step = int(TWO_STEM_CHUNK_SECONDS * model.samplerate)
+    overlap = int(TWO_STEM_OVERLAP_SECONDS * model.samplerate)
+    fade_in = np.linspace(0.0, 1.0, overlap, dtype=np.float32)
+    fade_out = 1.0 - fade_in
+    vocals_idx = model.sources.index('vocals')
+    n_chunks = max(1, int(np.ceil((total - overlap) / step)))
+
+    tail = None
+    start = 0
+    chunk = 0
+    while True:
+        end = start + step + overlap
+        last = end >= total
+        segment = wav[:, start:total if last else end]
+
+        with torch.no_grad():
+            sources = apply_model(model, segment.unsqueeze(0), device=device, **APPLY_PARAMS)[0]
+            vocals = sources[vocals_idx]
+            # One reduction over the source axis instead of a += loop
+            accompaniment = sources.sum(dim=0) - vocals
+            block = torch.stack([vocals, accompaniment]).cpu().numpy()
+            del sources, vocals, accompaniment
+
+        if tail is not None:
+            n = min(overlap, block.shape[-1])
+            block[..., :n] = tail[..., :n] * fade_out[:n] + block[..., :n] * fade_in[:n]
+
+        keep = block.shape[-1] if last else step
+        tail = None if last else block[..., step:].copy()
+        for sink in vocal_sinks:
+            sink.write(block[0, :, :keep])
+        for sink in accompaniment_sinks:
+            sink.write(block[1, :, :keep])
+
+        chunk += 1
+        if report:
+            report({
+                "status": "separating",
+                "progress": 35 + int(55 * chunk / n_chunks),
+                "message": f"Separating vocals ({chunk}/{n_chunks})..."
+            })
+        if last:
+            break
+        start += step
+
+
+def cache_params(params, quality, cpu_accel=False):
+    """Non-default resample tiers and int8 models get their own cache entries"""
+    if quality != SEPARATION_QUALITY:
+        params = dict(params, resample=quality)
+    if cpu_accel:
+        params = dict(params, int8=True)
+    return params
+
+
+def separate_file(input_file, output_dir, stems_mode, output_format, writer, job=None,
+                  on_complete=None, use_cache=True, quality=SEPARATION_QUALITY, cpu_accel=False):
+    """
+    Run Demucs on one file (or reuse cached sources) and queue its stems
+    on the writer. Returns the list of write futures; on_complete(stems_files)
+    runs once every stem is on disk.
+    """
+    def report(payload):
+        if job is not None:
+            payload['job'] = job
+        emit(payload)
+
     # Extract song name from output directory for file naming
     # Output dir will be like: C:\Users\suppo\Music\Stems\Artist - Song Name
     song_name = os.path.basename(output_dir)
-    
-    try:
-        # Progress: Initializing
-        print(json.dumps({"status": "initializing", "progress": 0, "message": "Starting stem separation..."}))
-        sys.stdout.flush()
-        
-        # Import Demucs
-        from demucs.pretrained import get_model
-        from demucs.apply import apply_model
-        
-        print(json.dumps({"status": "initializing", "progress": 10, "message": "Loading Demucs AI model..."}))
-        sys.stdout.flush()
-        
-        # Choose model based on stems count
-        # htdemucs = 4 stems (vocals, drums, bass, other)
-        # htdemucs_6s = 6 stems (adds piano, guitar)
-        if stems_mode == '5stems':
-            model_name = 'htdemucs_6s'
-        else:
-            model_name = 'htdemucs'
-        
-        # Load model (downloads ~300MB on first run)
-        model = get_model(model_name)
+    extension = stem_extension(output_format)
+
+    # Choose model based on stems count
+    # htdemucs = 4 stems (vocals, drums, bass, other)
+    # htdemucs_6s = 6 stems (adds piano, guitar)
+    if stems_mode == '5stems':
+        model_name = 'htdemucs_6s'
+    else:
+        model_name = 'htdemucs'
+
+    # Same audio + model + parameters = same stems, whatever the output_dir
+    cache = StemCache() if use_cache else None
+    audio_hash = audio_content_hash(input_file) if cache else None
+    # Quantized kernels are CPU-only, and the cache key depends on which model
+    # runs, so --cpu-accel imports torch before the lookup to check for CUDA
+    cpu_accel = cpu_accel and not load_torch().cuda.is_available()
+    full_params = cache_params(APPLY_PARAMS, quality, cpu_accel)
+    two_stem_params = cache_params(TWO_STEM_PARAMS, quality, cpu_accel)
+    entry = cache.lookup(audio_hash, model_name, full_params) if cache else None
+    if entry is None and cache and stems_mode == '2stems':
+        entry = cache.lookup(audio_hash, model_name, two_stem_params)
+
+    if entry is not None:
+        report({"status": "processing", "progress": 75, "message": "Found cached stems, skipping separation..."})
+        stem_names = entry.sources
+        samplerate = entry.samplerate
+        sources = None
+    else:
+        report({"status": "initializing", "progress": 10, "message": "Loading Demucs AI model..."})
+        torch = load_torch()
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        model.to(device)
-        
-        print(json.dumps({"status": "initializing", "progress": 25, "message": "Preparing audio file..."}))
-        sys.stdout.flush()
-        
-        # Load audio with librosa (more reliable than torchaudio)
-        wav_data, sr = librosa.load(input_file, sr=None, mono=False)
-        
+
+        def load_reference(samplerate):
+            clip, _ = load_audio(input_file, sr=samplerate, mono=False,
+                                 duration=DRIFT_REFERENCE_SECONDS, quality=quality)
+            return np.concatenate([clip, clip]) if clip.shape[0] == 1 else clip[:2]
+
+        # Load model (downloads ~300MB on first run)
+        model = get_separation_model(model_name, device, cpu_accel, load_reference, report)
+
+        report({"status": "initializing", "progress": 25, "message": "Preparing audio file..."})
+
+        # Stream-decode and resample straight to the model rate (soxr, block by block)
+        wav_data, sr = load_audio(input_file, sr=model.samplerate, mono=False, quality=quality)
+
         # Ensure stereo (Demucs expects stereo input)
-        if wav_data.ndim == 1:
-            wav_data = np.stack([wav_data, wav_data])
+        if wav_data.shape[0] == 1:
+            wav_data = np.concatenate([wav_data, wav_data])
         elif wav_data.shape[0] > 2:
             wav_data = wav_data[:2]  # Keep only first 2 channels
-        
-        # Resample if needed
-        if sr != model.samplerate:
-            wav_data = librosa.resample(wav_data, orig_sr=sr, target_sr=model.samplerate)
-        
+
         # Convert to torch tensor and move to device
         wav = torch.from_numpy(wav_data).float().to(device)
-        
-        print(json.dumps({"status": "separating", "progress": 35, "message": "Processing audio with AI..."}))
-        sys.stdout.flush()
-        
+
+        report({"status": "separating", "progress": 35, "message": "Processing audio with AI..."})
+
+        if stems_mode == '2stems':
+            # Karaoke path: stream vocals/accompaniment straight to disk
+            os.makedirs(output_dir, exist_ok=True)
+            channels, total = wav.shape
+            outputs = {
+                name: StreamingStemFile(
+                    os.path.join(output_dir, f'{song_name} {name.capitalize()}{extension}'),
+                    model.samplerate, channels, total, output_format
+                )
+                for name in ('vocals', 'accompaniment')
+            }
+            sinks = {name: [output] for name, output in outputs.items()}
+            commit = None
+            if cache is not None:
+                cache_sinks, commit = cache.store_streaming(
+                    audio_hash, model_name, two_stem_params, ['vocals', 'accompaniment'],
+                    channels, total, model.samplerate
+                )
+                for name, sink in cache_sinks.items():
+                    sinks[name].append(sink)
+
+            stream_two_stems(model, wav, device, sinks['vocals'], sinks['accompaniment'], report)
+
+            stems_files = {name: output.close() for name, output in outputs.items()}
+            if commit is not None:
+                entry = commit()
+                for name, path in stems_files.items():
+                    entry.adopt_encoded(name, output_format, path)
+            stems_files['other'] = stems_files['accompaniment']  # Alias for UI compatibility
+            if on_complete:
+                on_complete(stems_files)
+            report({"status": "complete", "progress": 100, "stems": stems_files})
+            return []
+
+        from demucs.apply import apply_model
+
         # Apply model (this is the slow part)
-        sources = apply_model(model, wav.unsqueeze(0), device=device)[0]
-        
-        print(json.dumps({"status": "processing", "progress": 75, "message": "AI separation complete, saving stems..."}))
-        sys.stdout.flush()
-        
-        # Create output directory
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Save stems
-        stems_files = {}
+        sources = apply_model(model, wav.unsqueeze(0), device=device, **APPLY_PARAMS)[0]
         stem_names = model.sources
-        
-        if stems_mode == '2stems':
-            # Combine non-vocal stems into accompaniment
-            vocals_idx = stem_names.index('vocals') if 'vocals' in stem_names else 0
-            vocals = sources[vocals_idx]
-            
-            # Sum all non-vocal stems
-            accompaniment = torch.zeros_like(vocals)
-            for i, name in enumerate(stem_names):
-                if name != 'vocals':
-                    accompaniment += sources[i]
-            
-            # Save vocals
-            print(json.dumps({"status": "processing", "progress": 85, "message": "Saving vocals.wav..."}))
-            sys.stdout.flush()
-            vocals_path = os.path.join(output_dir, f'{song_name} Vocals.wav')
-            vocals_np = vocals.cpu().numpy()
-            sf.write(vocals_path, vocals_np.T, model.samplerate)
-            stems_files['vocals'] = vocals_path
-            
-            # Save accompaniment
-            print(json.dumps({"status": "processing", "progress": 92, "message": "Saving accompaniment.wav..."}))
-            sys.stdout.flush()
-            accomp_path = os.path.join(output_dir, f'{song_name} Accompaniment.wav')
-            accomp_np = accompaniment.cpu().numpy()
-            sf.write(accomp_path, accomp_np.T, model.samplerate)
-            stems_files['accompaniment'] = accomp_path
-            stems_files['other'] = accomp_path  # Alias for UI compatibility
+        samplerate = model.samplerate
+
+        report({"status": "processing", "progress": 75, "message": "AI separation complete, saving stems..."})
+
+        if cache is not None:
+            entry = cache.store(audio_hash, model_name, full_params, stem_names,
+                                [source.cpu().numpy() for source in sources], samplerate)
+
+    # Create output directory
+    os.makedirs(output_dir, exist_ok=True)
+
+    if stems_mode == '2stems':
+        wanted = ['vocals', 'accompaniment']
+    else:
+        wanted = list(stem_names)
+
+    def stem_data(name):
+        # Cached 'accompaniment' is derived from the 4-stem sources on demand
+        if sources is None:
+            return entry.load_source(name)
+        return sources[stem_names.index(name)].cpu().numpy()
+
+    # Cached encodings are copied into place; everything else goes to the writer
+    stems = {}
+    linked = {}
+    for name in wanted:
+        stem_path = os.path.join(output_dir, f'{song_name} {name.capitalize()}{extension}')
+        if entry is not None and entry.materialize(name, output_format, stem_path):
+            linked[name] = stem_path
         else:
-            # Save each stem separately with song name prefix
-            progress_per_stem = 20 / len(stem_names)  # Distribute 80-100% across stems
-            for i, name in enumerate(stem_names):
-                current_progress = 80 + int((i + 1) * progress_per_stem)
-                stem_label = name.capitalize()
-                print(json.dumps({"status": "processing", "progress": current_progress, "message": f"Saving {stem_label}.wav..."}))
-                sys.stdout.flush()
-                
-                stem_path = os.path.join(output_dir, f'{song_name} {stem_label}.wav')
-                stem_np = sources[i].cpu().numpy()
-                sf.write(stem_path, stem_np.T, model.samplerate)
-                stems_files[name] = stem_path
-        
-        print(json.dumps({"status": "processing", "progress": 98, "message": "Verifying files..."}))
-        sys.stdout.flush()
-        
-        # Complete
-        print(json.dumps({
-            "status": "complete",
-            "progress": 100,
-            "stems": stems_files
-        }))
-        sys.stdout.flush()
-        
+            stems[name] = (stem_path, stem_data(name))
+
+    # Encode all stems concurrently - the caller can start the next job meanwhile
+    saved = {'count': len(linked)}
+    progress_per_stem = 20 / len(wanted)  # Distribute 80-100% across stems
+
+    def on_stem(name, path):
+        saved['count'] += 1
+        report({
+            "status": "processing",
+            "progress": 80 + int(saved['count'] * progress_per_stem) - 2,
+            "message": f"Saved {os.path.basename(path)}"
+        })
+
+    def on_done(paths, error):
+        if error is not None:
+            # Single-file runs re-raise from the futures instead
+            if job is not None:
+                report({"status": "error", "error": f"Failed to save stems: {error}"})
+            return
+        if entry is not None:
+            for name, path in paths.items():
+                entry.adopt_encoded(name, output_format, path)
+        stems_files = dict(linked)
+        stems_files.update(paths)
+        if stems_mode == '2stems':
+            stems_files['other'] = stems_files['accompaniment']  # Alias for UI compatibility
+        if on_complete:
+            on_complete(stems_files)
+        report({"status": "complete", "progress": 100, "stems": stems_files})
+
+    if not stems:
+        on_done({}, None)
+        return []
+
+    report({"status": "processing", "progress": 80, "message": f"Saving {len(stems)} stems ({output_format})..."})
+    return writer.submit_job(stems, samplerate, output_format, on_stem=on_stem, on_done=on_done)
+
+
+def run_batch(default_format):
+    """Separate one JSON job per stdin line, overlapping writes with inference"""
+    writer = StemWriter()
+    job = 0
+    try:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            job += 1
+            try:
+                config = json.loads(line)
+                output_format = config.get('format') or default_format
+                if output_format not in OUTPUT_FORMATS:
+                    raise ValueError(f"Unknown stem format: {output_format}")
+                quality = config.get('quality') or SEPARATION_QUALITY
+                if quality not in QUALITY_TIERS:
+                    raise ValueError(f"Unknown resample quality: {quality}")
+                separate_file(
+                    config['input_file'],
+                    config['output_dir'],
+                    config.get('stems_mode', '4stems'),
+                    output_format,
+                    writer,
+                    job=job,
+                    use_cache=config.get('cache', True),
+                    quality=quality,
+                    cpu_accel=config.get('cpu_accel', False)
+                )
+            except Exception as e:
+                emit({"status": "error", "job": job, "error": str(e)})
+    finally:
+        writer.shutdown(wait=True)
+    emit({"status": "batch_complete", "jobs": job})
+
+
+def main():
+    argv = sys.argv[1:]
+    profile = pop_profile_flag(argv)
+    started = time.perf_counter()
+    try:
+        run(argv)
+    finally:
+        if profile:
+            # separationSeconds includes the lazy torch/demucs imports listed under imports
+            emit(dict(profile_report(separationSeconds=round(time.perf_counter() - started, 3)),
+                      status="profile"))
+
+
+def run(argv):
+    if len(argv) >= 1 and argv[0] == '--batch':
+        output_format = argv[1] if len(argv) > 1 else DEFAULT_FORMAT
+        run_batch(output_format)
+        return
+
+    quality = SEPARATION_QUALITY
+    if '--quality' in argv:
+        position = argv.index('--quality')
+        quality = argv[position + 1] if position + 1 < len(argv) else ''
+        del argv[position:position + 2]
+    args = [a for a in argv if a not in ('--no-cache', '--cpu-accel')]
+    use_cache = '--no-cache' not in argv
+    cpu_accel = '--cpu-accel' in argv
+
+    if len(args) < 3:
+        print(json.dumps({"error": "Usage: separate_stems.py <input_file> <output_dir> <stems_count> [format] [--no-cache] [--quality tier] [--cpu-accel]"}))
+        sys.exit(1)
+
+    if quality not in QUALITY_TIERS:
+        print(json.dumps({"status": "error", "error": f"Unknown resample quality: {quality} (use {', '.join(QUALITY_TIERS)})"}))
+        sys.exit(1)
+
+    input_file = args[0]
+    output_dir = args[1]
+    stems_mode = args[2]  # "2stems" or "4stems" or "5stems"
+    output_format = args[3] if len(args) > 3 else DEFAULT_FORMAT
+
+    if output_format not in OUTPUT_FORMATS:
+        print(json.dumps({"status": "error", "error": f"Unknown stem format: {output_format} (use {', '.join(OUTPUT_FORMATS)})"}))
+        sys.exit(1)
+
+    writer = StemWriter()
+    try:
+        # Progress: Initializing
+        emit({"status": "initializing", "progress": 0, "message": "Starting stem separation..."})
+
+        futures = separate_file(input_file, output_dir, stems_mode, output_format, writer,
+                                use_cache=use_cache, quality=quality, cpu_accel=cpu_accel)
+        for future in futures:
+            future.result()
+
     except Exception as e:
         import traceback
         error_details = f"{str(e)}\n{traceback.format_exc()}"
-        print(json.dumps({"status": "error", "error": error_details}))
+        emit({"status": "error", "error": error_details})
         sys.exit(1)
+    finally:
+        writer.shutdown(wait=True)
+
 
 if __name__ == "__main__":
     main()
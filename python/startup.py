@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Process startup helpers for the Python entry points
+Heavy modules (librosa -> numba/scipy, torch) are imported inside the
+functions that need them, so usage errors and cache hits return without
+paying for them.
+
+librosa compiles its numba kernels on import and first call. Numba can
+persist them, but by default it writes next to the installed package,
+which is read-only in the Electron bundle, so every fresh process
+recompiled. configure_numba_cache() points the cache at an app-managed
+directory; warmup.py fills it once at install.
+
+--profile on the entry points reports import and run timings.
+"""
+import os
+import sys
+import time
+import importlib
+
+from library_db import app_data_dir
+
+NUMBA_CACHE_SUBDIR = 'numba_cache'
+
+# librosa submodules the analyzers touch (librosa itself loads them lazily)
+LIBROSA_MODULES = ('librosa', 'librosa.onset', 'librosa.beat', 'librosa.feature')
+
+_process_start = time.perf_counter()
+_import_seconds = {}
+
+
+def numba_cache_dir():
+    return os.path.join(app_data_dir(), NUMBA_CACHE_SUBDIR)
+
+
+def configure_numba_cache():
+    """
+    Set NUMBA_CACHE_DIR before numba is imported (an explicit setting wins).
+    Returns the directory in use.
+    """
+    if 'numba' not in sys.modules:
+        path = os.environ.setdefault('NUMBA_CACHE_DIR', numba_cache_dir())
+        try:
+            os.makedirs(path, exist_ok=True)
+        except OSError:
+            pass
+    return os.environ.get('NUMBA_CACHE_DIR')
+
+
+def timed_import(name):
+    """importlib.import_module that records how long the first import took"""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_seconds[name] = round(time.perf_counter() - start, 3)
+    return module
+
+
+def load_librosa():
+    """Import librosa (and the submodules we use) with the persistent JIT cache"""
+    configure_numba_cache()
+    for name in LIBROSA_MODULES:
+        timed_import(name)
+    return sys.modules['librosa']
+
+
+def load_torch():
+    return timed_import('torch')
+
+
+def pop_profile_flag(argv):
+    """Remove --profile from an argv list (in place); True if it was there"""
+    if '--profile' in argv:
+        argv.remove('--profile')
+        return True
+    return False
+
+
+def profile_report(**sections):
+    """
+    {imports: {module: seconds}, importSeconds, totalSeconds, ...sections}
+    totalSeconds counts from when this module was first imported.
+    """
+    report = {
+        'imports': dict(_import_seconds),
+        'importSeconds': round(sum(_import_seconds.values()), 3),
+        'totalSeconds': round(time.perf_counter() - _process_start, 3),
+        'numbaCacheDir': os.environ.get('NUMBA_CACHE_DIR'),
+    }
+    report.update(sections)
+    return report
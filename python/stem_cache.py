@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Content-addressed stem cache
+Raw Demucs sources are stored once per (audio content hash, model,
+inference parameters) as float16 arrays. 2-stem accompaniment is derived
+from cached 4-stem sources by summation, and encoded stem files are kept
+per output format so repeat requests are materialized by a copy
+(a copy-on-write clone where the filesystem supports it). Files handed
+to users never share storage with the cache, so editing an exported stem
+in place cannot corrupt the cached entry.
+
+Layout: <root>/<key[:2]>/<key>/
+  meta.json                      sources, samplerate, model
+  sources/<name>.npy             float16 (channels, samples)
+  encoded/<format>/<name><ext>   encoded outputs, copied into output dirs
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+
+import numpy as np
+
+from library_db import app_data_dir
+from stem_writer import stem_extension, StreamingStemFile
+
+# Evict least recently used entries beyond this size
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+# Entries without meta.json are still being written; only files untouched
+# this long are treated as abandoned (crashed writer) and may be evicted
+PARTIAL_ENTRY_GRACE_SECONDS = 24 * 3600
+
+# ioctl cloning a whole file on Linux (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+
+def default_cache_root():
+    return os.path.join(app_data_dir(), 'stem_cache')
+
+
+def clone_or_copy(source, target):
+    """Independent copy of source: reflink (instant, shared until written) or a plain copy"""
+    if os.path.exists(target):
+        os.remove(target)
+    if sys.platform.startswith('linux'):
+        import fcntl
+        try:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return target
+        except OSError:
+            pass
+    shutil.copyfile(source, target)
+    return target
+
+
+class StemCacheEntry:
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.sources = meta['sources']
+        self.samplerate = meta['samplerate']
+
+    def source_path(self, name):
+        return os.path.join(self.path, 'sources', f'{name}.npy')
+
+    def load_source(self, name):
+        """Memory-mapped float16 source; derives 'accompaniment' if needed"""
+        path = self.source_path(name)
+        if not os.path.exists(path):
+            if name != 'accompaniment' or 'vocals' not in self.sources:
+                raise KeyError(f'Stem not in cache: {name}')
+            self._derive_accompaniment()
+        return np.load(path, mmap_mode='r')
+
+    def _derive_accompaniment(self):
+        """accompaniment = sum of every non-vocal source (done once)"""
+        total = None
+        for name in self.sources:
+            if name == 'vocals':
+                continue
+            source = np.load(self.source_path(name), mmap_mode='r').astype(np.float32)
+            total = source if total is None else np.add(total, source, out=total)
+        tmp = self.source_path('accompaniment') + '.tmp.npy'
+        np.save(tmp, total.astype(np.float16))
+        os.replace(tmp, self.source_path('accompaniment'))
+
+    def encoded_path(self, name, output_format):
+        return os.path.join(self.path, 'encoded', output_format, f'{name}{stem_extension(output_format)}')
+
+    def has_encoded(self, name, output_format):
+        return os.path.exists(self.encoded_path(name, output_format))
+
+    def adopt_encoded(self, name, output_format, file_path):
+        """Keep an already written output file as the cached encoding"""
+        target = self.encoded_path(name, output_format)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if not os.path.exists(target):
+            clone_or_copy(file_path, target)
+
+    def materialize(self, name, output_format, target):
+        """Copy the cached encoding into place; False if not encoded yet"""
+        if not self.has_encoded(name, output_format):
+            return False
+        clone_or_copy(self.encoded_path(name, output_format), target)
+        return True
+
+    def touch(self):
+        os.utime(os.path.join(self.path, 'meta.json'))
+
+
+class StemCache:
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or default_cache_root()
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def entry_key(audio_hash, model_name, params=None):
+        params_json = json.dumps(params or {}, sort_keys=True)
+        return hashlib.sha1(f'{audio_hash}|{model_name}|{params_json}'.encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def lookup(self, audio_hash, model_name, params=None):
+        path = self._entry_path(self.entry_key(audio_hash, model_name, params))
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r') as f:
+            entry = StemCacheEntry(path, json.load(f))
+        entry.touch()
+        return entry
+
+    def store(self, audio_hash, model_name, params, source_names, sources, samplerate):
+        """
+        Save raw sources (sources[i] -> (channels, samples)). meta.json is
+        written last, so a half-written entry is never returned by lookup.
+        """
+        path = self._entry_path(self.entry_key(audio_hash, model_name, params))
+        os.makedirs(os.path.join(path, 'sources'), exist_ok=True)
+        for name, source in zip(source_names, sources):
+            np.save(os.path.join(path, 'sources', f'{name}.npy'), np.asarray(source, dtype=np.float16))
+        return self._publish(path, audio_hash, model_name, params, source_names, samplerate)
+
+    def store_streaming(self, audio_hash, model_name, params, source_names, channels, total_frames, samplerate):
+        """
+        Open float16 sinks for sources that are produced block by block.
+        Returns (sinks {name: StreamingStemFile}, commit) - call commit()
+        once every sink is complete to publish the entry.
+        """
+        path = self._entry_path(self.entry_key(audio_hash, model_name, params))
+        os.makedirs(os.path.join(path, 'sources'), exist_ok=True)
+        sinks = {
+            name: StreamingStemFile(os.path.join(path, 'sources', f'{name}.npy'), samplerate,
+                                    channels, total_frames, 'f16')
+            for name in source_names
+        }
+
+        def commit():
+            for sink in sinks.values():
+                sink.close()
+            return self._publish(path, audio_hash, model_name, params, source_names, samplerate)
+
+        return sinks, commit
+
+    def _publish(self, path, audio_hash, model_name, params, source_names, samplerate):
+        meta = {
+            'audioHash': audio_hash,
+            'model': model_name,
+            'params': params or {},
+            'sources': list(source_names),
+            'samplerate': int(samplerate),
+            'created': time.time()
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        self.evict(keep=[path])
+        return StemCacheEntry(path, meta)
+
+    def evict(self, keep=()):
+        """
+        Drop least recently used entries until the cache fits max_bytes.
+        keep: entry directories that must survive (still in use)
+        Entries still being written (no meta.json) are never evicted unless
+        abandoned for PARTIAL_ENTRY_GRACE_SECONDS.
+        """
+        keep = {os.path.normpath(path) for path in keep}
+        if not self.max_bytes or not os.path.isdir(self.root):
+            return
+        entries = []
+        total = 0
+        now = time.time()
+        for shard in os.listdir(self.root):
+            shard_path = os.path.join(self.root, shard)
+            if not os.path.isdir(shard_path):
+                continue
+            for key in os.listdir(shard_path):
+                entry_path = os.path.join(shard_path, key)
+                meta_path = os.path.join(entry_path, 'meta.json')
+                size = 0
+                modified = 0
+                for dirpath, _, names in os.walk(entry_path):
+                    for name in names:
+                        try:
+                            stat = os.stat(os.path.join(dirpath, name))
+                        except OSError:
+                            continue  # removed or replaced while walking
+                        size += stat.st_size
+                        modified = max(modified, stat.st_mtime)
+                total += size
+                if os.path.exists(meta_path):
+                    used = os.path.getmtime(meta_path)
+                elif now - modified > PARTIAL_ENTRY_GRACE_SECONDS:
+                    used = 0
+                else:
+                    continue
+                entries.append((used, size, entry_path))
+        for used, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if os.path.normpath(entry_path) in keep:
+                continue
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total -= size
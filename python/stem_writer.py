@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Stem output encoding
+Writes separated stems in a configurable format on a thread pool so the
+encoding of one job overlaps with inference of the next.
+
+Formats:
+  wav    - 32-bit float WAV (original output, largest)
+  wav16  - 16-bit PCM WAV
+  flac   - 16-bit FLAC (lossless, roughly half the size of wav16)
+  f16    - float16 NumPy array (channels, samples) for internal use
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+OUTPUT_FORMATS = {
+    'wav': {'extension': '.wav', 'format': 'WAV', 'subtype': 'FLOAT'},
+    'wav16': {'extension': '.wav', 'format': 'WAV', 'subtype': 'PCM_16'},
+    'flac': {'extension': '.flac', 'format': 'FLAC', 'subtype': 'PCM_16'},
+    'f16': {'extension': '.f16.npy', 'format': None, 'subtype': None},
+}
+
+DEFAULT_FORMAT = 'wav'
+
+
+def stem_extension(output_format):
+    return OUTPUT_FORMATS[output_format]['extension']
+
+
+def write_stem(path, data, samplerate, output_format=DEFAULT_FORMAT):
+    """
+    Encode one stem. data: (channels, samples) float array.
+    Integer formats are clipped to [-1, 1] instead of wrapping.
+    """
+    spec = OUTPUT_FORMATS[output_format]
+    if spec['format'] is None:
+        np.save(path, np.asarray(data, dtype=np.float16))
+        return path
+
+    import soundfile as sf
+    frames = np.asarray(data, dtype=np.float32).T
+    if spec['subtype'] != 'FLOAT':
+        frames = np.clip(frames, -1.0, 1.0)
+    sf.write(path, frames, samplerate, format=spec['format'], subtype=spec['subtype'])
+    return path
+
+
+class StreamingStemFile:
+    """
+    Incremental stem writer: append (channels, n) blocks as they are
+    produced so the full stem never has to exist in memory.
+    """
+
+    def __init__(self, path, samplerate, channels, total_frames, output_format=DEFAULT_FORMAT):
+        self.path = path
+        self.spec = OUTPUT_FORMATS[output_format]
+        self.position = 0
+        if self.spec['format'] is None:
+            self.file = np.lib.format.open_memmap(path, mode='w+', dtype=np.float16,
+                                                  shape=(channels, total_frames))
+        else:
+            import soundfile as sf
+            self.file = sf.SoundFile(path, 'w', samplerate, channels,
+                                     subtype=self.spec['subtype'], format=self.spec['format'])
+
+    def write(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        if self.spec['format'] is None:
+            self.file[:, self.position:self.position + block.shape[1]] = block
+        else:
+            frames = block.T
+            if self.spec['subtype'] != 'FLOAT':
+                frames = np.clip(frames, -1.0, 1.0)
+            self.file.write(frames)
+        self.position += block.shape[1]
+
+    def close(self):
+        if self.spec['format'] is None:
+            self.file.flush()
+            del self.file
+        else:
+            self.file.close()
+        return self.path
+
+
+class StemWriter:
+    """
+    Thread pool for stem encoding. libsndfile releases the GIL while
+    encoding, so several stems are written truly in parallel.
+    """
+
+    def __init__(self, max_workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(6, (os.cpu_count() or 2)))
+        self._lock = threading.Lock()
+
+    def submit(self, path, data, samplerate, output_format=DEFAULT_FORMAT):
+        return self.executor.submit(write_stem, path, data, samplerate, output_format)
+
+    def submit_job(self, stems, samplerate, output_format=DEFAULT_FORMAT, on_stem=None, on_done=None):
+        """
+        Queue every stem of one job. stems: {name: (path, data)}.
+        on_stem(name, path) fires as each file lands and on_done(paths, error)
+        once all are written (paths is None if any write failed).
+        """
+        pending = {'count': len(stems), 'error': None}
+        paths = {name: path for name, (path, _) in stems.items()}
+
+        def finished(name, future):
+            error = future.exception()
+            with self._lock:
+                if error is not None and pending['error'] is None:
+                    pending['error'] = error
+                pending['count'] -= 1
+                last = pending['count'] == 0
+            if error is None and on_stem:
+                on_stem(name, paths[name])
+            if last and on_done:
+                on_done(paths if pending['error'] is None else None, pending['error'])
+
+        futures = []
+        for name, (path, data) in stems.items():
+            future = self.submit(path, data, samplerate, output_format)
+            future.add_done_callback(lambda f, n=name: finished(n, f))
+            futures.append(future)
+        return futures
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Phrase, cue-in and cue-out detection
+Builds a beat-synchronous self-similarity representation from chroma and
+onset features and snaps structural boundaries to 8/16/32-beat phrases.
+
+Only a diagonal band of the self-similarity matrix is ever computed, so the
+cost grows linearly with track length (no full N x N matrix).
+"""
+import numpy as np
+
+PHRASE_LENGTHS = (8, 16, 32)
+
+# Half width (in beats) of the checkerboard kernel used for novelty
+KERNEL_HALF_WIDTH = 16
+
+# A longer phrase grid must beat the shorter one by this factor to win
+PHRASE_PROMOTION_RATIO = 1.15
+
+
+def beat_sync(data, frames, n_frames=None):
+    """
+    Average feature columns between consecutive beat frames.
+    Uses cumulative sums so every segment costs O(1).
+    """
+    n = data.shape[1]
+    frames = np.clip(np.asarray(frames, dtype=int), 0, n - 1)
+    if len(frames) == 0:
+        return np.zeros((data.shape[0], 0), dtype=np.float32)
+
+    starts = frames
+    if len(frames) > 1:
+        last_len = int(np.median(np.diff(frames)))
+    else:
+        last_len = n - frames[0]
+    ends = np.append(frames[1:], min(n, frames[-1] + max(1, last_len)))
+    ends = np.maximum(ends, starts + 1)
+    ends = np.minimum(ends, n)
+    starts = np.minimum(starts, ends - 1)
+
+    cumsum = np.zeros((data.shape[0], n + 1), dtype=np.float64)
+    np.cumsum(data, axis=1, out=cumsum[:, 1:])
+    return ((cumsum[:, ends] - cumsum[:, starts]) / (ends - starts)).astype(np.float32)
+
+
+def banded_novelty(features, half_width=KERNEL_HALF_WIDTH):
+    """
+    Foote checkerboard novelty computed from a diagonal band of the
+    self-similarity matrix. features: (dims, beats), columns L2-normalized.
+    Returns one novelty value per beat (boundary *before* that beat).
+    """
+    n_beats = features.shape[1]
+    w = int(half_width)
+    padded = np.pad(features, ((0, 0), (w, w)), mode='edge')
+    n = padded.shape[1]
+
+    # band[lag, i] = similarity(beat i, beat i + lag) - only 2w diagonals
+    band = np.zeros((2 * w, n), dtype=np.float32)
+    for lag in range(2 * w):
+        band[lag, :n - lag] = np.einsum('ij,ij->j', padded[:, :n - lag], padded[:, lag:])
+
+    # Gaussian-tapered checkerboard kernel
+    offsets = np.arange(-w, w)
+    a, b = np.meshgrid(offsets, offsets, indexing='ij')
+    sign = np.where((a < 0) == (b < 0), 1.0, -1.0)
+    taper = np.exp(-0.5 * ((a + 0.5) ** 2 + (b + 0.5) ** 2) / (0.5 * w) ** 2)
+    kernel = (sign * taper).astype(np.float32)
+
+    lags = np.abs(a - b)
+    rows = np.arange(n_beats)[:, None, None] + (np.minimum(a, b) + w)[None]
+    values = band[lags[None], rows]  # (beats, 2w, 2w)
+    novelty = np.tensordot(values, kernel, axes=([1, 2], [0, 1]))
+
+    novelty = np.maximum(novelty, 0.0)
+    peak = novelty.max() if novelty.size else 0.0
+    return novelty / peak if peak > 0 else novelty
+
+
+def choose_phrase_grid(novelty):
+    """
+    Find the phrase length (8/16/32 beats) and beat offset whose grid
+    lines collect the most novelty. Longer grids are nested in shorter ones.
+    Returns (phrase_length, offset).
+    """
+    def grid_score(length, offset):
+        positions = novelty[offset::length]
+        return float(positions.mean()) if len(positions) else 0.0
+
+    base = PHRASE_LENGTHS[0]
+    scores = [grid_score(base, o) for o in range(base)]
+    best_length = base
+    best_offset = int(np.argmax(scores))
+    best_score = scores[best_offset]
+
+    for length in PHRASE_LENGTHS[1:]:
+        if len(novelty) < 2 * length:
+            break
+        # Only offsets consistent with the shorter grid
+        candidates = range(best_offset % base, length, base)
+        offset = max(candidates, key=lambda o: grid_score(length, o))
+        score = grid_score(length, offset)
+        if score > best_score * PHRASE_PROMOTION_RATIO:
+            best_length, best_offset, best_score = length, offset, score
+
+    return best_length, best_offset
+
+
+def analyze_structure(chromagram, onset_env, sr, bpm=None,
+                      onset_hop_length=512, chroma_hop_length=2048):
+    """
+    Detect phrase boundaries and cue points from precomputed features.
+
+    chromagram: (12, frames) chroma at chroma_hop_length
+    onset_env:  onset strength envelope at onset_hop_length
+    Returns a dict with cueIn, cueOut (seconds), phraseLength (beats) and
+    phraseData (list of phrase starts).
+    """
+    import librosa
+
+    _, beats = librosa.beat.beat_track(
+        onset_envelope=onset_env,
+        sr=sr,
+        hop_length=onset_hop_length,
+        bpm=bpm if bpm else 120.0,
+        units='frames'
+    )
+    beats = np.asarray(beats, dtype=int)
+    beat_times = librosa.frames_to_time(beats, sr=sr, hop_length=onset_hop_length)
+
+    if len(beats) < 2 * PHRASE_LENGTHS[0]:
+        return {
+            'cueIn': float(beat_times[0]) if len(beat_times) else 0.0,
+            'cueOut': float(beat_times[-1]) if len(beat_times) else 0.0,
+            'phraseLength': None,
+            'phraseData': [],
+            'beatCount': int(len(beats))
+        }
+
+    # Beat-synchronous chroma (chroma hop is coarser than the onset hop)
+    chroma_frames = beats * onset_hop_length // chroma_hop_length
+    chroma_sync = beat_sync(chromagram, chroma_frames)
+    chroma_sync /= np.linalg.norm(chroma_sync, axis=0, keepdims=True) + 1e-6
+
+    onset_sync = beat_sync(onset_env[np.newaxis, :], beats)[0]
+    onset_log = np.log1p(onset_sync)
+    onset_z = (onset_log - onset_log.mean()) / (onset_log.std() + 1e-6)
+
+    features = np.vstack([chroma_sync, 0.5 * np.clip(onset_z, -3, 3)[np.newaxis, :]])
+    features /= np.linalg.norm(features, axis=0, keepdims=True) + 1e-6
+
+    half_width = min(KERNEL_HALF_WIDTH, max(2, len(beats) // 4))
+    novelty = banded_novelty(features, half_width)
+    phrase_length, offset = choose_phrase_grid(novelty)
+
+    grid = np.arange(offset, len(beats), phrase_length)
+    phrase_data = [
+        {
+            'time': round(float(beat_times[b]), 3),
+            'beat': int(b),
+            'strength': round(float(novelty[b]), 3)
+        }
+        for b in grid
+    ]
+
+    # Music start/end from beat-level onset energy
+    threshold = 0.25 * np.percentile(onset_sync, 90)
+    active = np.flatnonzero(onset_sync > threshold)
+    music_start = int(active[0]) if len(active) else 0
+    music_end = int(active[-1]) if len(active) else len(beats) - 1
+
+    # Cue-in: the phrase start at or before the music (the grid extended back
+    # to the first beat), so the first phrase is never skipped
+    lines = np.arange(offset % phrase_length, len(beats), phrase_length)
+    starts = lines[lines <= music_start]
+    cue_in_beat = int(starts[-1]) if len(starts) else music_start
+
+    # Cue-out: start of the last full phrase before the music ends
+    ends = grid[(grid + phrase_length <= music_end + 1) & (grid > cue_in_beat)]
+    cue_out_beat = int(ends[-1]) if len(ends) else music_end
+
+    return {
+        'cueIn': round(float(beat_times[cue_in_beat]), 3),
+        'cueOut': round(float(beat_times[cue_out_beat]), 3),
+        'phraseLength': int(phrase_length),
+        'phraseData': phrase_data,
+        'beatCount': int(len(beats))
+    }
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tempo histogram + octave correction
+The most-common-tempo histogram and the genre-aware multi-octave
+candidate scoring of detect_bpm_and_key, shared with the streaming
+tracker (live_tracker.py) so live and offline BPMs agree.
+"""
+import numpy as np
+
+# Histogram over per-frame tempo estimates
+TEMPO_BINS = 50
+TEMPO_RANGE = (40, 240)
+
+
+def tempo_histogram(tempos):
+    """Counts of per-frame tempos over TEMPO_BINS bins in TEMPO_RANGE"""
+    hist, _ = np.histogram(tempos, bins=TEMPO_BINS, range=TEMPO_RANGE)
+    return hist
+
+
+def histogram_peak(hist):
+    """Centre of the most common tempo bin"""
+    width = (TEMPO_RANGE[1] - TEMPO_RANGE[0]) / TEMPO_BINS
+    return TEMPO_RANGE[0] + (int(np.argmax(hist)) + 0.5) * width
+
+
+def correct_octave(primary_tempo):
+    """
+    Pick between primary_tempo and its 1/4, 1/2, 2x and 4x octaves by
+    musical likelihood. Returns the chosen tempo (BPM).
+    """
+    # Multi-octave candidate selection with smart genre-aware scoring
+    candidates = []
+    for multiplier in [0.25, 0.5, 1.0, 2.0, 4.0]:
+        tempo = primary_tempo * multiplier
+        if 40 <= tempo <= 240:
+            candidates.append(tempo)
+
+    # Score each candidate based on musical likelihood
+    best_tempo = primary_tempo
+    best_score = -1
+
+    for candidate in candidates:
+        # Base score: prefer the primary detected tempo
+        score = 10.0 if abs(candidate - primary_tempo) < 5 else 1.0
+
+        # Apply genre-expected tempo range multipliers
+        # These ranges are based on actual music analysis, not arbitrary
+        if 80 <= candidate <= 140:
+            score *= 2.0  # Pop/rock/hip-hop sweet spot (60% of music)
+        elif 140 < candidate <= 180:
+            score *= 1.8  # Fast rock/electronic/dance
+        elif 180 < candidate <= 240:
+            score *= 1.5  # Metal/punk/drum & bass - still plausible
+        elif 60 <= candidate < 80:
+            score *= 1.6  # Reggae/ballads/slow country
+        elif 40 <= candidate < 60:
+            score *= 0.8  # Very slow (rare but valid)
+
+        # For very fast detections, boost the half-time candidate
+        # This helps with metal where librosa often detects 2x
+        if primary_tempo > 200 and candidate == primary_tempo / 2:
+            score *= 1.4  # Boost half-time for extreme tempos
+
+        # For very slow detections, boost the double-time candidate
+        # This helps with waltz/ballads where librosa undershoots
+        if primary_tempo < 70 and candidate == primary_tempo * 2:
+            score *= 1.3
+
+        if score > best_score:
+            best_score = score
+            best_tempo = candidate
+
+    return best_tempo
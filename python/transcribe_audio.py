@@ -3,136 +3,315 @@
 Whisper AI Audio Transcription CLI Wrapper
 Transcribes speech from audio files with word-level timestamps
 Uses OpenAI's Whisper (local, no API required)
+
+JSON config (--json, one stdin line):
+  {"input_file": ..., "model_size": ..., "language": ..., "cpu_accel": false, "cache": true,
+   "index_lyrics": false, "track_id": ..., "db_path": ...,
+   "lyrics": "known lyrics, one line per lyric line", "align_audio": "vocals stem"}
+cpu_accel uses an int8 dynamic-quantized model on CPU-only machines
+(built once and cached, see model_accel.py). Finished transcriptions are
+cached by audio content, so repeat requests return immediately (see
+transcription_cache.py). index_lyrics adds the words to the library's
+lyric search index (see lyrics_index.py), for track_id or the track whose
+path matches input_file. With "lyrics", the known text is force-aligned
+instead of transcribed (see align_lyrics.py) - optionally against
+align_audio, e.g. the separated vocals stem - and the result has the same
+segments/words structure. The legacy positional form accepts --cpu-accel
+and --no-cache.
+
+--batch reads one JSON config per stdin line and tags every output line
+with "job" (1, 2, ...); loaded Whisper models stay in memory for the
+following jobs (the job scheduler keeps such workers alive).
 """
 import sys
 import json
 import os
-import whisper
-import torch
+import hashlib
+
+from audio_decode import load_audio
+from startup import load_torch, timed_import
+from content_hash import audio_content_hash
+from transcription_cache import TranscriptionCache
+
+_models = {}
+
+
+def load_whisper_model(model_size, device, cpu_accel, input_file):
+    """
+    Float model, or the cached int8 model (with its drift report) on CPU.
+    Each model is loaded once per process (batch jobs share it).
+    """
+    key = (model_size, device, bool(cpu_accel and device == 'cpu'))
+    if key not in _models:
+        _models[key] = _load_whisper_model(model_size, device, cpu_accel, input_file)
+    return _models[key]
+
+
+def _load_whisper_model(model_size, device, cpu_accel, input_file):
+    whisper = timed_import('whisper')
+    if not cpu_accel or device != 'cpu':
+        return whisper.load_model(model_size, device=device), None
+
+    from model_accel import load_quantized, whisper_drift
+
+    def load_reference():
+        audio, _ = load_audio(input_file, sr=whisper.audio.SAMPLE_RATE, mono=True,
+                              duration=whisper.audio.CHUNK_LENGTH)
+        return audio
+
+    return load_quantized(
+        f'whisper-{model_size}',
+        lambda: whisper.load_model(model_size, device='cpu'),
+        whisper_drift(load_reference)
+    )
+
+
+def index_lyrics(output, config, input_file):
+    """Ingest the words into library.db's lyric search index (failures don't fail the job)"""
+    if not config.get('index_lyrics'):
+        return
+    from library_db import connect
+    from lyrics_index import ingest, resolve_track_id
+
+    try:
+        conn = connect(config.get('db_path'))
+        try:
+            track_id = resolve_track_id(conn, config.get('track_id') or input_file)
+            output["lyricsIndex"] = ingest(conn, track_id, output["transcription"])
+        finally:
+            conn.close()
+    except Exception as e:
+        output["lyricsIndexError"] = str(e)
+
+
+def emit(payload):
+    print(json.dumps(payload))
+    sys.stdout.flush()
+
+
+def transcribe(config, report):
+    """
+    Transcribe (or align) one JSON config. report(payload) receives every
+    progress line and the final complete line; failures raise.
+    """
+    input_file = config['input_file']
+    model_size = config['model_size']
+    language = config.get('language')
+    cpu_accel = config.get('cpu_accel', False)
+    use_cache = config.get('cache', True)
+    lyrics = config.get('lyrics')
+    align_audio = config.get('align_audio')
+
+    # Progress: Initializing
+    report({"status": "initializing", "progress": 0, "message": "Starting transcription..."})
+    
+    # Check for GPU (only the int8 cache key needs it before a cache miss)
+    device = None
+    if cpu_accel:
+        device = 'cuda' if load_torch().cuda.is_available() else 'cpu'
+    
+    # Transcription options
+    transcribe_options = {
+        "task": "transcribe",  # or "translate" for translation to English
+        "word_timestamps": True,  # Get word-level timestamps
+        "verbose": False
+    }
+    
+    if language:
+        transcribe_options["language"] = language
+    
+    # Same audio + model + language + options = same transcription
+    cache = TranscriptionCache() if use_cache else None
+    if cache is not None:
+        audio_hash = audio_content_hash(input_file)
+        cache_options = {"task": transcribe_options["task"], "word_timestamps": transcribe_options["word_timestamps"]}
+        if cpu_accel and device == 'cpu':
+            cache_options["int8"] = True
+        if lyrics:
+            cache_options["task"] = "align"
+            cache_options["lyrics"] = hashlib.sha1(lyrics.encode('utf-8')).hexdigest()
+            cache_options["vocals"] = bool(align_audio)
+        cached = cache.lookup(audio_hash, model_size, language, cache_options)
+        if cached is not None:
+            transcription, cached_model = cached
+            cache.close()
+            output = {
+                "status": "complete",
+                "progress": 100,
+                "message": "Transcription loaded from cache",
+                "cached": True,
+                "cachedModel": cached_model,
+                "transcription": transcription
+            }
+            index_lyrics(output, config, input_file)
+            report(output)
+            return
+    
+    # whisper and torch load only now that the cache can't answer
+    whisper = timed_import('whisper')
+    device = 'cuda' if load_torch().cuda.is_available() else 'cpu'
+    device_name = "GPU (CUDA)" if device == 'cuda' else "CPU"
+    
+    report({
+        "status": "initializing", 
+        "progress": 10, 
+        "message": f"Loading Whisper {model_size} model on {device_name}..."
+    })
+    
+    # Load Whisper model (downloads on first run)
+    # Models: tiny (~39M), base (~74M), small (~244M), medium (~769M), large (~1550M)
+    model, drift = load_whisper_model(model_size, device, cpu_accel, input_file)
+    
+    loaded = {
+        "status": "initializing", 
+        "progress": 30, 
+        "message": "Model loaded, preparing audio..."
+    }
+    if drift:
+        loaded["message"] = f"int8 model loaded (text agreement vs float: {drift.get('textAgreement')}), preparing audio..."
+        loaded["drift"] = drift
+    report(loaded)
+    
+    # Transcribe with word-level timestamps
+    report({
+        "status": "transcribing", 
+        "progress": 40, 
+        "message": "Aligning lyrics to audio..." if lyrics else "Transcribing audio with AI..."
+    })
+    
+    # Decode straight to Whisper's 16 kHz mono instead of piping through ffmpeg
+    audio, _ = load_audio(align_audio or input_file, sr=whisper.audio.SAMPLE_RATE, mono=True)
+    if lyrics:
+        # Known lyrics: one forward pass per window instead of decoding text
+        from align_lyrics import align_lyrics
+        
+        def aligned(fraction):
+            report({
+                "status": "transcribing",
+                "progress": 40 + int(40 * fraction),
+                "message": "Aligning lyrics to audio..."
+            })
+        
+        result = align_lyrics(model, audio, lyrics, language, progress=aligned)
+    else:
+        result = model.transcribe(audio, **transcribe_options)
+    
+    report({
+        "status": "processing", 
+        "progress": 80, 
+        "message": "Processing transcription results..."
+    })
+    
+    # Format output with word-level timestamps
+    formatted_segments = []
+    word_list = []
+    
+    for segment in result["segments"]:
+        segment_data = {
+            "id": segment["id"],
+            "start": segment["start"],
+            "end": segment["end"],
+            "text": segment["text"].strip()
+        }
+        
+        # Add word-level timestamps if available
+        if "words" in segment:
+            segment_data["words"] = [
+                {
+                    "word": word_info["word"].strip(),
+                    "start": word_info["start"],
+                    "end": word_info["end"]
+                }
+                for word_info in segment["words"]
+            ]
+            # Add to flat word list for easier access
+            word_list.extend(segment_data["words"])
+        
+        formatted_segments.append(segment_data)
+    
+    report({
+        "status": "processing", 
+        "progress": 95, 
+        "message": "Finalizing transcription..."
+    })
+    
+    # Complete with full results
+    output = {
+        "status": "complete",
+        "progress": 100,
+        "message": "Transcription complete!",
+        "transcription": {
+            "text": result["text"].strip(),
+            "language": result["language"],
+            "segments": formatted_segments,
+            "words": word_list,  # Flat list of all words with timestamps
+            "duration": result["segments"][-1]["end"] if result["segments"] else 0
+        }
+    }
+    if lyrics:
+        output["transcription"]["aligned"] = True
+    
+    if cache is not None:
+        cache.store(audio_hash, model_size, language, cache_options, output["transcription"])
+        cache.close()
+    
+    index_lyrics(output, config, input_file)
+    report(output)
+
+
+def run_batch():
+    """Transcribe one JSON config per stdin line, reusing loaded models"""
+    job = 0
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job += 1
+
+        def report(payload, job=job):
+            payload['job'] = job
+            emit(payload)
+
+        try:
+            transcribe(json.loads(line), report)
+        except Exception as e:
+            import traceback
+            emit({
+                "status": "error",
+                "job": job,
+                "error": f"{str(e)}\n{traceback.format_exc()}",
+                "message": f"Transcription failed: {str(e)}"
+            })
+    emit({"status": "batch_complete", "jobs": job})
+
 
 def main():
+    if len(sys.argv) == 2 and sys.argv[1] == '--batch':
+        run_batch()
+        return
+
     # NEW: Use JSON config from stdin instead of command-line args to avoid parsing issues
     if len(sys.argv) == 2 and sys.argv[1] == '--json':
         config_line = sys.stdin.readline()
         config = json.loads(config_line)
-        input_file = config['input_file']
-        model_size = config['model_size']
-        language = config.get('language')
     else:
         # Fallback to old method
+        cpu_accel = '--cpu-accel' in sys.argv
+        use_cache = '--no-cache' not in sys.argv
+        sys.argv = [a for a in sys.argv if a not in ('--cpu-accel', '--no-cache')]
         if len(sys.argv) < 3:
-            print(json.dumps({"error": "Usage: transcribe_audio.py <input_file> <model_size> [language]"}))
+            print(json.dumps({"error": "Usage: transcribe_audio.py <input_file> <model_size> [language] [--cpu-accel] [--no-cache] | --json | --batch"}))
             sys.exit(1)
         
-        input_file = sys.argv[1]
-        model_size = sys.argv[2]
-        language = sys.argv[3] if len(sys.argv) > 3 else None
+        config = {
+            'input_file': sys.argv[1],
+            'model_size': sys.argv[2],
+            'language': sys.argv[3] if len(sys.argv) > 3 else None,
+            'cpu_accel': cpu_accel,
+            'cache': use_cache
+        }
     
     try:
-        # Progress: Initializing
-        print(json.dumps({"status": "initializing", "progress": 0, "message": "Starting transcription..."}))
-        sys.stdout.flush()
-        
-        # Check for GPU
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        device_name = "GPU (CUDA)" if device == 'cuda' else "CPU"
-        
-        print(json.dumps({
-            "status": "initializing", 
-            "progress": 10, 
-            "message": f"Loading Whisper {model_size} model on {device_name}..."
-        }))
-        sys.stdout.flush()
-        
-        # Load Whisper model (downloads on first run)
-        # Models: tiny (~39M), base (~74M), small (~244M), medium (~769M), large (~1550M)
-        model = whisper.load_model(model_size, device=device)
-        
-        print(json.dumps({
-            "status": "initializing", 
-            "progress": 30, 
-            "message": "Model loaded, preparing audio..."
-        }))
-        sys.stdout.flush()
-        
-        # Transcribe with word-level timestamps
-        print(json.dumps({
-            "status": "transcribing", 
-            "progress": 40, 
-            "message": "Transcribing audio with AI..."
-        }))
-        sys.stdout.flush()
-        
-        # Transcription options
-        transcribe_options = {
-            "task": "transcribe",  # or "translate" for translation to English
-            "word_timestamps": True,  # Get word-level timestamps
-            "verbose": False
-        }
-        
-        if language:
-            transcribe_options["language"] = language
-        
-        result = model.transcribe(input_file, **transcribe_options)
-        
-        print(json.dumps({
-            "status": "processing", 
-            "progress": 80, 
-            "message": "Processing transcription results..."
-        }))
-        sys.stdout.flush()
-        
-        # Format output with word-level timestamps
-        formatted_segments = []
-        word_list = []
-        
-        for segment in result["segments"]:
-            segment_data = {
-                "id": segment["id"],
-                "start": segment["start"],
-                "end": segment["end"],
-                "text": segment["text"].strip()
-            }
-            
-            # Add word-level timestamps if available
-            if "words" in segment:
-                segment_data["words"] = [
-                    {
-                        "word": word_info["word"].strip(),
-                        "start": word_info["start"],
-                        "end": word_info["end"]
-                    }
-                    for word_info in segment["words"]
-                ]
-                # Add to flat word list for easier access
-                word_list.extend(segment_data["words"])
-            
-            formatted_segments.append(segment_data)
-        
-        print(json.dumps({
-            "status": "processing", 
-            "progress": 95, 
-            "message": "Finalizing transcription..."
-        }))
-        sys.stdout.flush()
-        
-        # Complete with full results
-        output = {
-            "status": "complete",
-            "progress": 100,
-            "message": "Transcription complete!",
-            "transcription": {
-                "text": result["text"].strip(),
-                "language": result["language"],
-                "segments": formatted_segments,
-                "words": word_list,  # Flat list of all words with timestamps
-                "duration": result["segments"][-1]["end"] if result["segments"] else 0
-            }
-        }
-        
-        print(json.dumps(output))
-        sys.stdout.flush()
-        
+        transcribe(config, emit)
     except Exception as e:
         import traceback
         error_details = f"{str(e)}\n{traceback.format_exc()}"
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Persistent Whisper transcription cache
+Stores the full `transcription` payload (zlib-compressed JSON) keyed by
+audio content hash + model + requested language + transcribe options.
+Lookups can be served by a larger model than the one requested (a cached
+`medium` result answers a `small` request), and an auto-detect result
+answers an explicit request for the language it detected.
+"""
+import os
+import json
+import time
+import zlib
+
+from library_db import app_data_dir, connect
+
+# Larger models never give worse transcriptions than smaller ones
+MODEL_RANKS = {'tiny': 0, 'base': 1, 'small': 2, 'medium': 3, 'turbo': 3, 'large': 4}
+
+
+def default_cache_path():
+    return os.path.join(app_data_dir(), 'transcriptions.db')
+
+
+def model_rank(model):
+    """'large-v3' -> large, 'small.en' -> small; unknown models only match themselves"""
+    return MODEL_RANKS.get(model.split('.')[0].split('-')[0])
+
+
+def options_key(options):
+    return json.dumps(options or {}, sort_keys=True)
+
+
+class TranscriptionCache:
+    """SQLite-backed store of finished transcriptions"""
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path or default_cache_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        self.conn = connect(self.cache_path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS transcriptions (
+              audioHash        TEXT NOT NULL,
+              model            TEXT NOT NULL,
+              language         TEXT NOT NULL,
+              options          TEXT NOT NULL,
+              detectedLanguage TEXT,
+              payload          BLOB NOT NULL,
+              created          REAL,
+              PRIMARY KEY (audioHash, model, language, options)
+            ) WITHOUT ROWID;
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def store(self, audio_hash, model, language, options, transcription):
+        payload = zlib.compress(json.dumps(transcription).encode('utf-8'), 6)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO transcriptions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (audio_hash, model, language or '', options_key(options),
+             transcription.get('language'), payload, time.time())
+        )
+        self.conn.commit()
+
+    def lookup(self, audio_hash, model, language=None, options=None, allow_upgrade=True):
+        """
+        Best cached transcription for the request, or None.
+        Returns (transcription, cached_model).
+        """
+        rows = self.conn.execute(
+            "SELECT model, language, detectedLanguage, payload, created FROM transcriptions "
+            "WHERE audioHash = ? AND options = ?",
+            (audio_hash, options_key(options))
+        ).fetchall()
+
+        wanted_rank = model_rank(model)
+        best = None
+        for row_model, row_language, detected, payload, created in rows:
+            if row_language != (language or '') and not (language and not row_language and detected == language):
+                continue
+            if row_model == model:
+                score = (2, 0, created)  # exact model always wins
+            elif not allow_upgrade or wanted_rank is None or model_rank(row_model) is None:
+                continue
+            elif model_rank(row_model) < wanted_rank:
+                continue
+            elif row_model.endswith('.en') and language != 'en' and not model.endswith('.en'):
+                continue  # English-only model can't answer an open language request
+            else:
+                score = (1, model_rank(row_model), created)
+            if best is None or score > best[0]:
+                best = (score, row_model, payload)
+
+        if best is None:
+            return None
+        return json.loads(zlib.decompress(best[2]).decode('utf-8')), best[1]
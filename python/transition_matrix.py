@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+All-pairs transition difficulty and set ordering
+Pairwise transition cost (tempo ratio incl. half/double time, Camelot
+distance, energy delta) is computed with NumPy broadcasting one block of
+rows at a time; blocks hold about BLOCK_ELEMENTS costs whatever the
+library size, so memory stays bounded on large libraries. Greedy and beam
+search orderings (refined by 2-opt) run on top of the cost matrix.
+
+A track's difficulty is the cost of its transition at the
+DIFFICULTY_FRACTION quantile of the library (the cost of reaching its
+easiest 2% of tracks), so it does not drift towards 0 as the library grows.
+On libraries larger than DIFFICULTY_SAMPLE the quantile is taken over a
+fixed random sample of that many tracks, which keeps scoring linear in the
+library size.
+
+Usage:
+  transition_matrix.py order <id,id,...> [--beam N] [dbPath]
+  transition_matrix.py score [dbPath] [--write]
+"""
+import sys
+import json
+
+import numpy as np
+
+from harmonic_index import HarmonicIndex
+from library_db import connect
+
+# Cost component weights (sum to 1 so costs stay within 0..1)
+TEMPO_WEIGHT = 0.45
+KEY_WEIGHT = 0.35
+ENERGY_WEIGHT = 0.20
+
+# Tempo difference (fraction) that counts as a full-cost transition
+TEMPO_TOLERANCE = 0.08
+# Extra tempo cost for half/double time mixes
+TEMPO_OCTAVE_PENALTY = 0.1
+
+# Cost by Camelot distance (wheel steps + ring switch); beyond the table = 1.0
+KEY_COSTS = np.array([0.0, 0.15, 0.45, 0.8], dtype=np.float32)
+
+# Cost matrix entries per row block (each block temporary is 4 bytes per entry)
+BLOCK_ELEMENTS = 4 * 1024 ** 2
+# Difficulty = cost at this fraction of a track's outgoing transitions
+# (cheapest first), but never fewer than NEIGHBOURS tracks in small libraries
+DIFFICULTY_FRACTION = 0.02
+NEIGHBOURS = 10
+# Transitions per track the difficulty quantile is estimated from (seeded sample)
+DIFFICULTY_SAMPLE = 4096
+DIFFICULTY_SEED = 0
+# Difficulty is reported in whole percent; costs are binned at that resolution
+DIFFICULTY_LEVELS = 101
+DEFAULT_BEAM_WIDTH = 8
+
+
+def key_cost_table():
+    """(24, 24) weighted key cost between Camelot positions (number - 1 + 12 * major)"""
+    position = np.arange(24)
+    number, major = position % 12, position // 12
+    wheel = np.abs(number[:, None] - number[None, :])
+    wheel = np.minimum(wheel, 12 - wheel)
+    distance = wheel + (major[:, None] != major[None, :])
+    costs = np.append(KEY_COSTS, np.float32(1.0))[np.minimum(distance, len(KEY_COSTS))]
+    return (KEY_WEIGHT * costs).astype(np.float32)
+
+
+KEY_COST_TABLE = key_cost_table()
+
+
+def block_rows(n, block_elements=BLOCK_ELEMENTS):
+    """Rows per block so a block of costs to n tracks holds about block_elements entries"""
+    return max(1, block_elements // max(1, n))
+
+
+def cost_inputs(index, columns=None):
+    """
+    Per-track arrays cost_block works on (computed once per index).
+    columns: destination tracks (index array), default all
+    """
+    log_bpm = np.log2(np.maximum(index.bpm, 1.0)).astype(np.float32)
+    position = (index.camelot_number.astype(np.intp) - 1) + 12 * index.camelot_major.astype(np.intp)
+    energy = index.energy.astype(np.float32)
+    if columns is None:
+        columns = slice(None)
+    # Weighted key cost from each Camelot position to every destination
+    key_rows = KEY_COST_TABLE[:, position[columns]]
+    return log_bpm, position, energy, log_bpm[columns], key_rows, energy[columns]
+
+
+def cost_block(rows, index, inputs=None):
+    """
+    Transition cost from tracks `rows` (index array) to every track in the
+    index (or the columns given to cost_inputs). Computed in place, so a
+    block needs about three block-sized float32 temporaries.
+    """
+    log_bpm, position, energy, to_log_bpm, key_rows, to_energy = inputs or cost_inputs(index)
+
+    # Tempo: nearest of the 1x, 2x, 0.5x ratios, with a small half/double-time penalty
+    cost = to_log_bpm[None, :] - log_bpm[rows][:, None]
+    octaves = np.round(cost)
+    cost -= octaves
+    np.abs(cost, out=cost)
+    np.exp2(cost, out=cost)
+    cost -= 1.0
+    cost /= TEMPO_TOLERANCE
+    # |octaves| clipped to 1 marks half/double-time pairs
+    np.abs(octaves, out=octaves)
+    np.minimum(octaves, 1.0, out=octaves)
+    octaves *= TEMPO_OCTAVE_PENALTY
+    cost += octaves
+    np.minimum(cost, 1.0, out=cost)
+    cost *= TEMPO_WEIGHT
+
+    # Key: steps around the Camelot wheel plus A/B ring switch (row lookup)
+    np.take(key_rows, position[rows], axis=0, out=octaves)
+    cost += octaves
+
+    np.subtract(to_energy[None, :], energy[rows][:, None], out=octaves)
+    np.abs(octaves, out=octaves)
+    octaves *= ENERGY_WEIGHT
+    cost += octaves
+    return cost
+
+
+def iter_cost_blocks(index, block_size=None, columns=None):
+    """
+    Yield (row_start, cost block) covering the full N x N matrix (or
+    N x len(columns); a track's cost to itself is inf either way)
+    """
+    n = len(index)
+    width = n if columns is None else len(columns)
+    block_size = block_size or block_rows(width)
+    inputs = cost_inputs(index, columns)
+    # Column of each track in the block, -1 when it is not a destination
+    column_of = np.arange(n) if columns is None else np.full(n, -1)
+    if columns is not None:
+        column_of[columns] = np.arange(width)
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(n, start + block_size))
+        block = cost_block(rows, index, inputs)
+        self_columns = column_of[rows]
+        block[np.flatnonzero(self_columns >= 0), self_columns[self_columns >= 0]] = np.inf
+        yield start, block
+
+
+def transition_matrix(index, block_size=None):
+    """Dense N x N cost matrix (diagonal = inf); use for sets, not whole libraries"""
+    n = len(index)
+    matrix = np.empty((n, n), dtype=np.float32)
+    for start, block in iter_cost_blocks(index, block_size):
+        matrix[start:start + len(block)] = block
+    return matrix
+
+
+def track_difficulty(index, fraction=DIFFICULTY_FRACTION, neighbours=NEIGHBOURS, block_size=None,
+                     sample=DIFFICULTY_SAMPLE):
+    """
+    Per-track difficulty 0-100: cost of its k-th easiest outgoing
+    transition, k = `fraction` of the library (at least `neighbours`),
+    measured against a seeded sample of `sample` tracks on larger libraries.
+    Costs are binned to whole percent and the k-th is read off per-row
+    cumulative counts - one bincount per block instead of a partition.
+    """
+    n = len(index)
+    columns = None
+    if sample and n > sample:
+        columns = np.sort(np.random.default_rng(DIFFICULTY_SEED).choice(n, sample, replace=False))
+    width = n if columns is None else len(columns)
+    k = max(1, min(width - 1, max(neighbours, int(np.ceil(fraction * (width - 1))))))
+    difficulty = np.zeros(n, dtype=np.int32)
+    for start, block in iter_cost_blocks(index, block_size, columns):
+        rows = len(block)
+        # A track's own column (inf) lands in the top level and is never the k-th
+        np.minimum(block, 1.0, out=block)
+        block *= DIFFICULTY_LEVELS - 1
+        block += 0.5
+        levels = block.astype(np.intp)
+        levels += (np.arange(rows, dtype=np.intp) * DIFFICULTY_LEVELS)[:, None]
+        counts = np.bincount(levels.ravel(), minlength=rows * DIFFICULTY_LEVELS)
+        cumulative = np.cumsum(counts.reshape(rows, DIFFICULTY_LEVELS), axis=1)
+        difficulty[start:start + rows] = np.argmax(cumulative >= k, axis=1)
+    return difficulty
+
+
+def describe_difficulty(value):
+    if value < 25:
+        return 'smooth'
+    if value < 50:
+        return 'moderate'
+    return 'complex'
+
+
+def path_cost(cost, order):
+    order = np.asarray(order)
+    return float(cost[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def order_greedy(cost, start=0):
+    """Nearest-neighbour ordering: always take the cheapest next track"""
+    n = cost.shape[0]
+    visited = np.zeros(n, dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, cost[order[-1]])
+        nxt = int(np.argmin(row))
+        order.append(nxt)
+        visited[nxt] = True
+    return order
+
+
+def order_beam(cost, start=0, beam_width=DEFAULT_BEAM_WIDTH):
+    """
+    Beam search ordering. Every beam is expanded against all unvisited
+    tracks at once and the best `beam_width` partial sets survive. The
+    greedy ordering is kept as a fallback, so the result is never worse.
+    """
+    n = cost.shape[0]
+    paths = np.full((1, n), -1, dtype=np.int32)
+    paths[0, 0] = start
+    visited = np.zeros((1, n), dtype=bool)
+    visited[0, start] = True
+    totals = np.zeros(1, dtype=np.float64)
+
+    for step in range(1, n):
+        candidates = totals[:, None] + cost[paths[:, step - 1]]
+        candidates[visited] = np.inf
+        flat = candidates.ravel()
+        width = min(beam_width, int(np.isfinite(flat).sum()))
+        best = np.argpartition(flat, width - 1)[:width]
+        beam, track = np.divmod(best, n)
+
+        paths = paths[beam].copy()
+        paths[:, step] = track
+        visited = visited[beam].copy()
+        visited[np.arange(width), track] = True
+        totals = flat[best]
+
+    best = paths[int(np.argmin(totals))].tolist()
+    greedy = order_greedy(cost, start)
+    return best if path_cost(cost, best) <= path_cost(cost, greedy) else greedy
+
+
+def improve_two_opt(cost, order, max_passes=50):
+    """
+    2-opt refinement for an open path: reverse the segment whose endpoint
+    swap saves the most cost, scoring every (i, j) pair in one array op.
+    The first and last tracks stay in place.
+    Assumes a symmetric cost matrix (true for cost_block).
+    """
+    order = np.asarray(order)
+    n = len(order)
+    if n < 4:
+        return order.tolist()
+    for _ in range(max_passes):
+        prev = order[:-2]    # a[i-1] for i = 1..n-2
+        first = order[1:-1]  # a[i]
+        last = order[1:-1]   # a[j]
+        nxt = order[2:]      # a[j+1]
+        gain = (cost[prev, first][:, None] + cost[last, nxt][None, :]
+                - cost[prev[:, None], last[None, :]] - cost[first[:, None], nxt[None, :]])
+        gain = np.triu(gain, k=1)
+        i, j = np.unravel_index(np.argmax(gain), gain.shape)
+        if gain[i, j] <= 1e-6:
+            break
+        order[i + 1:j + 2] = order[i + 1:j + 2][::-1].copy()
+    return order.tolist()
+
+
+def order_set(index, track_ids, beam_width=DEFAULT_BEAM_WIDTH, start=None):
+    """
+    Order a set of tracks for minimal total transition cost.
+    Returns {'order': [ids], 'cost': total, 'transitions': [...]}.
+    """
+    rows = np.array([index.row_for(t) for t in track_ids])
+    subset = HarmonicIndex(
+        index.ids[rows], [index.paths[r] for r in rows], index.bpm[rows], index.camelot_number[rows],
+        index.camelot_major[rows], index.energy[rows], index.features[rows]
+    )
+    cost = transition_matrix(subset)
+    first = 0 if start is None else subset.row_for(start)
+    if beam_width and beam_width > 1:
+        order = order_beam(cost, first, beam_width)
+    else:
+        order = order_greedy(cost, first)
+    order = improve_two_opt(cost, order)
+
+    transitions = [
+        {
+            'from': int(subset.ids[a]),
+            'to': int(subset.ids[b]),
+            'difficulty': int(round(float(cost[a, b]) * 100))
+        }
+        for a, b in zip(order[:-1], order[1:])
+    ]
+    return {
+        'order': [int(subset.ids[r]) for r in order],
+        'cost': round(path_cost(cost, order), 4),
+        'transitions': transitions
+    }
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    beam_width = DEFAULT_BEAM_WIDTH
+    if '--beam' in argv:
+        position = argv.index('--beam')
+        beam_width = int(argv[position + 1])
+        del argv[position:position + 2]
+    args = [a for a in argv if not a.startswith('--')]
+    if not args or args[0] not in ('order', 'score'):
+        print(json.dumps({'error': 'Usage: transition_matrix.py order <id,id,...> [--beam N] [dbPath] | score [dbPath] [--write]'}))
+        sys.exit(1)
+
+    try:
+        if args[0] == 'order':
+            track_ids = [int(t) for t in args[1].split(',')]
+            index = HarmonicIndex.build(args[2] if len(args) > 2 else None)
+            print(json.dumps(order_set(index, track_ids, beam_width)))
+        else:
+            db_path = args[1] if len(args) > 1 else None
+            index = HarmonicIndex.build(db_path)
+            difficulty = track_difficulty(index)
+            if '--write' in argv:
+                conn = connect(db_path)
+                try:
+                    conn.executemany(
+                        "UPDATE tracks SET transitionDifficulty = ?, transitionDescription = ? WHERE id = ?",
+                        ((int(d), describe_difficulty(d), int(i)) for d, i in zip(difficulty, index.ids))
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+            print(json.dumps({
+                'tracks': len(index),
+                'written': '--write' in argv,
+                'meanDifficulty': round(float(difficulty.mean()), 2)
+            }))
+    except Exception as e:
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
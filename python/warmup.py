@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+One-time warm-up of the persistent numba JIT cache
+Run once at install (and after updating librosa/numba). Every analysis
+entry point is exercised on a short synthetic track so librosa's numba
+kernels compile into the app-managed cache (see startup.py); later
+processes load them from disk instead of recompiling.
+
+Usage: warmup.py
+Prints JSON-lines progress, then {"status": "complete", "steps": {...}}.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from startup import configure_numba_cache, load_librosa, profile_report
+
+WARMUP_SECONDS = 20
+WARMUP_SR = 22050
+WARMUP_BPM = 120
+
+
+def emit(payload):
+    print(json.dumps(payload))
+    sys.stdout.flush()
+
+
+def synthetic_track(path):
+    """Clicks on the beat over a C major triad, so every analyzer finds something"""
+    import numpy as np
+    import soundfile as sf
+
+    t = np.arange(WARMUP_SECONDS * WARMUP_SR) / WARMUP_SR
+    y = sum(0.1 * np.sin(2 * np.pi * f * t) for f in (261.63, 329.63, 392.0))
+    beat = int(WARMUP_SR * 60 / WARMUP_BPM)
+    click = np.exp(-np.arange(2048) / 200.0)
+    for start in range(0, len(y) - len(click), beat):
+        y[start:start + len(click)] += 0.8 * click
+    sf.write(path, y.astype(np.float32), WARMUP_SR)
+
+
+def main():
+    cache_dir = configure_numba_cache()
+    emit({"status": "initializing", "progress": 0, "message": f"Numba cache: {cache_dir}"})
+
+    steps = {}
+
+    def step(name, func, progress):
+        started = time.perf_counter()
+        for result in func() or ():
+            # The analyzers report failures as {'error': ...} instead of raising
+            if isinstance(result, dict) and 'error' in result:
+                raise RuntimeError(f"{name}: {result['error']}")
+        steps[name] = round(time.perf_counter() - started, 3)
+        emit({"status": "processing", "progress": progress, "message": f"{name}: {steps[name]}s"})
+
+    work_dir = tempfile.mkdtemp(prefix='ngks_warmup_')
+    try:
+        track = os.path.join(work_dir, 'warmup.wav')
+        step('librosa', lambda: load_librosa() and None, 20)
+        synthetic_track(track)
+
+        from analyze_audio import detect_bpm_and_key
+        from analyze_time_sigs import detect_time_signature as quick_time_signature
+        from analyze_time_signatures import detect_time_signature
+        from fingerprint_index import fingerprint_file
+
+        step('analyze', lambda: [detect_bpm_and_key(track, structure=True, key_segments=True)], 50)
+        step('timeSignature', lambda: [quick_time_signature(track), detect_time_signature(track)], 80)
+        step('fingerprint', lambda: fingerprint_file(track) and None, 95)
+    except Exception as e:
+        emit({"status": "error", "error": str(e)})
+        sys.exit(1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    emit({"status": "complete", "progress": 100, "steps": steps, "profile": profile_report()})
+
+
+if __name__ == '__main__':
+    main()
@@ -1,80 +1,93 @@
 """
 Quick time signature inference based on BPM patterns
 Most popular music is 4/4, but we can infer from BPM ranges
+
+Usage: quick_time_sig_analysis.py [folder] [--workers N] [--timeout S] [--max-rss MB]
+Files are analyzed in pooled workers with a per-file time and memory
+limit (see python/batch_analysis.py); failures carry a failure code.
 """
 import os
 import sys
 import json
-import subprocess
 
-def analyze_folder(folder):
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Shared analysis modules live alongside the Electron-bundled Python scripts
+sys.path.insert(0, os.path.join(ROOT_DIR, 'python'))
+
+from batch_analysis import BatchRunner, runner_options
+from media_probe import find_audio_files, plan_work, format_eta
+from results_store import ResultsStore
+
+# Columnar results (see python/results_store.py)
+RESULTS_STORE = 'library_analysis_results'
+
+def analyze_folder(folder, **options):
     """Analyze all audio files in folder for BPM and infer time signature"""
     results = []
     count = 0
     
-    extensions = ('.mp3', '.wav', '.flac', '.m4a', '.ogg', '.wma')
+    # Use our working BPM analyzer, in pooled workers instead of one process per file
+    options.setdefault('timeout', 30)
+    runner = BatchRunner('analyze_audio:detect_bpm_and_key', sys_paths=[ROOT_DIR], **options)
+    
+    # Header probe: unreadable files are rejected up front, the rest run longest-first
+    plan = plan_work(find_audio_files(folder), workers=runner.workers)
+    results.extend(plan.rejections())
+    store = ResultsStore.create(RESULTS_STORE, planned=len(plan.files) + len(plan.rejected),
+                                folder=os.path.abspath(folder))
+    store.append(plan.summary()['rejected'])
+    for info in plan.files:
+        runner.submit(info['filePath'], info['filePath'])
+    total = len(plan.files)
+    print(f"{total} files ({len(plan.rejected)} rejected), estimated {format_eta(plan.eta())}", file=sys.stderr)
     
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            if file.lower().endswith(extensions):
-                count += 1
-                filepath = os.path.join(root, file)
-                print(f"[{count}] Analyzing: {file}", file=sys.stderr)
-                
-                try:
-                    # Use our working BPM analyzer
-                    result = subprocess.run(
-                        ['python', 'analyze_audio.py', filepath],
-                        capture_output=True,
-                        text=True,
-                        timeout=30
-                    )
-                    
-                    if result.returncode == 0:
-                        data = json.loads(result.stdout)
-                        
-                        # Infer time signature from BPM and other characteristics
-                        # Most music is 4/4, but certain BPM ranges suggest otherwise
-                        bpm = data.get('bpm', 120)
-                        confidence = data.get('bpmConfidence', 0.5)
-                        
-                        # Default assumption
-                        time_sig = '4/4'
-                        sig_confidence = 0.85  # High confidence - most music is 4/4
-                        
-                        # Waltz range (3/4 time)
-                        if 60 <= bpm <= 90 and 'waltz' in file.lower():
-                            time_sig = '3/4'
-                            sig_confidence = 0.7
-                        
-                        results.append({
-                            'file': file,
-                            'timeSignature': time_sig,
-                            'confidence': sig_confidence,
-                            'bpm': bpm,
-                            'bpmConfidence': confidence,
-                            'key': data.get('key', 'unknown'),
-                            'mode': data.get('mode', 'unknown')
-                        })
-                    else:
-                        results.append({'file': file, 'error': 'analysis_failed'})
-                        
-                except subprocess.TimeoutExpired:
-                    results.append({'file': file, 'error': 'timeout'})
-                except Exception as e:
-                    results.append({'file': file, 'error': str(e)})
-                
-                # Save progress every 50 files
-                if count % 50 == 0:
-                    with open('library_analysis_progress.json', 'w') as f:
-                        json.dump({'analyzed': count, 'results': results}, f, indent=2)
+    plan.start()
+    for filepath, data in runner.results():
+        count += 1
+        plan.completed(filepath)
+        file = os.path.basename(filepath)
+        print(f"[{count}/{total}] Analyzed: {file} (ETA {format_eta(plan.eta())})", file=sys.stderr)
+        
+        if 'error' not in data:
+            # Infer time signature from BPM and other characteristics
+            # Most music is 4/4, but certain BPM ranges suggest otherwise
+            bpm = data.get('bpm', 120)
+            confidence = data.get('bpmConfidence', 0.5)
+            
+            # Default assumption
+            time_sig = '4/4'
+            sig_confidence = 0.85  # High confidence - most music is 4/4
+            
+            # Waltz range (3/4 time)
+            if 60 <= bpm <= 90 and 'waltz' in file.lower():
+                time_sig = '3/4'
+                sig_confidence = 0.7
+            
+            results.append({
+                'file': file,
+                'timeSignature': time_sig,
+                'confidence': sig_confidence,
+                'bpm': bpm,
+                'bpmConfidence': confidence,
+                'key': data.get('key', 'unknown'),
+                'mode': data.get('mode', 'unknown')
+            })
+        else:
+            results.append({'file': file, 'error': data['error'], 'failure': data.get('failure', 'analysis_failed')})
+        store.append([dict(results[-1], filePath=filepath)])
+        
+        # Commit progress every 50 files
+        if count % 50 == 0:
+            store.flush()
     
     # Final save
-    with open('library_analysis_complete.json', 'w') as f:
-        json.dump({'total': count, 'results': results}, f, indent=2)
+    store.flush()
     
-    print(json.dumps({'total': count, 'results': results}, indent=2))
+    print(json.dumps({'total': count, 'results': results}))
 
 if __name__ == '__main__':
-    folder = sys.argv[1] if len(sys.argv) > 1 else '.'
-    analyze_folder(folder)
+    argv = sys.argv[1:]
+    options = runner_options(argv)
+    folder = argv[0] if argv else '.'
+    analyze_folder(folder, **options)
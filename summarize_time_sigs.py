@@ -1,37 +1,70 @@
-import json
+import os
+import sys
 
-with open('time_sig_progress.json', 'r') as f:
-    data = json.load(f)
+# Shared analysis modules live alongside the Electron-bundled Python scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python'))
 
-results = data['results']
+from results_store import ResultsStore, import_json, library_stats, library_total, DEFAULT_TOP
 
-sig_4 = [r for r in results if r.get('timeSignature') == '4/4']
-sig_3 = [r for r in results if r.get('timeSignature') == '3/4']
-sig_6 = [r for r in results if r.get('timeSignature') == '6/8']
-errors = [r for r in results if 'error' in r]
+# Written by analyze_time_sigs.py; older scans left a JSON progress file
+STORE = 'time_sig_results'
+LEGACY_PROGRESS = 'time_sig_progress.json'
+
+argv = sys.argv[1:]
+db_path = None
+top = DEFAULT_TOP
+if '--db' in argv:
+    position = argv.index('--db')
+    db_path = argv[position + 1]
+    del argv[position:position + 2]
+if '--top' in argv:
+    position = argv.index('--top')
+    top = int(argv[position + 1])
+    del argv[position:position + 2]
+store_path = argv[0] if argv else STORE
+
+if not os.path.exists(os.path.join(store_path, 'meta.json')) and os.path.exists(LEGACY_PROGRESS):
+    import_json(LEGACY_PROGRESS, store_path)
+store = ResultsStore(store_path)
+
+# Vectorized over the stored columns; totals come from library.db when there is one
+stats = library_stats(store, library_total(db_path), top=top)
+meters = stats.get('meters', {})
+analyzed = stats['analyzed']
+
+def meter_line(label, meter):
+    count = meters.get(meter, {}).get('count', 0)
+    share = count / analyzed * 100 if analyzed else 0.0
+    return f'{label}: {count} tracks ({share:.1f}%)'
 
 print('\n' + '='*60)
 print('TIME SIGNATURE ANALYSIS')
-print(f'Analyzed: {len(results)}/905 files')
+print(f"Analyzed: {analyzed}/{stats['libraryTracks']} files")
 print('='*60)
-print(f'\n4/4 Time: {len(sig_4)} tracks ({len(sig_4)/len(results)*100:.1f}%)')
-print(f'3/4 Time: {len(sig_3)} tracks ({len(sig_3)/len(results)*100:.1f}%)')
-print(f'6/8 Time: {len(sig_6)} tracks ({len(sig_6)/len(results)*100:.1f}%)')
-print(f'Errors:   {len(errors)} tracks')
+print('\n' + meter_line('4/4 Time', '4/4'))
+print(meter_line('3/4 Time', '3/4'))
+print(meter_line('6/8 Time', '6/8'))
+print(f"Errors:   {stats['errors']} tracks")
 
-non_4_4 = sig_3 + sig_6
+non_4_4 = stats.get('nonCommonTime', {'count': 0, 'top': []})
 print(f'\n{"="*60}')
-print(f'NON-4/4 TRACKS: {len(non_4_4)} total')
+print(f"NON-4/4 TRACKS: {non_4_4['count']} total (top {len(non_4_4['top'])} by confidence)")
 print('='*60)
 
-for r in sorted(non_4_4, key=lambda x: x.get('confidence', 0), reverse=True):
-    conf = r.get('confidence', 0)
-    print(f"  {r['timeSignature']:4} | {conf:4.0%} | {r['file']}")
+for r in non_4_4['top']:
+    print(f"  {r['timeSignature']:4} | {r['confidence']:4.0%} | {r['file']}")
 
-# High confidence non-4/4
-high_conf = [r for r in non_4_4 if r.get('confidence', 0) > 0.6]
+# High confidence non-4/4 (the listed rows are sorted by confidence)
+high_conf = [r for r in non_4_4['top'] if r['confidence'] > 0.6]
 print(f'\n{"="*60}')
-print(f'HIGH CONFIDENCE NON-4/4: {len(high_conf)} tracks')
+print(f"HIGH CONFIDENCE NON-4/4: {non_4_4.get('highConfidence', len(high_conf))} tracks")
 print('='*60)
 for r in high_conf:
-    print(f"  {r['timeSignature']:4} | {r.get('confidence', 0):4.0%} | {r['file']}")
+    print(f"  {r['timeSignature']:4} | {r['confidence']:4.0%} | {r['file']}")
+
+if 'bpm' in stats:
+    print(f'\n{"="*60}')
+    print(f"BPM: median {stats['bpm']['median']:.0f}, 10-90% {stats['bpm']['p10']:.0f}-{stats['bpm']['p90']:.0f}")
+    print('='*60)
+    for bucket, count in stats['bpm']['histogram'].items():
+        print(f'  {bucket:>7} | {count}')
@@ -1,23 +1,25 @@
-import sys, sqlite3, os
+import sys, os
+
+# Shared library helpers live with the Electron-bundled Python scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python'))
+
+from library_db import default_db_path, connect, find_track
 
 if len(sys.argv) < 2:
     print('Usage: python tools/clear_track_analysis.py "C:\\full\\path\\to\\file.mp3" [dbPath]')
     sys.exit(1)
 
 target = sys.argv[1]
-dbpath = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.environ.get('APPDATA') or os.path.expanduser('~'), 'ngksplayer', 'library.db')
+dbpath = sys.argv[2] if len(sys.argv) > 2 else default_db_path()
 
 if not os.path.exists(dbpath):
     print('DB not found at', dbpath)
     sys.exit(2)
 
-conn = sqlite3.connect(dbpath)
+conn = connect(dbpath)
 cur = conn.cursor()
-# normalize path comparisons by replacing backslashes
-norm = target.replace('\\\\', '\\')
 try:
-    cur.execute("SELECT id, filePath, bpm, key FROM tracks WHERE LOWER(REPLACE(REPLACE(filePath, '?', ''), '\\\\', '/')) = LOWER(REPLACE(?, '\\\\', '/')) OR LOWER(REPLACE(REPLACE(path, '?', ''), '\\\\', '/')) = LOWER(REPLACE(?, '\\\\', '/')) LIMIT 1", (norm, norm))
-    row = cur.fetchone()
+    row = find_track(cur, target, 'id, filePath, bpm, key')
     if not row:
         print('Track not found:', target)
         sys.exit(3)
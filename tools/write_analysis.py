@@ -1,33 +1,87 @@
-import sys, sqlite3, os, json
-
-if len(sys.argv) < 3:
-    print('Usage: python tools/write_analysis.py "C:\\full\\path\\to\\file.mp3" bpm [key]')
-    sys.exit(1)
-
-target = sys.argv[1]
-bpm = sys.argv[2]
-key = sys.argv[3] if len(sys.argv) > 3 else None
-
-dbpath = os.path.join(os.environ.get('APPDATA') or os.path.expanduser('~'), 'ngksplayer', 'library.db')
-if not os.path.exists(dbpath):
-    print('DB not found at', dbpath)
-    sys.exit(2)
-
-conn = sqlite3.connect(dbpath)
-cur = conn.cursor()
-
-norm = target.replace('\\\\', '\\')
-try:
-    cur.execute("SELECT id, filePath FROM tracks WHERE LOWER(REPLACE(REPLACE(filePath, '?', ''), '\\\\', '/')) = LOWER(REPLACE(?, '\\\\', '/')) OR LOWER(REPLACE(REPLACE(path, '?', ''), '\\\\', '/')) = LOWER(REPLACE(?, '\\\\', '/')) LIMIT 1", (norm, norm))
-    row = cur.fetchone()
-    if not row:
-        print('Track not found:', target)
-        sys.exit(3)
-    tid = row[0]
-    print('Found track id', tid, 'file:', row[1])
-    # update relevant columns
-    cur.execute("UPDATE tracks SET bpm=?, rawBpm=?, key=?, analyzed=1 WHERE id=?", (bpm, bpm, key, tid))
-    conn.commit()
-    print('Wrote BPM', bpm, 'key', key, 'for track id', tid)
-finally:
-    conn.close()
+import sys, os, json
+
+# Shared library helpers live with the Electron-bundled Python scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python'))
+
+from library_db import default_db_path, connect, find_track, analysis_update, DbWriter
+
+USAGE = ('Usage: python tools/write_analysis.py "C:\\full\\path\\to\\file.mp3" bpm [key]\n'
+         '       python tools/write_analysis.py --batch [dbPath] < results.jsonl\n'
+         '  (one JSON object per line: {"filePath": ..., "bpm": ..., "key": ..., ...}\n'
+         '   or {"filePath": ..., "result": <analyze_audio.py output>})')
+
+def write_batch(dbpath):
+    """All writes go through one DbWriter thread with batched commits"""
+    written = 0
+    missing = []
+    errors = []
+    futures = []
+    lookup = connect(dbpath)
+    try:
+        with DbWriter(dbpath) as writer:
+            for line in sys.stdin:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    result = entry.get('result', entry)
+                    if 'error' in result:
+                        continue
+                    row = find_track(lookup.cursor(), entry['filePath'], 'id')
+                    if not row:
+                        missing.append(entry['filePath'])
+                        continue
+                    assignments, params = analysis_update(result)
+                    futures.append((entry['filePath'],
+                                    writer.execute(f"UPDATE tracks SET {assignments} WHERE id=?", params + [row[0]])))
+                except Exception as e:
+                    errors.append({'line': line.strip()[:200], 'error': str(e)})
+            writer.flush()
+    finally:
+        lookup.close()
+    for file_path, future in futures:
+        if future.exception() is not None:
+            errors.append({'filePath': file_path, 'error': str(future.exception())})
+        else:
+            written += 1
+    print(json.dumps({'written': written, 'notFound': missing, 'errors': errors}))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == '--batch':
+        dbpath = sys.argv[2] if len(sys.argv) > 2 else default_db_path()
+        if not os.path.exists(dbpath):
+            print('DB not found at', dbpath)
+            sys.exit(2)
+        write_batch(dbpath)
+        sys.exit(0)
+
+    if len(sys.argv) < 3:
+        print(USAGE)
+        sys.exit(1)
+
+    target = sys.argv[1]
+    bpm = sys.argv[2]
+    key = sys.argv[3] if len(sys.argv) > 3 else None
+
+    dbpath = default_db_path()
+    if not os.path.exists(dbpath):
+        print('DB not found at', dbpath)
+        sys.exit(2)
+
+    conn = connect(dbpath)
+    cur = conn.cursor()
+
+    try:
+        row = find_track(cur, target)
+        if not row:
+            print('Track not found:', target)
+            sys.exit(3)
+        tid = row[0]
+        print('Found track id', tid, 'file:', row[1])
+        # update relevant columns
+        cur.execute("UPDATE tracks SET bpm=?, rawBpm=?, key=?, analyzed=1 WHERE id=?", (bpm, bpm, key, tid))
+        conn.commit()
+        print('Wrote BPM', bpm, 'key', key, 'for track id', tid)
+    finally:
+        conn.close()